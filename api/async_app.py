@@ -0,0 +1,432 @@
+import asyncio
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import jinja2
+import openai
+from aiohttp import web
+from flask.sessions import SecureCookieSession
+from itsdangerous import BadSignature
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.index import MovieRecommenderApp
+from database.user_operations import register_user, authenticate_user
+from api.async_tmdb_client import AsyncTMDBClient
+from api.fanout import fan_out_async
+from api.metadata_cache import FRESH, STALE
+from api.single_flight import AsyncSingleFlight
+from api.title_resolver import LOCAL
+from api.tmdb_client import TMDBError
+from api.upstream_guard import UpstreamUnavailable
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class AsyncMovieRecommenderApp(MovieRecommenderApp):
+    """
+    aiohttp serving mode of MovieRecommenderApp. Handlers await TMDB and
+    OpenAI on the event loop through pooled async clients, so a worker is
+    no longer limited to one upstream call per thread; recommender calls
+    and SQLite cache reads and writes run on small thread pools. Templates, caches, guards, list snapshots
+    and the Flask session cookie are shared with the threaded app.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.templates = jinja2.Environment(
+            loader=jinja2.FileSystemLoader(os.path.join(API_DIR, 'templates')),
+            autoescape=jinja2.select_autoescape(['html']),
+        )
+        # Reads and writes the same signed cookie as the Flask app
+        self.session_serializer = self.app.session_interface.get_signing_serializer(self.app)
+        self.recommender_pool = ThreadPoolExecutor(
+            max_workers=int(os.getenv("RECOMMENDER_WORKERS", "2")), thread_name_prefix='recommender'
+        )
+        # SQLite calls can wait on another worker's write lock, so they stay off the loop
+        self.cache_pool = ThreadPoolExecutor(
+            max_workers=int(os.getenv("CACHE_WORKERS", "4")), thread_name_prefix='cache'
+        )
+        self.flights = AsyncSingleFlight()
+        self.background_tasks = set()
+        self.atmdb = None
+        self.aclient = None
+
+        self.web = web.Application(middlewares=[self.session_middleware])
+        self.web.on_startup.append(self.open_clients)
+        self.web.on_cleanup.append(self.close_clients)
+        self.route_paths = {}
+        self.define_async_routes()
+
+    def define_async_routes(self):
+        routes = [
+            ('index', '/', ['GET'], self.index_async),
+            ('genre_based', '/genre_based', ['GET', 'POST'], self.genre_based_async),
+            ('mood_based', '/mood_based', ['GET', 'POST'], self.mood_based_async),
+            ('content_based', '/content_based', ['GET', 'POST'], self.content_based_async),
+            ('register', '/register', ['GET', 'POST'], self.register_async),
+            ('login', '/login', ['GET', 'POST'], self.login_async),
+            ('logout', '/logout', ['POST'], self.logout_async),
+            ('check_login', '/check_login', ['GET'], self.check_login_async),
+            ('stats', '/stats', ['GET'], self.stats_async),
+            ('top_rated_movies', '/top_rated', ['GET'], partial(self.serve_movie_list_async, name='top_rated', label='top rated')),
+            ('trending_movies', '/trending', ['GET'], partial(self.serve_movie_list_async, name='trending', label='trending')),
+            ('upcoming_movies', '/upcoming', ['GET'], partial(self.serve_movie_list_async, name='upcoming', label='upcoming')),
+        ]
+        for endpoint, path, methods, handler in routes:
+            self.route_paths[endpoint] = path
+            for method in methods:
+                self.web.router.add_route(method, path, handler)
+        self.web.router.add_static('/static', os.path.join(API_DIR, 'static'))
+
+    async def open_clients(self, app):
+        # aiohttp sessions must be created inside the running loop
+        self.atmdb = AsyncTMDBClient(
+            self.TMDB_API_KEY, base_url=self.tmdb.base_url,
+            pool_size=int(os.getenv("TMDB_MAX_CONCURRENCY", "16")) * 2, guard=self.tmdb_guard,
+        )
+        self.aclient = openai.AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"), timeout=float(os.getenv("OPENAI_TIMEOUT", "20")), max_retries=1
+        )
+        self.async_list_sources = {
+            'top_rated': lambda page: self.atmdb.movie_list('top_rated', page),
+            'trending': lambda page: self.atmdb.trending('day', page),
+            'upcoming': lambda page: self.atmdb.movie_list('upcoming', page),
+        }
+
+    async def close_clients(self, app):
+        await self.atmdb.close()
+        await self.aclient.close()
+
+    # Flask request context shims for the shared templates
+
+    @web.middleware
+    async def session_middleware(self, request, handler):
+        session = self.load_session(request)
+        request['session'] = session
+        response = await handler(request)
+        self.save_session(session, response)
+        return response
+
+    def load_session(self, request):
+        cookie = request.cookies.get(self.app.config['SESSION_COOKIE_NAME'])
+        if not cookie:
+            return SecureCookieSession()
+        try:
+            max_age = int(self.app.permanent_session_lifetime.total_seconds())
+            return SecureCookieSession(self.session_serializer.loads(cookie, max_age=max_age))
+        except BadSignature:
+            return SecureCookieSession()
+
+    def save_session(self, session, response):
+        if not session.modified:
+            return
+        name = self.app.config['SESSION_COOKIE_NAME']
+        if session:
+            response.set_cookie(name, self.session_serializer.dumps(dict(session)), httponly=True, path='/')
+        else:
+            response.del_cookie(name, path='/')
+
+    def flash(self, request, message, category='message'):
+        session = request['session']
+        session['_flashes'] = session.get('_flashes', []) + [(category, message)]
+
+    def url_for(self, endpoint, **values):
+        if endpoint == 'static':
+            return f"/static/{values['filename']}"
+        return self.route_paths[endpoint]
+
+    def render(self, request, template, **context):
+        session = request['session']
+
+        def get_flashed_messages(with_categories=False):
+            # Like Flask, the messages are popped once and repeated calls in a request see them again
+            if 'flashes' not in request:
+                request['flashes'] = session.pop('_flashes') if '_flashes' in session else []
+            flashes = request['flashes']
+            return flashes if with_categories else [message for _, message in flashes]
+
+        html = self.templates.get_template(template).render(
+            session=session, url_for=self.url_for, get_flashed_messages=get_flashed_messages, **context
+        )
+        return web.Response(text=html, content_type='text/html')
+
+    def redirect(self, endpoint):
+        return web.Response(status=302, headers={'Location': self.url_for(endpoint)})
+
+    # Upstream calls
+
+    async def run_cpu(self, fn, *args, **kwargs):
+        """Run a recommender call on the recommender pool so it does not stall the event loop."""
+        return await asyncio.get_running_loop().run_in_executor(self.recommender_pool, lambda: fn(*args, **kwargs))
+
+    async def run_io(self, fn, *args, **kwargs):
+        """Run a blocking SQLite cache call on the cache pool so it does not stall the event loop."""
+        return await asyncio.get_running_loop().run_in_executor(self.cache_pool, lambda: fn(*args, **kwargs))
+
+    def background(self, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_done)
+
+    def background_done(self, task):
+        self.background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.warning(f"Background refresh failed, serving the stale entry: {task.exception()}")
+
+    async def cached(self, key, fetch):
+        """
+        MetadataCache.get_or_fetch for coroutine fetches. Misses are coalesced
+        on the loop; stale entries are returned and refreshed in a background task.
+        """
+        state, value = await self.run_io(self.metadata_cache.lookup, key)
+        self.metadata_cache.count(state)
+        if state == FRESH:
+            return value
+
+        async def load():
+            value = await fetch()
+            await self.run_io(self.metadata_cache.set, key, value)
+            return value
+
+        if state == STALE:
+            self.background(self.flights.do(f'cache:{key}', load))
+            return value
+        return await self.flights.do(f'cache:{key}', load)
+
+    async def movie_summary_async(self, movie_id):
+        async def fetch():
+            return self.summarize_details(await self.atmdb.movie_details(movie_id, append=('credits', 'videos')))
+
+        return await self.cached(f'details:{movie_id}', fetch)
+
+    async def complete_local_record_async(self, record):
+        if not self.local_metadata.missing_fields(record):
+            return record
+        try:
+            summary = await self.movie_summary_async(record['id'])
+        except TMDBError as e:
+            logging.warning(f"Could not complete local details for '{record['title']}': {e}")
+            return record
+        return self.local_metadata.update(record['id'], self.remote_fields(record, summary))
+
+    async def get_movie_details_async(self, movie_id):
+        record = self.local_metadata.get(movie_id)
+        if record is not None:
+            record = await self.complete_local_record_async(record)
+            return record['runtime'], record['director'] or "Unknown", record['trailer_link']
+        try:
+            summary = await self.movie_summary_async(movie_id)
+        except TMDBError as e:
+            logging.warning(f"Could not fetch details for movie {movie_id}: {e}")
+            return None, "Unknown", None
+        return summary['runtime'], summary['director'] or "Unknown", summary['trailer_link']
+
+    async def get_movie_details_by_title_async(self, movie_title, year=None):
+        async def fetch():
+            return self.summarize_search(await self.atmdb.search_movie(movie_title, year=year))
+
+        try:
+            return await self.cached(self.search_cache_key(movie_title, year), fetch)
+        except TMDBError as e:
+            logging.warning(f"TMDB search for '{movie_title}' failed: {e}")
+            return None
+
+    async def get_recommended_titles_async(self, kind, category, number):
+        """get_recommended_titles for the event loop; extra completions are always generated in the background."""
+        key = self.title_cache_key(kind, category)
+        prompt_for = self.title_prompts[kind]
+
+        async def generate(served=True):
+            n_titles = self.llm_cache.generate_number(number)
+            titles = await self.request_movie_titles_async(n_titles, prompt_for(n_titles, category))
+            return (await self.run_io(self.llm_cache.add, key, titles, served))[:number]
+
+        try:
+            titles, wants_more = await self.run_io(self.llm_cache.pick, key, number)
+            if titles is None:
+                self.llm_cache.count('misses')
+                return await self.flights.do(f'llm:{key}:{number}', generate)
+            self.llm_cache.count('hits')
+            if wants_more:
+                self.background(self.flights.do(f'llm:{key}:{number}', lambda: generate(served=False)))
+            return titles
+        except (UpstreamUnavailable, openai.OpenAIError) as e:
+            logging.warning(f"Chat model unavailable, serving catalog titles instead: {e}")
+            return await self.run_cpu(self.catalog_titles, number, category if kind == 'genre' else None)
+
+    async def request_movie_titles_async(self, number, prompt_content):
+        response = await self.openai_guard.call_async(
+            lambda: self.aclient.chat.completions.create(**self.chat_request(prompt_content))
+        )
+        return self.completion_titles(response.choices[0])[:number]
+
+    async def fetch_movie_details_async(self, title):
+        resolution = self.title_resolver.resolve_local(title)
+        if resolution.source == LOCAL:
+            return self.local_movie_detail(await self.complete_local_record_async(resolution.record))
+        match = await self.get_movie_details_by_title_async(resolution.title, resolution.year)
+        movie_info = self.title_resolver.resolve_remote(resolution, match).record
+        if not movie_info:
+            return None
+        try:
+            summary = await self.movie_summary_async(movie_info.get('id'))
+        except TMDBError as e:
+            logging.warning(f"Error getting additional details for '{title}': {e}")
+            summary = None
+        return self.remote_movie_detail(movie_info, summary)
+
+    async def fetch_movies_details_async(self, titles):
+        details = await fan_out_async(self.fetch_movie_details_async, titles, timeout=self.detail_deadline)
+        return [detail for detail in details if detail]
+
+    async def list_movie_details_async(self, movies):
+        movie_ids = list(dict.fromkeys(movie['id'] for movie in movies))
+        extras = await fan_out_async(self.get_movie_details_async, movie_ids, timeout=self.detail_deadline)
+        return self.movie_cards(movies, dict(zip(movie_ids, extras)))
+
+    # Handlers
+
+    async def index_async(self, request):
+        return self.render(request, 'index.html', recommendation_type=request.query.get('type'),
+                           username=request['session'].get('username'))
+
+    async def genre_based_async(self, request):
+        username = request['session'].get('username')
+        if request.method == "POST":
+            form = await request.post()
+            category = form["category"]
+            number = int(form["number"])
+            movie_titles = await self.get_recommended_titles_async('genre', category, number)
+            movie_details = await self.fetch_movies_details_async(movie_titles)
+            return self.render(request, "index.html", movies=movie_details, username=username, recommendation_type='genre_based')
+        return self.render(request, "index.html", movies=None, username=username, recommendation_type="genre_based")
+
+    async def mood_based_async(self, request):
+        username = request['session'].get('username')
+        if request.method == "POST":
+            form = await request.post()
+            mood = form["mood"]
+            number = int(form["number"])
+            movie_titles = await self.get_recommended_titles_async('mood', mood, number)
+            movie_details = await self.fetch_movies_details_async(movie_titles)
+            return self.render(request, "index.html", movies=movie_details, username=username, recommendation_type="mood_based")
+        return self.render(request, "index.html", movies=None, username=username)
+
+    async def content_based_async(self, request):
+        username = request['session'].get('username')
+        if request.method != 'POST':
+            return self.render(request, 'index.html', username=username, recommendation_type="content_based")
+
+        form = await request.post()
+        movie = form['movie']
+        number = int(form['number'])
+        try:
+            filters = self.parse_filters(form)
+            recommended_titles = await self.run_cpu(self.recommender.resolve_and_recommend, movie, number, filters=filters)
+            if recommended_titles is None:
+                error_message = f"Sorry, '{movie}' is not in our database. Please try another movie."
+                suggestions = await self.run_cpu(self.recommender.suggest_titles, movie)
+                if suggestions:
+                    error_message += f" Did you mean: {', '.join(suggestions)}?"
+                return self.render(request, 'index.html', recommendation_type='content_based', error_message=error_message, username=username)
+            movie_details = await self.fetch_movies_details_async(recommended_titles)
+            return self.render(request, 'index.html', recommendation_type='content_based', movies=movie_details, username=username)
+        except Exception as e:
+            logging.warning(f"Content-based recommendations for '{movie}' failed: {e}")
+            return self.render(request, 'index.html', recommendation_type='content_based', username=username)
+
+    async def serve_movie_list_async(self, request, name, label):
+        try:
+            page = int(request.query.get('page', 1))
+        except ValueError:
+            page = 1
+        username = request['session'].get('username')
+        cached = self.list_snapshots.get(name, page)
+        if cached is not None:
+            movie_details, refreshed_at = list(cached[0]), cached[1]
+        else:
+            async def fetch():
+                return await self.list_movie_details_async(await self.async_list_sources[name](page))
+
+            try:
+                movie_details = await self.flights.do(f'list:{name}:{page}', fetch)
+            except TMDBError as e:
+                logging.warning(f"Error fetching {label} movies: {e}")
+                self.flash(request, f'Error fetching {label} movies', 'error')
+                return self.render(request, 'index.html', username=username)
+            refreshed_at = time.time()
+
+        if request.headers.get('Accept') == 'application/json':
+            return web.json_response({'movies': movie_details, 'refreshed_at': refreshed_at})
+        return self.render(request, 'index.html', movies=movie_details, recommendation_type=name,
+                           username=username, refreshed_at=refreshed_at)
+
+    async def stats_async(self, request):
+        stats = await self.run_io(self.upstream_stats)
+        return web.json_response({**stats, 'async_single_flight': self.flights.stats()})
+
+    # Account routes; the database calls are blocking and run on the loop's default executor
+
+    async def register_async(self, request):
+        if request.method != 'POST':
+            return self.redirect('index')
+        form = await request.post()
+        username = form.get('username')
+        email = form.get('email')
+        password = form.get('password')
+        if not username or not email or not password:
+            self.flash(request, 'All fields are required', 'error')
+            return self.render(request, 'index.html', show_register_modal=True)
+
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(None, register_user, username, email, password)
+        if result != "User registered successfully":
+            self.flash(request, result, 'register_error')
+            return self.render(request, 'index.html', show_register_modal=True, reg_username=username, reg_email=email)
+        user = await loop.run_in_executor(None, authenticate_user, username, password)
+        if user:
+            request['session']['user_id'] = user['id']
+            request['session']['username'] = user['username']
+            self.flash(request, 'Registration successful! Welcome to Movie Recommender!', 'success')
+        return self.redirect('index')
+
+    async def login_async(self, request):
+        if request.method != 'POST':
+            return self.redirect('index')
+        form = await request.post()
+        username = form.get('username')
+        password = form.get('password')
+        if not username or not password:
+            self.flash(request, 'Missing username or password', 'error')
+            return self.render(request, 'index.html', show_login_modal=True)
+
+        user = await asyncio.get_running_loop().run_in_executor(None, authenticate_user, username, password)
+        if not user:
+            self.flash(request, 'Invalid username or password', 'login_error')
+            return self.render(request, 'index.html', show_login_modal=True, login_username=username)
+        request['session']['user_id'] = user['id']
+        request['session']['username'] = user['username']
+        self.flash(request, 'Login successful!', 'success')
+        return self.redirect('index')
+
+    async def logout_async(self, request):
+        request['session'].clear()
+        return self.redirect('index')
+
+    async def check_login_async(self, request):
+        session = request['session']
+        if 'user_id' in session:
+            return web.json_response({"logged_in": True, "user_id": session['user_id']})
+        return web.json_response({"logged_in": False})
+
+    def run(self, host="0.0.0.0", port=8080, debug=False):
+        web.run_app(self.web, host=host, port=port)
+
+
+if __name__ == '__main__':
+    AsyncMovieRecommenderApp().run()
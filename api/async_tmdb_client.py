@@ -0,0 +1,92 @@
+import asyncio
+import logging
+
+import aiohttp
+
+from api.tmdb_client import TMDB_API_URL, TMDBError, retry_delay, status_error
+from api.upstream_guard import UpstreamUnavailable
+
+
+class AsyncTMDBClient:
+    """
+    TMDBClient for an event loop: one aiohttp session whose connector keeps
+    up to pool_size keep-alive connections, with the same retry, backoff and
+    admission rules as the threaded client: each attempt is admitted through
+    the guard on its own. Create it inside the running loop.
+    """
+
+    def __init__(self, api_key, base_url=TMDB_API_URL, pool_size=64, connect_timeout=3.05, read_timeout=10,
+                 retries=3, backoff_factor=0.5, backoff_max=2, guard=None):
+        """
+        :param api_key: TMDB v3 API key
+        :param base_url: API root, overridable for tests
+        :param pool_size: Connections open at once across all requests
+        :param connect_timeout: Seconds to establish a connection
+        :param read_timeout: Seconds to wait for response data
+        :param retries: Retries per request after the first attempt
+        :param backoff_factor: Base of the exponential backoff between retries, in seconds
+        :param backoff_max: Longest single backoff sleep, in seconds
+        :param guard: Optional UpstreamGuard every request is admitted through
+        """
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.guard = guard
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=pool_size, limit_per_host=pool_size),
+            timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout),
+        )
+
+    async def get(self, path, **params):
+        """
+        GET an API path and decode the JSON body.
+        :param path: Path below the API root, e.g. 'movie/603'
+        :param params: Query parameters
+        :return: Decoded JSON
+        """
+        params = {'api_key': self.api_key, **{key: str(value) for key, value in params.items()}}
+        for attempt in range(self.retries + 1):
+            try:
+                return await self._admitted_get(path, params)
+            except TMDBError as e:
+                if not e.retryable or attempt == self.retries:
+                    raise
+                delay = retry_delay(e, attempt, self.backoff_factor, self.backoff_max)
+                logging.debug(f"Retrying {path} in {delay}s: {e}")
+            await asyncio.sleep(delay)
+
+    async def _admitted_get(self, path, params):
+        if self.guard is None:
+            return await self._get(path, params)
+        try:
+            return await self.guard.call_async(lambda: self._get(path, params))
+        except UpstreamUnavailable as e:
+            raise TMDBError(str(e)) from e
+
+    async def _get(self, path, params):
+        try:
+            async with self.session.get(f'{self.base_url}/{path.lstrip("/")}', params=params) as response:
+                if response.status == 200:
+                    return await response.json()
+                raise status_error(path, response.status, response.headers.get('Retry-After'))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise TMDBError(f"TMDB request for {path} failed: {e!r}", retryable=True) from e
+
+    async def search_movie(self, query, page=1, year=None):
+        params = {'year': year} if year else {}
+        return (await self.get('search/movie', query=query, page=page, **params)).get('results', [])
+
+    async def movie_details(self, movie_id, append=()):
+        params = {'append_to_response': ','.join(append)} if append else {}
+        return await self.get(f'movie/{movie_id}', **params)
+
+    async def movie_list(self, name, page=1, language='en-US'):
+        return (await self.get(f'movie/{name}', language=language, page=page)).get('results', [])
+
+    async def trending(self, window='day', page=1, language='en-US'):
+        return (await self.get(f'trending/movie/{window}', language=language, page=page)).get('results', [])
+
+    async def close(self):
+        await self.session.close()
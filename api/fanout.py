@@ -0,0 +1,65 @@
+import asyncio
+import logging
+from concurrent.futures import wait
+
+
+def fan_out(executor, fn, keys, timeout=None):
+    """
+    Run fn once per distinct key on an executor and collect the results in key order.
+    Keys that fail or are still running when the deadline passes map to None.
+    :param executor: concurrent.futures executor bounding the concurrency
+    :param fn: Callable taking one key
+    :param keys: Keys in the order results should be returned, duplicates allowed
+    :param timeout: Seconds until the deadline, None waits for everything
+    :return: List with one result (or None) per key
+    """
+    futures = {}
+    for key in keys:
+        if key not in futures:
+            futures[key] = executor.submit(fn, key)
+    wait(futures.values(), timeout=timeout)
+
+    results = {}
+    for key, future in futures.items():
+        if not future.done():
+            # Queued lookups are dropped; running ones finish in the background
+            future.cancel()
+            logging.warning(f"Dropping '{key}': no result before the deadline")
+            results[key] = None
+        elif future.exception() is not None:
+            logging.warning(f"Lookup for '{key}' failed: {future.exception()}")
+            results[key] = None
+        else:
+            results[key] = future.result()
+    return [results[key] for key in keys]
+
+
+async def fan_out_async(fn, keys, timeout=None):
+    """
+    fan_out() for coroutines: await fn once per distinct key concurrently.
+    Keys that fail or are still pending when the deadline passes map to None.
+    :param fn: Coroutine function taking one key
+    :param keys: Keys in the order results should be returned, duplicates allowed
+    :param timeout: Seconds until the deadline, None waits for everything
+    :return: List with one result (or None) per key
+    """
+    tasks = {}
+    for key in keys:
+        if key not in tasks:
+            tasks[key] = asyncio.ensure_future(fn(key))
+    if not tasks:
+        return []
+    await asyncio.wait(tasks.values(), timeout=timeout)
+
+    results = {}
+    for key, task in tasks.items():
+        if not task.done():
+            task.cancel()
+            logging.warning(f"Dropping '{key}': no result before the deadline")
+            results[key] = None
+        elif task.exception() is not None:
+            logging.warning(f"Lookup for '{key}' failed: {task.exception()}")
+            results[key] = None
+        else:
+            results[key] = task.result()
+    return [results[key] for key in keys]
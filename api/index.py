@@ -1,11 +1,14 @@
 import os
 import sys
-import requests
-from flask import Flask, request, render_template, redirect, url_for, flash, jsonify, session
-from flask_caching import Cache
+from flask import Flask, Response, request, render_template, redirect, url_for, flash, jsonify, session
 from dotenv import load_dotenv
+import json
 import logging
+import queue
+import threading
+import time
 import openai
+from concurrent.futures import ThreadPoolExecutor
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -15,6 +18,18 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from database.user_operations import register_user, authenticate_user
 from src.content_recommender import ContentRecommender
+from src.model_artifact import ArtifactMismatchError
+from src.live_recommender import LiveRecommender
+from src.title_index import normalize_title
+from api.fanout import fan_out
+from api.tmdb_client import TMDB_API_URL, TMDBClient, TMDBError, director, is_upstream_failure, trailer_link
+from api.metadata_cache import MetadataCache
+from api.llm_cache import LLMResponseCache
+from api.local_metadata import LocalMetadataStore
+from api.title_resolver import LOCAL, REMOTE, TitleResolver
+from api.list_snapshots import ListSnapshots
+from api.single_flight import SingleFlight
+from api.upstream_guard import UpstreamGuard, UpstreamUnavailable
 
 
 class MovieRecommenderApp:
@@ -24,15 +39,58 @@ class MovieRecommenderApp:
         # Initialize Flask app
         self.app = Flask(__name__)
         self.app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'your_fallback_secret_key_here')
-        self.app.config['CACHE_TYPE'] = 'SimpleCache'
-        self.cache = Cache(self.app)
 
-        self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        # Process-wide admission control per upstream: rate limit, concurrency cap and circuit breaker
+        self.tmdb_guard = UpstreamGuard(
+            'tmdb', rate=float(os.getenv("TMDB_RATE_LIMIT", "35")), burst=40,
+            max_concurrency=int(os.getenv("TMDB_MAX_CONCURRENCY", "16")), is_failure=is_upstream_failure,
+        )
+        self.openai_guard = UpstreamGuard(
+            'openai', rate=float(os.getenv("OPENAI_RATE_LIMIT", "5")), burst=10,
+            max_concurrency=int(os.getenv("OPENAI_MAX_CONCURRENCY", "8")),
+            is_failure=lambda e: not isinstance(e, openai.BadRequestError),
+        )
+
+        self.openai_timeout = float(os.getenv("OPENAI_TIMEOUT", "20"))
+        self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=self.openai_timeout, max_retries=1)
         self.TMDB_API_KEY = os.getenv("TMDB_API_KEY")
-        csv_path = os.path.join(
-            os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'filtered_movies_data.csv'
+        self.tmdb = TMDBClient(
+            self.TMDB_API_KEY, base_url=os.getenv("TMDB_API_URL", TMDB_API_URL),
+            pool_size=int(os.getenv("TMDB_LOOKUP_WORKERS", "8")) * 2, guard=self.tmdb_guard,
+        )
+        data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+        # Identical concurrent upstream calls share one request; SINGLE_FLIGHT_LOCKS extends this across workers
+        self.single_flight = SingleFlight(lock_dir=os.getenv("SINGLE_FLIGHT_LOCKS") or None)
+        # TMDB metadata shared by all workers on the host
+        self.metadata_cache = MetadataCache(
+            os.getenv("METADATA_CACHE", os.path.join(data_dir, 'metadata_cache.sqlite')),
+            max_entries=int(os.getenv("METADATA_CACHE_ENTRIES", "20000")),
+            single_flight=self.single_flight,
+        )
+        # Chat model title lists per genre or mood, shared by all workers and kept across restarts
+        self.llm_cache = LLMResponseCache(
+            os.getenv("LLM_CACHE", os.path.join(data_dir, 'llm_cache.sqlite')),
+            samples_per_key=int(os.getenv("LLM_CACHE_SAMPLES", "3")),
+            ttl=float(os.getenv("LLM_CACHE_TTL", str(7 * 86400))),
+            background_refresh=os.getenv("LLM_CACHE_BACKGROUND_REFRESH", "0") == "1",
+            single_flight=self.single_flight,
+        )
+        self.title_prompts = {'genre': self.generate_genre_based_prompt, 'mood': self.generate_mood_based_prompt}
+        catalog_path = os.path.join(data_dir, 'filtered_movies_data.parquet')
+        if not os.path.exists(catalog_path):
+            catalog_path = os.path.join(data_dir, 'filtered_movies_data.csv')
+        artifact_dir = os.getenv("RECOMMENDER_ARTIFACT", os.path.join(data_dir, 'recommender_artifact'))
+        self.recommender = LiveRecommender(self.load_recommender(catalog_path, artifact_dir))
+        # Details of catalog movies are answered locally; TMDB only fills in posters, trailers and runtimes
+        self.local_metadata = LocalMetadataStore.from_files(catalog_path, os.path.join(data_dir, 'tmdb_5000_movies.csv'))
+        # Titles suggested by the chat model are matched against the catalog before any TMDB search
+        self.title_resolver = TitleResolver(self.local_metadata)
+
+        # Bounded pool for per-title TMDB lookups, and the time a page waits for them
+        self.detail_pool = ThreadPoolExecutor(
+            max_workers=int(os.getenv("TMDB_LOOKUP_WORKERS", "8")), thread_name_prefix='tmdb-lookup'
         )
-        self.recommender = ContentRecommender(csv_path)
+        self.detail_deadline = float(os.getenv("TMDB_LOOKUP_DEADLINE", "5"))
 
         # Map genres
         self.genre_map = {
@@ -57,9 +115,33 @@ class MovieRecommenderApp:
             37: "Western"
         }
 
+        # List pages are served from snapshots refreshed in the background; an interval of 0 disables it
+        snapshot_interval = float(os.getenv("LIST_SNAPSHOT_INTERVAL", "900"))
+        self.list_sources = {
+            'top_rated': lambda page: self.tmdb.movie_list('top_rated', page),
+            'trending': lambda page: self.tmdb.trending('day', page),
+            'upcoming': lambda page: self.tmdb.movie_list('upcoming', page),
+        }
+        self.list_snapshots = ListSnapshots(
+            self.list_sources, self.list_movie_details,
+            n_pages=int(os.getenv("LIST_SNAPSHOT_PAGES", "3")),
+            interval=snapshot_interval,
+        )
+        if snapshot_interval > 0:
+            self.list_snapshots.start()
+
         # Define routes
         self.define_routes()
 
+    def load_recommender(self, catalog_path, artifact_dir):
+        """Opens the prebuilt recommender artifact, falling back to fitting from the catalog."""
+        if os.path.isdir(artifact_dir):
+            try:
+                return ContentRecommender.from_artifact(artifact_dir, catalog_path)
+            except (ArtifactMismatchError, OSError) as e:
+                logging.warning(f"Ignoring recommender artifact {artifact_dir}: {e}")
+        return ContentRecommender(catalog_path)
+
     def define_routes(self):
         app = self.app  # To access app within nested functions
 
@@ -81,6 +163,10 @@ class MovieRecommenderApp:
         def content_based():
             return self.content_based()
 
+        @app.route('/stream_recommendations', methods=['GET'])
+        def stream_recommendations():
+            return self.stream_recommendations()
+
         @app.route('/register', methods=['GET', 'POST'])
         def register():
             return self.register()
@@ -97,6 +183,10 @@ class MovieRecommenderApp:
         def check_login():
             return self.check_login()
 
+        @app.route('/stats', methods=['GET'])
+        def stats():
+            return jsonify(self.upstream_stats())
+
         @app.route('/top_rated', methods=['GET'])
         def top_rated_movies():
             return self.top_rated_movies()
@@ -107,68 +197,92 @@ class MovieRecommenderApp:
 
         @app.route('/upcoming', methods=['GET'])
         def upcoming_movies():
-            return self.trending_movies()
+            return self.upcoming_movies()
         
+    def movie_summary(self, movie_id):
+        """Runtime, genres, director and trailers of a movie, from the metadata cache or one TMDB request."""
+        def fetch():
+            # Credits and videos come back with the details in a single request
+            return self.summarize_details(self.tmdb.movie_details(movie_id, append=('credits', 'videos')))
+
+        return self.metadata_cache.get_or_fetch(f'details:{movie_id}', fetch)
+
+    def summarize_details(self, details):
+        """The cached part of a TMDB details response with appended credits and videos."""
+        return {
+            'runtime': details.get('runtime'),
+            'poster_path': f"https://image.tmdb.org/t/p/w500{details['poster_path']}" if details.get('poster_path') else None,
+            'genres': [genre['name'] for genre in details.get('genres', [])],
+            'director': director(details),
+            'trailer_link': trailer_link(details),
+            'any_trailer_link': trailer_link(details, youtube_only=False),
+        }
+
     def get_movie_details(self, movie_id):
         """Fetches additional details like runtime, director, and trailer for a given movie ID."""
-        @self.cache.memoize(timeout=3600)
-        def fetch_details(movie_id):
-            details_url = f"https://api.themoviedb.org/3/movie/{movie_id}?api_key={self.TMDB_API_KEY}"
-            details_response = requests.get(details_url)
-            runtime = None
-            director = "Unknown"
-            trailer_link = None
-            
-            if details_response.status_code == 200:
-                movie_details = details_response.json()
-                
-                # Extract runtime
-                runtime = movie_details.get('runtime')
-                
-                # Get the director's name from the credits endpoint
-                credits_url = f"https://api.themoviedb.org/3/movie/{movie_id}/credits?api_key={self.TMDB_API_KEY}"
-                credits_response = requests.get(credits_url)
-                if credits_response.status_code == 200:
-                    crew = credits_response.json().get('crew', [])
-                    for member in crew:
-                        if member['job'] == 'Director':
-                            director = member['name']
-                            break
-
-                # Get trailer link from the videos endpoint
-                videos_url = f"https://api.themoviedb.org/3/movie/{movie_id}/videos?api_key={self.TMDB_API_KEY}"
-                videos_response = requests.get(videos_url)
-                if videos_response.status_code == 200:
-                    videos = videos_response.json().get('results', [])
-                    for video in videos:
-                        if video['type'] == 'Trailer' and video['site'] == 'YouTube':
-                            trailer_link = f"https://www.youtube.com/watch?v={video['key']}"
-                            break
-
-            return runtime, director, trailer_link
-
-        return fetch_details(movie_id)
+        record = self.local_metadata.get(movie_id)
+        if record is not None:
+            record = self.complete_local_record(record)
+            return record['runtime'], record['director'] or "Unknown", record['trailer_link']
+        try:
+            summary = self.movie_summary(movie_id)
+        except TMDBError as e:
+            logging.warning(f"Could not fetch details for movie {movie_id}: {e}")
+            return None, "Unknown", None
+        return summary['runtime'], summary['director'] or "Unknown", summary['trailer_link']
+
+    def complete_local_record(self, record):
+        """Fills the fields the local data lacks from TMDB once, writing them back to the local store."""
+        if not self.local_metadata.missing_fields(record):
+            return record
+        try:
+            summary = self.movie_summary(record['id'])
+        except TMDBError as e:
+            logging.warning(f"Could not complete local details for '{record['title']}': {e}")
+            return record
+        return self.local_metadata.update(record['id'], self.remote_fields(record, summary))
+
+    def remote_fields(self, record, summary):
+        """Fields of a local record taken from a TMDB movie summary."""
+        return {
+            'poster_path': summary.get('poster_path'),
+            'trailer_link': summary['trailer_link'] or summary['any_trailer_link'],
+            'runtime': summary['runtime'],
+            'director': record['director'] or summary['director'],
+        }
 
 
     """This function fetches the details of a movie by its title using the TMDb API."""
-    def get_movie_details_by_title(self, movie_title):
-        search_url = f"https://api.themoviedb.org/3/search/movie?api_key={self.TMDB_API_KEY}&query={movie_title}"
-        response = requests.get(search_url)
-        if response.status_code == 200:
-            results = response.json().get('results', [])
-            if results:
-                movie = results[0]  # Get the first result
-                return {
-                    'id': movie['id'],
-                    'title': movie['title'],
-                    'overview': movie['overview'],
-                    'release_date': movie['release_date'],
-                    'vote_average': movie['vote_average'],
-                    'poster_path': f"https://image.tmdb.org/t/p/w500{movie['poster_path']}" if movie['poster_path'] else None
-                }
-        return None
+    def get_movie_details_by_title(self, movie_title, year=None):
+        def fetch():
+            return self.summarize_search(self.tmdb.search_movie(movie_title, year=year))
+
+        try:
+            # Titles TMDB does not know are cached too, as None
+            return self.metadata_cache.get_or_fetch(self.search_cache_key(movie_title, year), fetch)
+        except TMDBError as e:
+            logging.warning(f"TMDB search for '{movie_title}' failed: {e}")
+            return None
 
 
+    def search_cache_key(self, movie_title, year=None):
+        key = f'search:{normalize_title(movie_title)}'
+        return key if year is None else f'{key}:{year}'
+
+    def summarize_search(self, results):
+        """The cached part of a TMDB search response: its best match, or None."""
+        if not results:
+            return None
+        movie = results[0]  # Get the first result
+        return {
+            'id': movie['id'],
+            'title': movie['title'],
+            'overview': movie['overview'],
+            'release_date': movie.get('release_date'),
+            'vote_average': movie['vote_average'],
+            'poster_path': f"https://image.tmdb.org/t/p/w500{movie['poster_path']}" if movie.get('poster_path') else None
+        }
+
     """This function generates a prompt for the user to recommend movies based on a genre."""
     def generate_genre_based_prompt(self,number, category):
         return f"""Recommend the best {number} {category.capitalize()} movies to watch. List only the titles, one per line:"""
@@ -177,12 +291,113 @@ class MovieRecommenderApp:
     def generate_mood_based_prompt(self,number, category):
         return f"""Recommend the best {number} movies to watch. If a person is feeling {category.capitalize()}"""
 
-    """This function fetches a list of movie titles from a prompt."""
-    def get_movie_titles_from_prompt(self, number, prompt_content):
+    def get_recommended_titles(self, kind, category, number):
+        """
+        Titles for a genre or mood page from the LLM response cache, asking
+        the chat model only when the cache wants another completion. While
+        the chat model is unavailable, popular catalog titles are returned.
+        :param kind: 'genre' or 'mood'
+        :param category: Genre or mood as entered
+        :param number: Titles wanted
+        """
+        prompt_for = self.title_prompts[kind]
+        try:
+            return self.llm_cache.get_or_generate(
+                self.title_cache_key(kind, category), number,
+                lambda n_titles: self.request_movie_titles(n_titles, prompt_for(n_titles, category)),
+            )
+        except (UpstreamUnavailable, openai.OpenAIError) as e:
+            logging.warning(f"Chat model unavailable, serving catalog titles instead: {e}")
+            return self.catalog_titles(number, category if kind == 'genre' else None)
+
+    def title_cache_key(self, kind, category):
+        # The prompt templates are part of the key, so rewording a prompt starts a new cache
+        request = self.chat_request(self.title_prompts[kind]('{number}', '{category}'))
+        return self.llm_cache.key(kind, category, request)
+
+    def stream_movie_titles(self, kind, category, number):
+        """
+        Yields up to number titles for a genre or mood page as soon as each
+        is known: all at once from the LLM response cache, otherwise line by
+        line from a streamed chat completion, which is cached once complete.
         """
-        Get a list of movie titles from a prompt.
+        key = self.title_cache_key(kind, category)
+        titles, _ = self.llm_cache.pick(key, number)
+        if titles is not None:
+            self.llm_cache.count('hits')
+            yield from titles
+            return
+        self.llm_cache.count('misses')
+
+        n_titles = self.llm_cache.generate_number(number)
+        request_args = self.chat_request(self.title_prompts[kind](n_titles, category))
+        try:
+            # The guard admits opening the stream; reading it is not counted against the concurrency cap
+            stream = self.openai_guard.call(lambda: self.client.chat.completions.create(**request_args, stream=True))
+        except (UpstreamUnavailable, openai.OpenAIError) as e:
+            logging.warning(f"Chat model unavailable, serving catalog titles instead: {e}")
+            yield from self.catalog_titles(number, category if kind == 'genre' else None)
+            return
+
+        titles = []
+        try:
+            for title in self.completion_lines(stream):
+                if len(titles) < number:
+                    yield title
+                titles.append(title)
+                if len(titles) == n_titles:
+                    break
+        except openai.OpenAIError as e:
+            logging.warning(f"Chat completion stream for '{category}' broke off after {len(titles)} titles: {e}")
+            return
+        finally:
+            stream.close()
+        self.llm_cache.add(key, titles, served=True)
+
+    def completion_lines(self, stream):
+        """
+        Non-empty lines of a streamed chat completion, each yielded as soon as
+        its newline arrives. A last line cut off by max_tokens is dropped.
         """
-        response = self.client.chat.completions.create(
+        buffer = ''
+        finish_reason = None
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            buffer += chunk.choices[0].delta.content or ''
+            finish_reason = chunk.choices[0].finish_reason or finish_reason
+            *lines, buffer = buffer.split('\n')
+            for line in lines:
+                if line.strip():
+                    yield line.strip()
+        if buffer.strip() and finish_reason != 'length':
+            yield buffer.strip()
+
+    def catalog_titles(self, number, genre=None):
+        """Most popular catalog titles, optionally of one genre."""
+        recommender = self.recommender.recommender
+        mask = recommender.active.copy()
+        if genre and genre.lower() in recommender.attribute_index.genre_bits:
+            mask &= recommender.attribute_index.mask(genres=[genre])
+        return recommender.movies_df[mask].nlargest(number, 'popularity')['title'].tolist()
+
+    def request_movie_titles(self, number, prompt_content):
+        """Asks the chat model for movie titles; callers go through the LLM response cache."""
+        response = self.openai_guard.call(
+            lambda: self.client.chat.completions.create(**self.chat_request(prompt_content))
+        )
+        return self.completion_titles(response.choices[0])[:number]
+
+    def completion_titles(self, choice):
+        """Non-empty lines of a chat completion choice, without a last line cut off by max_tokens."""
+        lines = (choice.message.content or '').split('\n')
+        if choice.finish_reason == 'length':
+            lines = lines[:-1]
+        return [line.strip() for line in lines if line.strip()]
+
+    def chat_request(self, prompt_content):
+        """Chat completion arguments asking for movie titles, one per line."""
+        return dict(
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": "You are a helpful assistant that recommends movies. Respond only with the titles of the movies, one per line."},
@@ -194,20 +409,44 @@ class MovieRecommenderApp:
             frequency_penalty=0,
             presence_penalty=0
         )
-        
-        movie_titles = response.choices[0].message.content.strip().split('\n')
-        return movie_titles[:number]
 
     """This function fetches detailed information for a movie by title from TMDb."""
     def fetch_movie_details(self, title):
         """
-        Fetches detailed information for a movie by title from TMDb.
+        Fetches detailed information for a movie by title, from the local
+        catalog when it has the movie and from TMDb otherwise.
         """
-        movie_info = self.get_movie_details_by_title(title)
+        resolution = self.title_resolver.resolve(title, search=self.get_movie_details_by_title)
+        if resolution.source == LOCAL:
+            return self.local_movie_detail(self.complete_local_record(resolution.record))
+        movie_info = resolution.record
         if not movie_info:
             return None
-        
-        movie_id = movie_info.get('id')
+
+        # Fetch additional details using TMDb API
+        try:
+            summary = self.movie_summary(movie_info.get('id'))
+        except TMDBError as e:
+            logging.warning(f"Error getting additional details for '{title}': {e}")
+            summary = None
+        return self.remote_movie_detail(movie_info, summary)
+
+    def local_movie_detail(self, record):
+        return {
+            'title': record['title'],
+            'overview': record['overview'],
+            'release_date': record['release_date'],
+            'vote_average': record['vote_average'],
+            'poster_path': record['poster_path'],
+            'genre': record['genre'],
+            'runtime': record['runtime'] or 'N/A',
+            'director': record['director'] or 'N/A',
+            'trailer_link': record['trailer_link'],
+            'source': LOCAL,
+        }
+
+    def remote_movie_detail(self, movie_info, summary=None):
+        """Movie detail from a TMDB search match, extended with its details summary when there is one."""
         movie_detail = {
             'title': movie_info['title'],
             'overview': movie_info['overview'],
@@ -217,40 +456,32 @@ class MovieRecommenderApp:
             'genre': [],
             'runtime': 'N/A',
             'director': 'N/A',
-            'trailer_link': None
+            'trailer_link': None,
+            'source': REMOTE,
         }
-        
-        # Fetch additional details using TMDb API
-        try:
-            details_url = f"https://api.themoviedb.org/3/movie/{movie_id}?api_key={self.TMDB_API_KEY}&append_to_response=credits,videos"
-            details_response = requests.get(details_url)
-            if details_response.status_code == 200:
-                movie_details_data = details_response.json()
-                
-                # Update movie details with extended information
-                movie_detail.update({
-                    'genre': [genre['name'] for genre in movie_details_data.get('genres', [])],
-                    'runtime': movie_details_data.get('runtime', 'N/A'),
-                    'director': next((crew['name'] for crew in movie_details_data.get('credits', {}).get('crew', []) 
-                                    if crew['job'] == 'Director'), 'N/A'),
-                    'trailer_link': next((f"https://www.youtube.com/watch?v={video['key']}" 
-                                        for video in movie_details_data.get('videos', {}).get('results', [])
-                                        if video['type'] == 'Trailer'), None)
-                })
-        except Exception as e:
-            print(f"Error getting additional details for '{title}': {e}")
-
+        if summary is not None:
+            movie_detail.update({
+                'genre': summary['genres'],
+                'runtime': summary['runtime'] or 'N/A',
+                'director': summary['director'] or 'N/A',
+                'trailer_link': summary['any_trailer_link']
+            })
         return movie_detail
+
+    def fetch_movies_details(self, titles):
+        """Looks up every title concurrently, once per distinct title, keeping the input order.
+        Titles without a result before the per-request deadline are left out."""
+        details = fan_out(self.detail_pool, self.fetch_movie_details, titles, timeout=self.detail_deadline)
+        return [detail for detail in details if detail]
     
     def genre_based(self):
         username = session.get('username')
         if request.method == "POST":
             category = request.form["category"]
             number = int(request.form["number"])
-            prompt_content = self.generate_genre_based_prompt(number, category)
-            movie_titles = self.get_movie_titles_from_prompt(number, prompt_content)
-            
-            movie_details = [self.fetch_movie_details(title) for title in movie_titles if self.fetch_movie_details(title)]
+            movie_titles = self.get_recommended_titles('genre', category, number)
+
+            movie_details = self.fetch_movies_details(movie_titles)
             return render_template("index.html", movies=movie_details,  username=username, recommendation_type='genre_based')
         
         return render_template("index.html", movies=None, username=username, recommendation_type="genre_based")
@@ -261,29 +492,101 @@ class MovieRecommenderApp:
         if request.method == "POST":
             mood = request.form["mood"]
             number = int(request.form["number"])
-            prompt_content = self.generate_mood_based_prompt(number, mood)
-            movie_titles = self.get_movie_titles_from_prompt(number, prompt_content)
-            
-            movie_details = [self.fetch_movie_details(title) for title in movie_titles if self.fetch_movie_details(title)]
+            movie_titles = self.get_recommended_titles('mood', mood, number)
+
+            movie_details = self.fetch_movies_details(movie_titles)
             return render_template("index.html", movies=movie_details, username=username, recommendation_type="mood_based")
         
         return render_template("index.html", movies=None, username=username)
 
+    def stream_recommendations(self):
+        """Server-sent events for a genre or mood page: one 'movie' event per card as soon as it is looked up, then 'done'."""
+        kind = request.args.get('kind', 'genre')
+        category = request.args.get('category', '').strip()
+        number = request.args.get('number', 5, type=int)
+        if kind not in self.title_prompts or not category or number < 1:
+            return jsonify(error="Expected kind=genre|mood, a category and a positive number"), 400
+        return Response(
+            self.recommendation_events(kind, category, number), mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+        )
+
+    def recommendation_events(self, kind, category, number):
+        """
+        Reads the title stream on a producer thread, starting each title's
+        lookup on the detail pool the moment its line completes, and yields
+        the finished cards in completion order.
+        """
+        events = queue.Queue()
+
+        def produce():
+            started = 0
+            try:
+                for index, title in enumerate(self.stream_movie_titles(kind, category, number)):
+                    future = self.detail_pool.submit(self.fetch_movie_details, title)
+                    future.add_done_callback(lambda done, index=index: events.put((index, done)))
+                    started += 1
+            except Exception as e:
+                logging.warning(f"Streaming titles for '{category}' failed: {e}")
+            finally:
+                events.put((None, started))
+
+        threading.Thread(target=produce, name='title-stream', daemon=True).start()
+
+        expected, received, sent = None, 0, 0
+        while expected is None or received < expected:
+            # Titles may still be generating until the producer reports how many it started
+            try:
+                index, item = events.get(timeout=self.openai_timeout if expected is None else self.detail_deadline)
+            except queue.Empty:
+                logging.warning(f"Ending the stream for '{category}': no result before the deadline")
+                break
+            if index is None:
+                expected = item
+                continue
+            received += 1
+            movie = item.result() if item.exception() is None else None
+            if movie:
+                sent += 1
+                yield self.server_sent_event('movie', {'index': index, **movie})
+            if received == number:
+                break
+        yield self.server_sent_event('done', {'count': sent})
+
+    def server_sent_event(self, event, data):
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    def parse_filters(self, form):
+        """Builds recommender filter predicates from the optional genre, year and rating form fields."""
+        filters = {}
+        genres = form.get('genres')
+        if genres:
+            filters['genres'] = [genre.strip() for genre in genres.split(',') if genre.strip()]
+        for field, convert in (('min_year', int), ('max_year', int), ('min_rating', float),
+                               ('max_rating', float), ('min_votes', int)):
+            value = form.get(field)
+            if value:
+                filters[field] = convert(value)
+        return filters or None
+
     def content_based(self):
         username = session.get('username')
         if request.method == 'POST':
             movie = request.form['movie']
             number = int(request.form['number'])
             
-            # Check if the movie exists in the dataset
-            if movie not in self.recommender.get_movie_titles():
-                error_message = f"Sorry, '{movie}' is not in our database. Please try another movie."
-                return render_template('index.html', recommendation_type='content_based', error_message=error_message, username=username)
-            
             try:
-                # Get recommendations using the ContentRecommender
-                recommended_titles = self.recommender.get_recommendations(movie, number)
-                movie_details = [self.fetch_movie_details(title) for title in recommended_titles if self.fetch_movie_details(title)]
+                # Resolve the title against the catalog, tolerating typos and partial titles,
+                # and get recommendations for it from the same model
+                filters = self.parse_filters(request.form)
+                recommended_titles = self.recommender.resolve_and_recommend(movie, number, filters=filters)
+                if recommended_titles is None:
+                    error_message = f"Sorry, '{movie}' is not in our database. Please try another movie."
+                    suggestions = self.recommender.suggest_titles(movie)
+                    if suggestions:
+                        error_message += f" Did you mean: {', '.join(suggestions)}?"
+                    return render_template('index.html', recommendation_type='content_based', error_message=error_message, username=username)
+                movie_details = self.fetch_movies_details(recommended_titles)
                 
                 return render_template('index.html', recommendation_type='content_based', movies=movie_details, username=username)
             
@@ -364,100 +667,80 @@ class MovieRecommenderApp:
             return jsonify({"logged_in": False}), 200
     
 
-    def top_rated_movies(self):
+    def list_movie_details(self, movies):
+        """Builds movie cards for a TMDB list page, fetching runtime, director and trailer concurrently."""
+        movies_by_id = {movie['id']: movie for movie in movies}
+        extras = fan_out(self.detail_pool, self.get_movie_details, list(movies_by_id), timeout=self.detail_deadline)
+        return self.movie_cards(movies, dict(zip(movies_by_id, extras)))
+
+    def movie_cards(self, movies, extras):
+        """
+        :param movies: TMDB list page
+        :param extras: Dict of movie id to its (runtime, director, trailer link), or None when unknown
+        :return: Movie cards in list order
+        """
+        movie_details = []
+        for movie in movies:
+            genres = [self.genre_map[genre_id] for genre_id in movie['genre_ids'] if genre_id in self.genre_map]
+            runtime, director, trailer_link = extras.get(movie['id']) or (None, "Unknown", None)
+            movie_details.append({
+                'title': movie['title'],
+                'overview': movie['overview'],
+                'release_date': movie.get('release_date'),
+                'vote_average': movie['vote_average'],
+                'poster_path': f"https://image.tmdb.org/t/p/w500{movie['poster_path']}" if movie.get('poster_path') else None,
+                'genre': genres,
+                'runtime': runtime,         # Add runtime to movie details
+                'director': director,       # Add director to movie details
+                'trailer_link': trailer_link  # Add trailer link to movie details
+            })
+        return movie_details
+
+    def serve_movie_list(self, name, label):
+        """Serves a page of a TMDB list from its snapshot, fetching pages past the snapshot on demand."""
         page = request.args.get('page', 1, type=int)  # Get the page parameter from the request
-        top_rated_url = f"https://api.themoviedb.org/3/movie/top_rated?api_key={self.TMDB_API_KEY}&language=en-US&page={page}"
-        response = requests.get(top_rated_url)
         username = session.get('username')
-        if response.status_code == 200:
-            movies = response.json()['results']
-            movie_details = []
-            for movie in movies:
-                genres = [self.genre_map[genre_id] for genre_id in movie['genre_ids'] if genre_id in self.genre_map]
-                runtime, director, trailer_link = self.get_movie_details(movie['id'])
-                movie_details.append({
-                    'title': movie['title'],
-                    'overview': movie['overview'],
-                    'release_date': movie['release_date'],
-                    'vote_average': movie['vote_average'],
-                    'poster_path': f"https://image.tmdb.org/t/p/w500{movie['poster_path']}" if movie['poster_path'] else None,
-                    'genre': genres,
-                    'runtime': runtime,         # Add runtime to movie details
-                    'director': director,       # Add director to movie details
-                    'trailer_link': trailer_link  # Add trailer link to movie details
-                })
-            
-            if request.headers.get('Accept') == 'application/json':
-                return jsonify(movies=movie_details)
-            
-            return render_template('index.html', movies=movie_details, recommendation_type='trending', username=username)
+        cached = self.list_snapshots.get(name, page)
+        if cached is not None:
+            movie_details, refreshed_at = list(cached[0]), cached[1]
         else:
-            flash('Error fetching trending movies', 'error')
-            return render_template('index.html', username=username)
+            try:
+                movie_details = self.single_flight.do(
+                    f'list:{name}:{page}', lambda: self.list_movie_details(self.list_sources[name](page)), cross_worker=False
+                )
+            except TMDBError as e:
+                logging.warning(f"Error fetching {label} movies: {e}")
+                flash(f'Error fetching {label} movies', 'error')
+                return render_template('index.html', username=username)
+            refreshed_at = time.time()
+
+        if request.headers.get('Accept') == 'application/json':
+            return jsonify(movies=movie_details, refreshed_at=refreshed_at)
+
+        return render_template('index.html', movies=movie_details, recommendation_type=name,
+                               username=username, refreshed_at=refreshed_at)
+
+    def upstream_stats(self):
+        """Counters for the upstream call layers, for monitoring."""
+        return {
+            'single_flight': self.single_flight.stats(),
+            'metadata_cache': self.metadata_cache.stats(),
+            'llm_cache': self.llm_cache.stats(),
+            'title_resolution': self.title_resolver.stats(),
+            'upstreams': {
+                'tmdb': self.tmdb_guard.state(),
+                'openai': self.openai_guard.state(),
+            },
+        }
+
+    def top_rated_movies(self):
+        return self.serve_movie_list('top_rated', 'top rated')
     
     def trending_movies(self):
-            page = request.args.get('page', 1, type=int)
-            trending_url = f"https://api.themoviedb.org/3/trending/movie/day?api_key={self.TMDB_API_KEY}&language=en-US&page={page}"
-            response = requests.get(trending_url)
-            username = session.get('username')
-            if response.status_code == 200:
-                movies = response.json()['results']
-                movie_details = []
-                for movie in movies:
-                    genres = [self.genre_map[genre_id] for genre_id in movie['genre_ids'] if genre_id in self.genre_map]
-                    runtime, director, trailer_link = self.get_movie_details(movie['id'])
-                    movie_details.append({
-                        'title': movie['title'],
-                        'overview': movie['overview'],
-                        'release_date': movie['release_date'],
-                        'vote_average': movie['vote_average'],
-                        'poster_path': f"https://image.tmdb.org/t/p/w500{movie['poster_path']}" if movie['poster_path'] else None,
-                        'genre': genres,
-                        'runtime': runtime,         # Add runtime to movie details
-                        'director': director,       # Add director to movie details
-                        'trailer_link': trailer_link  # Add trailer link to movie details
-                    })
-                
-                if request.headers.get('Accept') == 'application/json':
-                    return jsonify(movies=movie_details)
-                
-                return render_template('index.html', movies=movie_details, recommendation_type='trending', username=username)
-            else:
-                flash('Error fetching trending movies', 'error')
-                return render_template('index.html', username=username)
+        return self.serve_movie_list('trending', 'trending')
             
     def upcoming_movies(self):
-        page = request.args.get('page', 1, type=int)
-        upcoming_url = f"https://api.themoviedb.org/3/movie/upcoming?api_key={self.TMDB_API_KEY}&language=en-US&page={page}"
-        response = requests.get(upcoming_url)
-        username = session.get('username')
-        
-        if response.status_code == 200:
-            movies = response.json()['results']
-            movie_details = []
-            
-            for movie in movies:
-                genres = [self.genre_map[genre_id] for genre_id in movie['genre_ids'] if genre_id in self.genre_map]
-                runtime, director, trailer_link = self.get_movie_details(movie['id'])
-                movie_details.append({
-                    'title': movie['title'],
-                    'overview': movie['overview'],
-                    'release_date': movie['release_date'],
-                    'vote_average': movie['vote_average'],
-                    'poster_path': f"https://image.tmdb.org/t/p/w500{movie['poster_path']}" if movie['poster_path'] else None,
-                    'genre': genres,
-                    'runtime': runtime,         # Add runtime to movie details
-                    'director': director,       # Add director to movie details
-                    'trailer_link': trailer_link  # Add trailer link to movie details
-                })
-            
-            if request.headers.get('Accept') == 'application/json':
-                return jsonify(movies=movie_details)
-            
-            return render_template('index.html', movies=movie_details, recommendation_type='upcoming', username=username)
-        else:
-            flash('Error fetching upcoming movies', 'error')
-        return render_template('index.html', username=username)
+        return self.serve_movie_list('upcoming', 'upcoming')
 
 
     def run(self, host="0.0.0.0", port=8080, debug=True):
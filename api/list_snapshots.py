@@ -0,0 +1,78 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+
+Snapshot = namedtuple('Snapshot', ['pages', 'refreshed_at'])
+
+
+class ListSnapshots:
+    """
+    Serves TMDB movie lists (top rated, trending, upcoming, ...) from
+    in-memory snapshots. A background thread refetches the first n_pages
+    of every list each interval seconds, enriches the movies, and publishes
+    a new immutable Snapshot with a single reference assignment, so readers
+    never wait on a refresh or see a partial one.
+    """
+
+    def __init__(self, sources, build_cards, n_pages=3, interval=900):
+        """
+        :param sources: Dict of list name to a callable taking a page number and returning TMDB movie dicts
+        :param build_cards: Callable turning a page of TMDB movie dicts into movie cards
+        :param n_pages: Pages of each list kept in memory
+        :param interval: Seconds between refreshes
+        """
+        self.sources = sources
+        self.build_cards = build_cards
+        self.n_pages = n_pages
+        self.interval = interval
+        self.snapshots = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def get(self, name, page=1):
+        """
+        :param name: List name
+        :param page: 1-based page
+        :return: Tuple of (movie cards, refresh timestamp), or None when the page is not in a snapshot
+        """
+        snapshot = self.snapshots.get(name)
+        if snapshot is None or not 1 <= page <= len(snapshot.pages):
+            return None
+        return snapshot.pages[page - 1], snapshot.refreshed_at
+
+    def refresh(self, name):
+        """
+        Rebuild one list's snapshot. The previous snapshot is kept if any page fails.
+        :param name: List name
+        """
+        fetch = self.sources[name]
+        pages = []
+        for page in range(1, self.n_pages + 1):
+            movies = fetch(page)
+            pages.append(tuple(self.build_cards(movies)))
+            if not movies:
+                break
+        self.snapshots = {**self.snapshots, name: Snapshot(tuple(pages), time.time())}
+
+    def refresh_all(self):
+        for name in self.sources:
+            try:
+                self.refresh(name)
+            except Exception as e:
+                logging.warning(f"Refreshing the {name} list failed, keeping the previous snapshot: {e}")
+
+    def start(self):
+        """Start refreshing in a daemon thread; the first refresh begins immediately."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='list-snapshots', daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh_all()
+            self._stop.wait(self.interval)
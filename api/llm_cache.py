@@ -0,0 +1,214 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class LLMResponseCache:
+    """
+    Chat model title lists in an SQLite file, shared by every worker on the
+    host and kept across restarts. A key covers one prompt family: kind,
+    normalized category, model, prompt templates and sampling parameters.
+    Each key holds up to samples_per_key sampled completions per number of
+    titles they list, served least-served first so repeat visitors see
+    variety. A request for n titles is answered from any cached list of at least n.
+    Completions are generated for fill_number titles so smaller pages share them.
+    """
+
+    def __init__(self, path, samples_per_key=3, ttl=7 * 86400, fill_number=10, background_refresh=False,
+                 max_rows=20000, refresh_workers=1, single_flight=None):
+        """
+        :param path: SQLite file, created if missing
+        :param samples_per_key: Completions kept per key and number of titles
+        :param ttl: Seconds a completion is fresh
+        :param fill_number: Smallest number of titles a completion is generated for
+        :param background_refresh: Serve stale or too few completions while a new one is generated
+                                   in the background, instead of generating before answering
+        :param max_rows: Completions kept before the least recently served are evicted
+        :param refresh_workers: Threads running background generations
+        :param single_flight: Optional SingleFlight coalescing generations for a key across workers
+        """
+        self.path = path
+        self.samples_per_key = samples_per_key
+        self.ttl = ttl
+        self.fill_number = fill_number
+        self.background_refresh = background_refresh
+        self.max_rows = max_rows
+        self.single_flight = single_flight
+        self.counters = {'hits': 0, 'misses': 0, 'generated': 0, 'background': 0}
+        self._local = threading.local()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._refresh_pool = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix='llm-cache-refresh')
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT, number INTEGER, titles TEXT, created_at REAL, served INTEGER DEFAULT 0, last_served REAL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS completions_key ON completions (key, number)")
+        conn.execute("CREATE INDEX IF NOT EXISTS completions_last_served ON completions (last_served)")
+        conn.commit()
+
+    def _connection(self):
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def count(self, outcome):
+        """
+        Count a lookup outcome of this process, for callers serving completions outside get_or_generate.
+        :param outcome: 'hits', 'misses', 'generated' or 'background'
+        """
+        with self._lock:
+            self.counters[outcome] += 1
+
+    def key(self, kind, category, request):
+        """
+        :param kind: Prompt family, e.g. 'genre' or 'mood'
+        :param category: User-supplied genre or mood, normalized for case and whitespace
+        :param request: Chat completion arguments with the prompt templates, model and sampling parameters
+        :return: Cache key
+        """
+        identity = {'kind': kind, 'category': ' '.join(category.lower().split()), 'request': request}
+        return hashlib.sha1(json.dumps(identity, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _fresh_count(self, conn, key, number):
+        return conn.execute(
+            "SELECT COUNT(*) FROM completions WHERE key = ? AND number >= ? AND created_at >= ?",
+            (key, number, time.time() - self.ttl),
+        ).fetchone()[0]
+
+    def pick(self, key, number):
+        """
+        Serve the least-served cached completion listing at least number titles.
+        Stale completions are only served when background refresh is on.
+        :return: Tuple of (titles or None, whether the key wants another completion)
+        """
+        conn = self._connection()
+        now = time.time()
+        oldest = 0 if self.background_refresh else now - self.ttl
+        row = conn.execute(
+            "SELECT rowid, titles FROM completions WHERE key = ? AND number >= ? AND created_at >= ? "
+            "ORDER BY served, created_at LIMIT 1",
+            (key, number, oldest),
+        ).fetchone()
+        if row is None:
+            return None, True
+        conn.execute("UPDATE completions SET served = served + 1, last_served = ? WHERE rowid = ?", (now, row[0]))
+        conn.commit()
+        wants_more = self._fresh_count(conn, key, number) < self.samples_per_key
+        return json.loads(row[1])[:number], wants_more
+
+    def add(self, key, titles, served=False):
+        """
+        Store a completion under the number of titles it lists, which may be
+        fewer than were asked for, dropping the oldest beyond samples_per_key
+        for the key and number.
+        :param key: Cache key
+        :param titles: Parsed titles
+        :param served: Whether the completion is also being served to the caller that generated it
+        :return: The stored titles, without blank lines
+        """
+        titles = [title for title in titles if title.strip()]
+        if not titles:
+            return titles
+        number = len(titles)
+        conn = self._connection()
+        now = time.time()
+        conn.execute(
+            "INSERT INTO completions VALUES (?, ?, ?, ?, ?, ?)",
+            (key, number, json.dumps(titles), now, int(served), now),
+        )
+        conn.execute(
+            "DELETE FROM completions WHERE rowid IN (SELECT rowid FROM completions WHERE key = ? AND number = ? "
+            "ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (key, number, self.samples_per_key),
+        )
+        excess = conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0] - self.max_rows
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM completions WHERE rowid IN (SELECT rowid FROM completions ORDER BY last_served LIMIT ?)",
+                (excess,),
+            )
+        conn.commit()
+        self.count('generated')
+        return titles
+
+    def generate_number(self, number):
+        """Number of titles to ask the model for when a page wants number."""
+        return max(number, self.fill_number)
+
+    def get_or_generate(self, key, number, generate):
+        """
+        Return number titles for key, calling generate() when the key has no
+        usable completion or wants another one. Exceptions from generate()
+        propagate and nothing is cached.
+        :param key: Cache key from key()
+        :param number: Titles wanted
+        :param generate: Callable taking a number of titles and returning a list of titles
+        :return: List of at most number titles
+        """
+        titles, wants_more = self.pick(key, number)
+        if titles is not None and not wants_more:
+            self.count('hits')
+            return titles
+        if titles is not None and self.background_refresh:
+            self.count('hits')
+            self._refresh(key, number, generate)
+            return titles
+        self.count('misses')
+
+        def load():
+            # Another worker may have added a completion while this one waited
+            if self._fresh_count(self._connection(), key, number) >= (self.samples_per_key if titles else 1):
+                return None
+            generated = self._generate(key, number, generate, served=True)
+            return generated[:number]
+
+        if self.single_flight is None:
+            generated = load()
+        else:
+            generated = self.single_flight.do(f'llm:{key}:{number}', load)
+        if generated is None:
+            return titles or self.pick(key, number)[0]
+        return generated
+
+    def _generate(self, key, number, generate, served=False):
+        n_titles = self.generate_number(number)
+        return self.add(key, generate(n_titles), served)
+
+    def _refresh(self, key, number, generate):
+        with self._lock:
+            if (key, number) in self._refreshing:
+                return
+            self._refreshing.add((key, number))
+
+        def refresh():
+            try:
+                self._generate(key, number, generate)
+                self.count('background')
+            except Exception as e:
+                logging.warning(f"Background completion for {key} failed, serving cached titles: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard((key, number))
+
+        self._refresh_pool.submit(refresh)
+
+    def stats(self):
+        """Stored keys and completions, and lookup outcomes of this process."""
+        keys, rows = self._connection().execute("SELECT COUNT(DISTINCT key), COUNT(*) FROM completions").fetchone()
+        with self._lock:
+            counters = dict(self.counters)
+        return {'keys': keys, 'completions': rows, **counters}
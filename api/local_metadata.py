@@ -0,0 +1,125 @@
+import logging
+import os
+import threading
+
+import pandas as pd
+
+from src.attribute_index import parse_genres
+from src.catalog_io import as_list, read_catalog
+from src.title_index import TitleIndex
+
+LOCAL_COLUMNS = ['movie_id', 'title', 'overview', 'genres', 'vote_average', 'release_date', 'crew']
+# Fields the TMDB dumps do not carry, filled from the API on first use
+REMOTE_FIELDS = ['poster_path', 'trailer_link', 'runtime']
+
+
+def _value(value):
+    return None if pd.isna(value) else value
+
+
+class LocalMetadataStore:
+    """
+    In-memory movie metadata built from the local TMDB data, keyed by movie
+    id and looked up by title through a TitleIndex. Records use the movie
+    card format of MovieRecommenderApp.fetch_movie_details plus the TMDB id.
+    Fields the dumps lack are None until update() writes them back.
+    """
+
+    def __init__(self, movies_df, runtimes=None):
+        """
+        :param movies_df: DataFrame with LOCAL_COLUMNS, genres space-joined and crew listing directors
+        :param runtimes: Optional dict of movie id to runtime in minutes
+        """
+        runtimes = runtimes or {}
+        self.records = {}
+        for movie in movies_df[LOCAL_COLUMNS].itertuples(index=False):
+            directors = as_list(movie.crew)
+            self.records[int(movie.movie_id)] = {
+                'id': int(movie.movie_id),
+                'title': movie.title,
+                'overview': _value(movie.overview),
+                'release_date': _value(movie.release_date),
+                'vote_average': _value(movie.vote_average),
+                'genre': parse_genres(movie.genres),
+                'director': directors[0] if directors else None,
+                'runtime': _value(runtimes.get(int(movie.movie_id))),
+                'poster_path': None,
+                'trailer_link': None,
+            }
+        # Row order of the title index; duplicate ids keep the last record
+        self.ids = movies_df['movie_id'].astype(int).tolist()
+        self.complete = set()
+        years = pd.to_datetime(movies_df['release_date'], errors='coerce').dt.year
+        self.title_index = TitleIndex(
+            movies_df['title'].tolist(), [None if pd.isna(year) else int(year) for year in years]
+        )
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_files(cls, catalog_path, movies_path=None):
+        """
+        Build the store from the filtered catalog, taking runtimes from the raw
+        tmdb_5000_movies.csv when it is available.
+        :param catalog_path: Filtered movies catalog (.csv, .parquet or .feather)
+        :param movies_path: Optional raw TMDB movies CSV
+        :return: LocalMetadataStore
+        """
+        movies_df = read_catalog(catalog_path, columns=LOCAL_COLUMNS)
+        runtimes = None
+        if movies_path and os.path.exists(movies_path):
+            raw = pd.read_csv(movies_path, usecols=['id', 'runtime'])
+            runtimes = dict(zip(raw['id'].astype(int), raw['runtime']))
+        logging.info(f"Local metadata store: {len(movies_df)} movies, runtimes {'loaded' if runtimes else 'unavailable'}")
+        return cls(movies_df, runtimes)
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, movie_id):
+        """
+        :param movie_id: TMDB movie id
+        :return: Record dict, or None if the movie is not local
+        """
+        return self.records.get(int(movie_id))
+
+    def lookup(self, title):
+        """
+        :param title: Movie title, optionally with a trailing year
+        :return: Record dict, or None if no local movie matches
+        """
+        row = self.title_index.lookup(title)
+        return None if row is None else self.records[self.ids[row]]
+
+    def match(self, title, year=None, year_tolerance=1):
+        """
+        :param title: Movie title without a year
+        :param year: Optional release year the local movie must be within year_tolerance of
+        :return: Record dict, or None if no local movie matches
+        """
+        row = self.title_index.match(title, year, year_tolerance)
+        return None if row is None else self.records[self.ids[row]]
+
+    def missing_fields(self, record):
+        """REMOTE_FIELDS still unset on a record that has not been completed from TMDB."""
+        if record['id'] in self.complete:
+            return []
+        return [field for field in REMOTE_FIELDS if record.get(field) is None]
+
+    def update(self, movie_id, fields, complete=True):
+        """
+        Write fields fetched from TMDB back into a record. Records are
+        replaced, not mutated, so readers never see a partial update.
+        :param movie_id: TMDB movie id
+        :param fields: Dict of field values; None values are ignored
+        :param complete: Mark the record as fetched, so fields TMDB has no value for are not asked for again
+        :return: The updated record
+        """
+        movie_id = int(movie_id)
+        with self._lock:
+            record = dict(self.records[movie_id])
+            record.update({field: value for field, value in fields.items() if value is not None})
+            self.records[movie_id] = record
+            if complete:
+                self.complete.add(movie_id)
+        return record
+
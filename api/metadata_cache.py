@@ -0,0 +1,207 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+FRESH = 'fresh'
+STALE = 'stale'
+MISS = 'miss'
+
+
+class MetadataCache:
+    """
+    Upstream metadata cache in an SQLite file, shared by every worker process
+    on the host. Entries carry a TTL; expired entries are still served for
+    stale_ttl seconds while a background refresh replaces them. A None
+    result is cached for negative_ttl so unknown titles are not searched
+    again on every request. The least recently read entries are evicted
+    once max_entries is exceeded. Reads only take the database write lock
+    when they flush a batch of access times, and the entry count is only
+    checked every evict_every inserts, so max_entries may be overshot by that many.
+    """
+
+    def __init__(self, path, max_entries=20000, ttl=3600, negative_ttl=900, stale_ttl=86400, refresh_workers=2,
+                 single_flight=None, access_batch=256, access_interval=30, evict_every=None):
+        """
+        :param path: SQLite file, created if missing
+        :param max_entries: Entries kept before LRU eviction
+        :param ttl: Seconds an entry is fresh
+        :param negative_ttl: Seconds a "no result" entry is fresh
+        :param stale_ttl: Seconds past expiry an entry may still be served while it is refreshed
+        :param refresh_workers: Threads running background refreshes
+        :param single_flight: Optional SingleFlight that coalesces concurrent misses for a key
+        :param access_batch: Read access times buffered before they are written
+        :param access_interval: Longest time in seconds read access times stay buffered
+        :param evict_every: Inserts between eviction checks, defaults to 1% of max_entries
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stale_ttl = stale_ttl
+        self.single_flight = single_flight
+        self.access_batch = access_batch
+        self.access_interval = access_interval
+        self.evict_every = evict_every or max(1, max_entries // 100)
+        self.hits = {FRESH: 0, STALE: 0, MISS: 0, 'filled_by_peer': 0}
+        self._local = threading.local()
+        self._accessed = {}
+        self._accessed_flushed = time.time()
+        self._inserts = 0
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._refresh_pool = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix='cache-refresh')
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value TEXT, expires_at REAL, last_access REAL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+        conn.commit()
+
+    def _connection(self):
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def lookup(self, key):
+        """
+        Read an entry without fetching.
+        :param key: Cache key
+        :return: Tuple of (state, value); state is 'fresh', 'stale' or 'miss'
+        """
+        conn = self._connection()
+        now = time.time()
+        row = conn.execute("SELECT value, expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] + self.stale_ttl < now:
+            return MISS, None
+        self._record_access(key, now)
+        value = json.loads(row[0]) if row[0] is not None else None
+        return (FRESH if row[1] >= now else STALE), value
+
+    def set(self, key, value, ttl=None):
+        """
+        Store a JSON-serializable value; None is stored as a negative entry.
+        :param key: Cache key
+        :param value: Value to cache
+        :param ttl: Seconds the entry is fresh, defaults to ttl or negative_ttl
+        """
+        if ttl is None:
+            ttl = self.negative_ttl if value is None else self.ttl
+        now = time.time()
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+            (key, None if value is None else json.dumps(value), now + ttl, now),
+        )
+        with self._lock:
+            self._inserts += 1
+            check_size = self._inserts % self.evict_every == 0
+        if check_size:
+            # Eviction order must see the reads buffered so far
+            self._flush_accesses(conn)
+            excess = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - self.max_entries
+            if excess > 0:
+                conn.execute(
+                    "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY last_access LIMIT ?)", (excess,)
+                )
+        conn.commit()
+
+    def _record_access(self, key, now):
+        with self._lock:
+            self._accessed[key] = now
+            due = len(self._accessed) >= self.access_batch or now - self._accessed_flushed >= self.access_interval
+        if due:
+            conn = self._connection()
+            self._flush_accesses(conn)
+            conn.commit()
+
+    def _flush_accesses(self, conn):
+        with self._lock:
+            accessed, self._accessed = self._accessed, {}
+            self._accessed_flushed = time.time()
+        if accessed:
+            conn.executemany(
+                "UPDATE entries SET last_access = MAX(last_access, ?) WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in accessed.items()],
+            )
+
+    def count(self, outcome):
+        """
+        Count a lookup outcome of this process, for callers reading the cache outside get_or_fetch.
+        :param outcome: 'fresh', 'stale', 'miss' or 'filled_by_peer'
+        """
+        with self._lock:
+            self.hits[outcome] += 1
+
+    def delete(self, key):
+        conn = self._connection()
+        conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        conn.commit()
+
+    def get_or_fetch(self, key, fetch, ttl=None):
+        """
+        Return the cached value for key, calling fetch() on a miss. Stale
+        entries are returned immediately and refreshed in the background.
+        Exceptions from fetch() propagate and are not cached.
+        :param key: Cache key
+        :param fetch: Zero-argument callable producing the value, or None for "no result"
+        :param ttl: Seconds a fetched entry is fresh
+        :return: Cached or fetched value
+        """
+        state, value = self.lookup(key)
+        self.count(state)
+        if state == FRESH:
+            return value
+        if state == STALE:
+            self._refresh(key, fetch, ttl)
+            return value
+
+        def load():
+            # Another thread or worker may have filled the entry while this one waited
+            state, value = self.lookup(key)
+            if state == FRESH:
+                self.count('filled_by_peer')
+                return value
+            value = fetch()
+            self.set(key, value, ttl)
+            return value
+
+        if self.single_flight is None:
+            return load()
+        return self.single_flight.do(f'cache:{key}', load)
+
+    def _refresh(self, key, fetch, ttl):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self.set(key, fetch(), ttl)
+            except Exception as e:
+                logging.warning(f"Background refresh of {key} failed, serving the stale entry: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._refresh_pool.submit(refresh)
+
+    def stats(self):
+        """Entry count and lookup outcomes of this process."""
+        count = self._connection().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        with self._lock:
+            hits = dict(self.hits)
+        return {'entries': count, **hits}
@@ -0,0 +1,129 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: coalescing stays per process
+    fcntl = None
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller runs the
+    function, callers arriving while it runs wait and receive its result or
+    exception. With lock_dir set, the leader also holds a per-key file lock
+    across worker processes on the host, so a function that first re-checks
+    a shared store (such as MetadataCache) runs upstream once per host.
+    """
+
+    def __init__(self, lock_dir=None, n_stripes=256):
+        """
+        :param lock_dir: Directory for cross-process lock files, None coalesces within this process only
+        :param n_stripes: Lock files keys are hashed onto
+        """
+        if lock_dir is not None and fcntl is None:
+            logging.warning("fcntl is unavailable, single-flight coalescing is per process only")
+            lock_dir = None
+        if lock_dir is not None:
+            os.makedirs(lock_dir, exist_ok=True)
+        self.lock_dir = lock_dir
+        self.n_stripes = n_stripes
+        self.counters = {'calls': 0, 'executed': 0, 'coalesced': 0}
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, cross_worker=True):
+        """
+        Run fn() once for all concurrent callers with the same key.
+        :param key: String identifying the upstream call
+        :param fn: Zero-argument callable
+        :param cross_worker: Also serialize with other processes sharing lock_dir
+        :return: fn's result
+        """
+        with self._lock:
+            self.counters['calls'] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.counters['executed'] += 1
+            else:
+                self.counters['coalesced'] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            if cross_worker and self.lock_dir is not None:
+                with self._file_lock(key):
+                    call.result = fn()
+            else:
+                call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    @contextmanager
+    def _file_lock(self, key):
+        stripe = int(hashlib.sha1(key.encode('utf-8')).hexdigest(), 16) % self.n_stripes
+        with open(os.path.join(self.lock_dir, f'{stripe}.lock'), 'a') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, 'in_flight': len(self._calls)}
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlight for coroutines on one event loop. The shared call runs in
+    its own task, so a caller that is cancelled, e.g. by a page deadline,
+    does not cancel it for the others and its result still reaches them.
+    """
+
+    def __init__(self):
+        self.counters = {'calls': 0, 'executed': 0, 'coalesced': 0}
+        self._tasks = {}
+
+    async def do(self, key, fn):
+        """
+        Await fn() once for all concurrent callers with the same key.
+        :param key: String identifying the upstream call
+        :param fn: Zero-argument callable returning an awaitable
+        :return: fn's result
+        """
+        self.counters['calls'] += 1
+        task = self._tasks.get(key)
+        if task is None:
+            self.counters['executed'] += 1
+            task = self._tasks[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda done: self._tasks.pop(key, None))
+        else:
+            self.counters['coalesced'] += 1
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {**self.counters, 'in_flight': len(self._tasks)}
@@ -0,0 +1,116 @@
+import re
+import threading
+from collections import namedtuple
+
+from src.title_index import split_year
+
+LOCAL = 'local'
+REMOTE = 'remote'
+UNRESOLVED = 'unresolved'
+
+Resolution = namedtuple('Resolution', ['line', 'title', 'year', 'source', 'movie_id', 'record'])
+
+_LIST_MARKER = re.compile(r'^\s*(?:\d+\s*[.):]|[-*•]|#+)\s*')
+_MARKUP = re.compile(r'[*_`]+')
+_QUOTES = '"\'“”‘’'
+_YEAR_IN_LINE = re.compile(r'^(?P<title>.+?)\s*[\(\[]\s*(?P<year>(?:18|19|20)\d{2})\s*[\)\]]')
+_DESCRIPTION = re.compile(r'\s+[-–—:]\s+')
+
+
+def clean_title_line(line):
+    """
+    Title candidates of one line of chat model output, most literal first.
+    List numbering, bullets, markdown and quotes are dropped and a release
+    year in brackets is split off along with anything after it. When a
+    dash separates what reads like a description ('Heat - a heist epic'),
+    the part before it is offered as a further candidate.
+    :param line: Raw line, e.g. '1. **Heat** (1995) - Michael Mann'
+    :return: List of (title, year or None) tuples, never empty for a non-blank line
+    """
+    text = _MARKUP.sub('', _LIST_MARKER.sub('', line)).strip().strip(_QUOTES).strip()
+    match = _YEAR_IN_LINE.match(text)
+    if match:
+        return [(match.group('title').strip().strip(_QUOTES), int(match.group('year')))]
+
+    title, year = split_year(text)
+    candidates = [(title.strip(_QUOTES), year)] if title else []
+    parts = _DESCRIPTION.split(title, maxsplit=1)
+    if len(parts) == 2 and parts[0]:
+        candidates.append((parts[0].strip(_QUOTES), year))
+    return candidates
+
+
+def looks_like_description(text):
+    """Whether the text after a dash is commentary rather than the rest of a title."""
+    words = text.split()
+    return bool(words) and (words[0][0].islower() or len(words) > 5)
+
+
+class TitleResolver:
+    """
+    Grounds titles suggested by the chat model in the local catalog: lines
+    are cleaned, then matched against the LocalMetadataStore title and
+    year index. Only titles with no local match need a TMDB search, which
+    the caller supplies. Counts of local hits and remote lookups are kept
+    for monitoring.
+    """
+
+    def __init__(self, local_metadata, year_tolerance=1):
+        """
+        :param local_metadata: LocalMetadataStore
+        :param year_tolerance: Years a local release date may differ from a suggested year and still match
+        """
+        self.local_metadata = local_metadata
+        self.year_tolerance = year_tolerance
+        self.counters = {LOCAL: 0, REMOTE: 0, UNRESOLVED: 0}
+        self._lock = threading.Lock()
+
+    def _count(self, source):
+        with self._lock:
+            self.counters[source] += 1
+
+    def resolve(self, line, search=None):
+        """
+        :param line: Line of chat model output
+        :param search: Optional callable taking (title, year) and returning a TMDB search match or None,
+                       called when the catalog has no match
+        :return: Resolution whose source is 'local', 'remote' or 'unresolved'
+        """
+        resolution = self.resolve_local(line)
+        if resolution.source == LOCAL or search is None:
+            return resolution
+        return self.resolve_remote(resolution, search(resolution.title, resolution.year))
+
+    def resolve_local(self, line):
+        """
+        Match a line against the catalog only.
+        :return: Resolution with source 'local', or 'unresolved' carrying the title and year to search for
+        """
+        candidates = clean_title_line(line)
+        for title, year in candidates:
+            record = self.local_metadata.match(title, year, self.year_tolerance)
+            if record is not None:
+                self._count(LOCAL)
+                return Resolution(line, title, year, LOCAL, record['id'], record)
+
+        title, year = candidates[0] if candidates else (line.strip(), None)
+        if len(candidates) > 1 and looks_like_description(_DESCRIPTION.split(title, maxsplit=1)[1]):
+            title, year = candidates[1]
+        return Resolution(line, title, year, UNRESOLVED, None, None)
+
+    def resolve_remote(self, resolution, match):
+        """
+        Complete an unresolved local resolution with the result of a TMDB search.
+        :param resolution: Resolution from resolve_local
+        :param match: TMDB search match dict with an 'id', or None
+        :return: Resolution with source 'remote', or 'unresolved' when TMDB has no match either
+        """
+        if match is None:
+            self._count(UNRESOLVED)
+            return resolution
+        self._count(REMOTE)
+        return resolution._replace(source=REMOTE, movie_id=match['id'], record=match)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
@@ -0,0 +1,188 @@
+import logging
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from api.upstream_guard import UpstreamUnavailable
+
+TMDB_API_URL = 'https://api.themoviedb.org/3'
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class TMDBError(Exception):
+    """Raised when TMDB cannot be reached or answers with an error status."""
+
+    def __init__(self, message, status=None, retryable=False, retry_after=None):
+        """
+        :param message: Error message
+        :param status: HTTP status of the response, None when there was none
+        :param retryable: Whether the request may succeed when sent again
+        :param retry_after: Retry-After header of the response, if any
+        """
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+def is_upstream_failure(error):
+    """Whether a TMDBError says TMDB itself is unhealthy rather than the request being bad."""
+    return isinstance(error, TMDBError) and (error.status is None or error.status == 429 or error.status >= 500)
+
+
+def status_error(path, status, retry_after=None):
+    """TMDBError for a non-200 response, retryable for 429 and 5xx."""
+    return TMDBError(f"TMDB returned {status} for {path}", status=status,
+                     retryable=status in RETRY_STATUSES, retry_after=retry_after)
+
+
+def retry_delay(error, attempt, backoff_factor, backoff_max):
+    """
+    Seconds to wait before retrying after a failed attempt: exponential
+    backoff, or the Retry-After header when TMDB sent one, capped at backoff_max.
+    :param error: Retryable TMDBError of the failed attempt
+    :param attempt: 0-based number of the failed attempt
+    """
+    delay = backoff_factor * 2 ** attempt
+    if error.retry_after is not None and error.retry_after.isdigit():
+        delay = int(error.retry_after)
+    return min(backoff_max, delay)
+
+
+class TMDBClient:
+    """
+    Thread-safe TMDB API client sharing one keep-alive session. Idempotent
+    GETs are retried with exponential backoff on 429 and 5xx responses and
+    connection errors, waiting as long as a Retry-After header asks, up to
+    backoff_max. Each attempt is admitted through the guard on its own, so
+    retries take rate limit tokens and no concurrency slot is held while
+    waiting to retry.
+    """
+
+    def __init__(self, api_key, base_url=TMDB_API_URL, pool_size=32, connect_timeout=3.05, read_timeout=10,
+                 retries=3, backoff_factor=0.5, backoff_max=2, guard=None):
+        """
+        :param api_key: TMDB v3 API key
+        :param base_url: API root, overridable for tests
+        :param pool_size: Keep-alive connections kept per host; size it to the worker thread count
+        :param connect_timeout: Seconds to establish a connection
+        :param read_timeout: Seconds to wait for response data
+        :param retries: Retries per request after the first attempt
+        :param backoff_factor: Base of the exponential backoff between retries, in seconds
+        :param backoff_max: Longest single backoff sleep, in seconds, Retry-After included
+        :param guard: Optional UpstreamGuard every request is admitted through
+        """
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.guard = guard
+
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0, pool_block=False)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get(self, path, **params):
+        """
+        GET an API path and decode the JSON body.
+        :param path: Path below the API root, e.g. 'movie/603'
+        :param params: Query parameters
+        :return: Decoded JSON
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                return self._admitted_get(path, params)
+            except TMDBError as e:
+                if not e.retryable or attempt == self.retries:
+                    raise
+                delay = retry_delay(e, attempt, self.backoff_factor, self.backoff_max)
+                logging.debug(f"Retrying {path} in {delay}s: {e}")
+            time.sleep(delay)
+
+    def _admitted_get(self, path, params):
+        if self.guard is None:
+            return self._get(path, params)
+        try:
+            return self.guard.call(lambda: self._get(path, params))
+        except UpstreamUnavailable as e:
+            raise TMDBError(str(e)) from e
+
+    def _get(self, path, params):
+        try:
+            response = self.session.get(
+                f'{self.base_url}/{path.lstrip("/")}', params={'api_key': self.api_key, **params}, timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            raise TMDBError(f"TMDB request for {path} failed: {e}", retryable=True) from e
+        if response.status_code != 200:
+            raise status_error(path, response.status_code, response.headers.get('Retry-After'))
+        return response.json()
+
+    def search_movie(self, query, page=1, year=None):
+        """
+        :param query: Title to search for
+        :param year: Optional release year narrowing the search
+        :return: List of search result dicts, best match first
+        """
+        params = {'year': year} if year else {}
+        return self.get('search/movie', query=query, page=page, **params).get('results', [])
+
+    def movie_details(self, movie_id, append=()):
+        """
+        :param movie_id: TMDB movie id
+        :param append: Sub-resources fetched in the same request, e.g. ('credits', 'videos')
+        :return: Movie details dict
+        """
+        params = {'append_to_response': ','.join(append)} if append else {}
+        return self.get(f'movie/{movie_id}', **params)
+
+    def movie_credits(self, movie_id):
+        """
+        :param movie_id: TMDB movie id
+        :return: Dict with 'cast' and 'crew' lists
+        """
+        return self.get(f'movie/{movie_id}/credits')
+
+    def movie_videos(self, movie_id):
+        """
+        :param movie_id: TMDB movie id
+        :return: List of video dicts
+        """
+        return self.get(f'movie/{movie_id}/videos').get('results', [])
+
+    def movie_list(self, name, page=1, language='en-US'):
+        """
+        :param name: 'top_rated', 'upcoming', 'popular' or 'now_playing'
+        :param page: 1-based result page
+        :return: List of movie dicts
+        """
+        return self.get(f'movie/{name}', language=language, page=page).get('results', [])
+
+    def trending(self, window='day', page=1, language='en-US'):
+        """
+        :param window: 'day' or 'week'
+        :param page: 1-based result page
+        :return: List of movie dicts
+        """
+        return self.get(f'trending/movie/{window}', language=language, page=page).get('results', [])
+
+    def close(self):
+        self.session.close()
+
+
+def director(details):
+    """Name of the first director in a details response with appended credits, or None."""
+    return next((member['name'] for member in details.get('credits', {}).get('crew', [])
+                 if member.get('job') == 'Director'), None)
+
+
+def trailer_link(details, youtube_only=True):
+    """YouTube link of the first trailer in a details response with appended videos, or None."""
+    for video in details.get('videos', {}).get('results', []):
+        if video.get('type') == 'Trailer' and (video.get('site') == 'YouTube' or not youtube_only):
+            return f"https://www.youtube.com/watch?v={video['key']}"
+    return None
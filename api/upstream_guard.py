@@ -0,0 +1,236 @@
+import asyncio
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of calling an upstream that is rate limited, saturated or failing."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at rate tokens per second."""
+
+    def __init__(self, rate, burst):
+        """
+        :param rate: Tokens added per second, the sustained request rate
+        :param burst: Bucket size, the largest burst allowed after an idle period
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, timeout=0):
+        """
+        Take one token, waiting up to timeout seconds for the bucket to refill.
+        :return: True if a token was taken
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def wait_time(self):
+        """Seconds until the next token is available."""
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0.0, (1 - self.tokens) / self.rate)
+
+    def available(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            return self.tokens
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures and rejects calls
+    for reset_timeout seconds. Then a single trial call is let through
+    (half open); its success closes the breaker, its failure reopens it.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self.trial_running = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        """End a trial call that neither succeeded nor failed, e.g. one rejected by the rate limit."""
+        with self._lock:
+            self.trial_running = False
+
+
+class UpstreamGuard:
+    """
+    Admission control for one upstream, shared by every thread of the
+    process: a token bucket sized to the provider's quota, a cap on
+    concurrent calls, and a circuit breaker that fails fast while the
+    upstream is unhealthy.
+    """
+
+    def __init__(self, name, rate, burst=None, max_concurrency=8, acquire_timeout=2,
+                 failure_threshold=5, reset_timeout=30, is_failure=None):
+        """
+        :param name: Upstream name used in errors and stats
+        :param rate: Sustained calls per second
+        :param burst: Token bucket size, defaults to rate
+        :param max_concurrency: Calls allowed in flight at once
+        :param acquire_timeout: Seconds a caller waits for a token and a concurrency slot
+        :param failure_threshold: Consecutive failures that open the breaker
+        :param reset_timeout: Seconds the breaker stays open before a trial call
+        :param is_failure: Predicate on an exception deciding whether it counts against
+                           the upstream's health; by default every exception does
+        """
+        self.name = name
+        self.bucket = TokenBucket(rate, burst or rate)
+        self.max_concurrency = max_concurrency
+        self.acquire_timeout = acquire_timeout
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.is_failure = is_failure or (lambda e: True)
+        self.counters = {'calls': 0, 'rejected_open': 0, 'rejected_rate': 0, 'rejected_busy': 0, 'failures': 0}
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def _count(self, counter):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def call(self, fn):
+        """
+        Run fn() if the breaker, the rate limit and the concurrency cap admit it.
+        :param fn: Zero-argument callable making the upstream request
+        :return: fn's result
+        """
+        self._check_breaker()
+        if not self.bucket.acquire(self.acquire_timeout):
+            self._reject('rejected_rate', "rate limit reached")
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            self._reject('rejected_busy', f"has {self.max_concurrency} calls in flight")
+        self._enter()
+        try:
+            result = fn()
+        except Exception as e:
+            self._exit(e)
+            raise
+        self._exit()
+        return result
+
+    async def call_async(self, fn):
+        """
+        call() for coroutines: waits for a token and a slot without blocking
+        the event loop, sharing limits and breaker with threaded callers.
+        :param fn: Zero-argument callable returning an awaitable
+        :return: The awaited result
+        """
+        self._check_breaker()
+        deadline = time.monotonic() + self.acquire_timeout
+        while not self.bucket.acquire():
+            wait = self.bucket.wait_time()
+            if time.monotonic() + wait > deadline:
+                self._reject('rejected_rate', "rate limit reached")
+            await asyncio.sleep(wait)
+        while not self._slots.acquire(blocking=False):
+            if time.monotonic() >= deadline:
+                self._reject('rejected_busy', f"has {self.max_concurrency} calls in flight")
+            await asyncio.sleep(0.01)
+        self._enter()
+        try:
+            result = await fn()
+        except Exception as e:
+            self._exit(e)
+            raise
+        except BaseException:
+            # Cancelled: says nothing about the upstream's health
+            self._exit(cancelled=True)
+            raise
+        self._exit()
+        return result
+
+    def _check_breaker(self):
+        if not self.breaker.allow():
+            self._count('rejected_open')
+            raise UpstreamUnavailable(f"{self.name} circuit is open")
+
+    def _reject(self, counter, reason):
+        self.breaker.release()
+        self._count(counter)
+        raise UpstreamUnavailable(f"{self.name} {reason}")
+
+    def _enter(self):
+        with self._lock:
+            self.counters['calls'] += 1
+            self._in_flight += 1
+
+    def _exit(self, error=None, cancelled=False):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+        if cancelled:
+            self.breaker.release()
+        elif error is not None and self.is_failure(error):
+            self._count('failures')
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def state(self):
+        """Limiter and breaker state, for monitoring."""
+        with self._lock:
+            counters = dict(self.counters)
+            in_flight = self._in_flight
+        return {
+            'breaker': self.breaker.state,
+            'consecutive_failures': self.breaker.failures,
+            'tokens_available': round(self.bucket.available(), 2),
+            'in_flight': in_flight,
+            'max_concurrency': self.max_concurrency,
+            **counters,
+        }
@@ -0,0 +1,206 @@
+"""
+Requests per second of one serving worker, threaded Flask app against the
+aiohttp app, with TMDB and OpenAI replaced by local stubs that answer after
+a fixed latency. Every request asks the chat stub for titles it has not
+returned before, so each page costs one chat completion plus a TMDB search
+and details call per title, as on a cold cache.
+
+    python -m benchmarks.bench_async_serving --threads 8 --concurrency 64 --duration 10
+
+The threaded worker mimics a gunicorn gthread worker with --threads
+threads; the async worker is a single event loop.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+import aiohttp
+from aiohttp import web
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+GENRES = ['Action', 'Comedy', 'Drama', 'Horror', 'Romance', 'Thriller']
+
+
+def stub_upstreams(latency, n_titles):
+    """aiohttp app answering the TMDB and chat completion calls the pages make."""
+    counter = itertools.count()
+
+    async def chat(request):
+        await asyncio.sleep(latency['openai'])
+        batch = next(counter)
+        titles = '\n'.join(f'Stub Film {batch}-{i}' for i in range(n_titles))
+        return web.json_response({
+            'id': f'chatcmpl-{batch}', 'object': 'chat.completion', 'created': 0, 'model': 'gpt-4o-mini',
+            'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': titles}}],
+        })
+
+    async def search(request):
+        await asyncio.sleep(latency['tmdb'])
+        query = request.query['query']
+        movie_id = 10 ** 7 + abs(hash(query)) % 10 ** 7
+        return web.json_response({'results': [{'id': movie_id, 'title': query, 'overview': '', 'vote_average': 6.5,
+                                               'release_date': '2020-01-01', 'poster_path': None}]})
+
+    async def details(request):
+        await asyncio.sleep(latency['tmdb'])
+        return web.json_response({'id': int(request.match_info['movie_id']), 'runtime': 100, 'genres': [],
+                                  'credits': {'crew': []}, 'videos': {'results': []}})
+
+    app = web.Application()
+    app.router.add_post('/v1/chat/completions', chat)
+    app.router.add_get('/3/search/movie', search)
+    app.router.add_get('/3/movie/{movie_id}', details)
+    return app
+
+
+class PooledWSGIServer(WSGIServer):
+    """A WSGI server handling requests on a fixed number of threads."""
+
+    def __init__(self, address, threads):
+        super().__init__(address, QuietHandler)
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def serve(role, port, threads):
+    if role == 'sync':
+        from api.index import MovieRecommenderApp
+        server = PooledWSGIServer(('127.0.0.1', port), threads)
+        server.set_app(MovieRecommenderApp().app)
+        server.serve_forever()
+    else:
+        from api.async_app import AsyncMovieRecommenderApp
+        web.run_app(AsyncMovieRecommenderApp().web, host='127.0.0.1', port=port, print=None, access_log=None)
+
+
+async def wait_ready(url, timeout=180):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(f'{url}/stats') as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.5)
+    raise TimeoutError(f"{url} did not start within {timeout}s")
+
+
+async def load(url, concurrency, duration, number):
+    """Keep concurrency genre page requests in flight for duration seconds."""
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async def client(session, i):
+        nonlocal errors
+        for request_id in itertools.count():
+            if time.monotonic() >= deadline:
+                return
+            data = {'category': GENRES[(i + request_id) % len(GENRES)], 'number': str(number)}
+            start = time.monotonic()
+            try:
+                async with session.post(f'{url}/genre_based', data=data) as response:
+                    await response.read()
+                    ok = response.status == 200
+            except aiohttp.ClientError:
+                ok = False
+            if ok:
+                latencies.append(time.monotonic() - start)
+            else:
+                errors += 1
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=60)) as session:
+        start = time.monotonic()
+        await asyncio.gather(*(client(session, i) for i in range(concurrency)))
+        elapsed = time.monotonic() - start
+    latencies.sort()
+    percentile = lambda q: latencies[int(q * (len(latencies) - 1))] * 1e3 if latencies else float('nan')
+    return len(latencies) / elapsed, percentile(0.5), percentile(0.95), errors
+
+
+def run_server(role, port, env, threads):
+    return subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.bench_async_serving', '--role', role, '--port', str(port),
+         '--threads', str(threads)],
+        env=env, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--role', choices=['bench', 'stubs', 'sync', 'async'], default='bench')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--threads', type=int, default=8, help='Threads of the threaded worker')
+    parser.add_argument('--concurrency', type=int, default=64, help='Requests kept in flight')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--number', type=int, default=5, help='Movies per page')
+    parser.add_argument('--openai-latency', type=float, default=0.4)
+    parser.add_argument('--tmdb-latency', type=float, default=0.05)
+    args = parser.parse_args()
+
+    if args.role == 'stubs':
+        latency = {'openai': args.openai_latency, 'tmdb': args.tmdb_latency}
+        web.run_app(stub_upstreams(latency, args.number), host='127.0.0.1', port=args.port, print=None, access_log=None)
+    elif args.role in ('sync', 'async'):
+        serve(args.role, args.port, args.threads)
+    else:
+        stub_port, app_port = args.port + 1, args.port
+        stubs = subprocess.Popen(
+            [sys.executable, '-m', 'benchmarks.bench_async_serving', '--role', 'stubs', '--port', str(stub_port),
+             '--number', str(args.number), '--openai-latency', str(args.openai_latency),
+             '--tmdb-latency', str(args.tmdb_latency)],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        )
+        print(f"upstream latency: openai {args.openai_latency * 1e3:.0f} ms, tmdb {args.tmdb_latency * 1e3:.0f} ms; "
+              f"{args.concurrency} requests in flight for {args.duration:.0f}s")
+        print(f"{'worker':>22} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+        try:
+            for role in ('sync', 'async'):
+                with tempfile.TemporaryDirectory() as tmp_dir:
+                    env = dict(
+                        os.environ,
+                        OPENAI_API_KEY='bench', OPENAI_BASE_URL=f'http://127.0.0.1:{stub_port}/v1',
+                        TMDB_API_KEY='bench', TMDB_API_URL=f'http://127.0.0.1:{stub_port}/3',
+                        METADATA_CACHE=os.path.join(tmp_dir, 'cache.sqlite'), LIST_SNAPSHOT_INTERVAL='0',
+                        TMDB_LOOKUP_WORKERS=str(args.threads), TMDB_MAX_CONCURRENCY='512',
+                        TMDB_RATE_LIMIT='100000', OPENAI_MAX_CONCURRENCY='512', OPENAI_RATE_LIMIT='100000',
+                    )
+                    server = run_server(role, app_port, env, args.threads)
+                    try:
+                        url = f'http://127.0.0.1:{app_port}'
+                        asyncio.run(wait_ready(url))
+                        rps, p50, p95, errors = asyncio.run(load(url, args.concurrency, args.duration, args.number))
+                    finally:
+                        server.terminate()
+                        server.wait()
+                label = f'threaded ({args.threads} threads)' if role == 'sync' else 'async (event loop)'
+                print(f"{label:>22} {rps:>8.1f} {p50:>8.0f} {p95:>8.0f} {errors:>7}")
+        finally:
+            stubs.terminate()
+            stubs.wait()
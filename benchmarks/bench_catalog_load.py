@@ -0,0 +1,48 @@
+"""
+Compare startup cost of the CSV catalog with Parquet and Feather copies of
+it: file size, time to read every column, time to read only the serving
+columns a recommender opened from an artifact needs, and time to fit a
+ContentRecommender.
+
+    python -m benchmarks.bench_catalog_load data/filtered_movies_data.csv --repeat 5
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.catalog_io import SERVING_COLUMNS, read_catalog, write_catalog
+from src.content_recommender import ContentRecommender
+
+
+def best_of(repeat, fn):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1e3
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('csv_path')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        catalog = read_catalog(args.csv_path)
+        paths = {'csv': args.csv_path}
+        for fmt, extension in [('parquet', '.parquet'), ('feather', '.feather')]:
+            paths[fmt] = os.path.join(tmp_dir, f'catalog{extension}')
+            write_catalog(catalog, paths[fmt])
+
+        print(f"{'format':>8} {'MB':>6} {'all cols ms':>12} {'serving ms':>11} {'fit ms':>8}")
+        for fmt, path in paths.items():
+            size = os.path.getsize(path) / 2**20
+            full_ms = best_of(args.repeat, lambda: read_catalog(path))
+            serving_ms = best_of(args.repeat, lambda: read_catalog(path, columns=SERVING_COLUMNS))
+            fit_ms = best_of(1, lambda: ContentRecommender(path, mode='topk'))
+            print(f"{fmt:>8} {size:>6.1f} {full_ms:>12.1f} {serving_ms:>11.1f} {fit_ms:>8.0f}")
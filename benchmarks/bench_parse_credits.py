@@ -0,0 +1,91 @@
+"""
+Compare the JSON column parsing in process_data with the previous
+ast.literal_eval + DataFrame.apply implementation, and check that the
+output is identical. Without a credits file, a synthetic one with TMDB
+5000-sized cast and crew blobs is generated.
+
+    python -m benchmarks.bench_parse_credits --credits data/tmdb_5000_credits.csv --movies data/tmdb_5000_movies.csv --jobs 1 4
+"""
+import argparse
+import ast
+import json
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.process_data import parse_json_columns
+
+
+def legacy_convert(text):
+    return ' '.join(i['name'] for i in ast.literal_eval(text))
+
+
+def legacy_convert3(text):
+    return [i['name'] for i in ast.literal_eval(text)[:3]]
+
+
+def legacy_fetch_director(text):
+    return [i['name'] for i in ast.literal_eval(text) if i['job'] == 'Director']
+
+
+def legacy_parse(df):
+    return {
+        'genres': df['genres'].apply(legacy_convert).tolist(),
+        'keywords': df['keywords'].apply(legacy_convert).tolist(),
+        'cast': df['cast'].apply(legacy_convert3).tolist(),
+        'crew': df['crew'].apply(legacy_fetch_director).tolist(),
+    }
+
+
+def synthetic_frame(n_rows, seed=0):
+    rng = random.Random(seed)
+    names = ['Zoë Saldaña', 'Sam Worthington', "Conan O'Brien", 'Jean "Johnny" Doe', 'Ridley Scott',
+             'Kathryn Bigelow', 'Bong Joon-ho', 'Agnès Varda', 'Hayao Miyazaki', 'Greta {G} Gerwig']
+    jobs = ['Director', 'Editor', 'Producer', 'Screenplay', 'Casting', 'Original Music Composer']
+
+    def person(i, extra):
+        return dict(extra, credit_id=f'{rng.getrandbits(48):012x}', gender=rng.randint(0, 2),
+                    id=rng.randint(1, 10**6), name=rng.choice(names))
+
+    rows = []
+    for _ in range(n_rows):
+        cast = [dict({'cast_id': i, 'character': rng.choice(['Jake', 'Neytiri {the hunter}', 'Dr. "Doc" Brown'])},
+                     **person(i, {}), order=i) for i in range(rng.randint(0, 80))]
+        crew = [person(i, {'department': 'Crew', 'job': rng.choice(jobs)}) for i in range(rng.randint(0, 120))]
+        genres = [{'id': i, 'name': name} for i, name in enumerate(rng.sample(['Action', 'Drama', 'Science Fiction'], 2))]
+        keywords = [{'id': i, 'name': f'keyword {i}'} for i in range(rng.randint(0, 20))]
+        rows.append({'genres': json.dumps(genres), 'keywords': json.dumps(keywords),
+                     'cast': json.dumps(cast), 'crew': json.dumps(crew)})
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--credits')
+    parser.add_argument('--movies')
+    parser.add_argument('--rows', type=int, default=4803)
+    parser.add_argument('--jobs', type=int, nargs='+', default=[1])
+    args = parser.parse_args()
+
+    if args.credits and args.movies:
+        df = pd.read_csv(args.movies).merge(pd.read_csv(args.credits), left_on='id', right_on='movie_id')
+        df = df.rename(columns={'title_x': 'title'})
+    else:
+        df = synthetic_frame(args.rows)
+    print(f"{len(df):,} rows, {df['crew'].str.len().sum() / 2**20:.1f} MB of crew JSON")
+
+    start = time.perf_counter()
+    expected = legacy_parse(df)
+    legacy_seconds = time.perf_counter() - start
+    print(f"{'parser':>16} {'seconds':>8} {'speed-up':>9} {'identical':>10}")
+    print(f"{'literal_eval':>16} {legacy_seconds:>8.2f} {1:>8.1f}x {'-':>10}")
+
+    for n_jobs in args.jobs:
+        start = time.perf_counter()
+        actual = parse_json_columns(df, n_jobs=n_jobs)
+        seconds = time.perf_counter() - start
+        print(f"{f'json n_jobs={n_jobs}':>16} {seconds:>8.2f} {legacy_seconds / seconds:>8.1f}x {str(actual == expected):>10}")
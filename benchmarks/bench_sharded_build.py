@@ -0,0 +1,42 @@
+"""
+Time the top-k neighbour build with a growing number of worker processes
+and check that every sharded table matches the single-process one. The
+catalog can be tiled to simulate a larger one.
+
+    python -m benchmarks.bench_sharded_build data/filtered_movies_data.csv --jobs 1 2 4 8 --tile 4
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from scipy import sparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.content_recommender import ContentRecommender
+from src.similarity import compute_topk_neighbors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('csv_path')
+    parser.add_argument('--jobs', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--tile', type=int, default=1, help="Repeat the catalog this many times")
+    parser.add_argument('--k', type=int, default=51)
+    args = parser.parse_args()
+
+    tfidf_matrix = ContentRecommender(args.csv_path, mode='embedding', n_components=2).tfidf_matrix
+    tfidf_matrix = sparse.vstack([tfidf_matrix] * args.tile).tocsr()
+    print(f"{tfidf_matrix.shape[0]:,} rows, k={args.k}")
+
+    reference = None
+    print(f"{'n_jobs':>6} {'seconds':>8} {'speed-up':>9} {'identical':>10}")
+    for n_jobs in args.jobs:
+        start = time.perf_counter()
+        table = compute_topk_neighbors(tfidf_matrix, args.k, n_jobs=n_jobs)
+        elapsed = time.perf_counter() - start
+        if reference is None:
+            reference, baseline = table, elapsed
+        identical = np.array_equal(table.indices, reference.indices) and np.array_equal(table.scores, reference.scores)
+        print(f"{n_jobs:>6} {elapsed:>8.2f} {baseline / elapsed:>8.2f}x {str(identical):>10}")
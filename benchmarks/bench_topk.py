@@ -0,0 +1,37 @@
+"""
+Compare the old sort-everything ranking in get_recommendations with the
+partial-selection ranking on random score rows of growing catalog size.
+
+    python -m benchmarks.bench_topk
+"""
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.similarity import top_k_indices
+
+
+def sorted_ranking(row, k):
+    sim_scores = list(enumerate(row))
+    sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
+    return [i[0] for i in sim_scores[1:k + 1]]
+
+
+def partial_ranking(row, k, seed):
+    return top_k_indices(row, k, exclude=seed)
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    k = 10
+    print(f"{'catalog size':>12} {'sorted (ms)':>12} {'partial (ms)':>13} {'speed-up':>9}")
+    for n in (5_000, 50_000, 500_000, 2_000_000):
+        row = rng.random(n)
+        row[0] = 1.0
+        repeat = max(1, 200_000 // n)
+        sorted_ms = min(timeit.repeat(lambda: sorted_ranking(row, k), number=repeat, repeat=3)) / repeat * 1e3
+        partial_ms = min(timeit.repeat(lambda: partial_ranking(row, k, 0), number=repeat, repeat=3)) / repeat * 1e3
+        print(f"{n:>12,} {sorted_ms:>12.2f} {partial_ms:>13.3f} {sorted_ms / partial_ms:>8.0f}x")
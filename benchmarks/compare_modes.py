@@ -0,0 +1,58 @@
+"""
+Compare a ContentRecommender mode against the exact sparse/dense path:
+recommendation overlap@k, per-query latency and the size of the model
+arrays each mode keeps in memory.
+
+    python -m benchmarks.compare_modes data/filtered_movies_data.csv --mode embedding --n-components 128
+"""
+import argparse
+from collections import Counter
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.content_recommender import ContentRecommender
+
+
+def model_bytes(recommender):
+    arrays = [recommender.cosine_sim, recommender.embeddings, recommender.svd_components]
+    if recommender.neighbors is not None:
+        arrays += [recommender.neighbors.indices, recommender.neighbors.scores]
+    if recommender.ann_index is not None:
+        arrays += list(recommender.ann_index.to_arrays().values())
+    if recommender.mode in ('topk', 'ann'):
+        tfidf = recommender.tfidf_matrix
+        arrays += [tfidf.data, tfidf.indices, tfidf.indptr]
+    return sum(array.nbytes for array in arrays if array is not None)
+
+
+def time_queries(recommender, titles, k):
+    start = time.perf_counter()
+    results = [recommender.get_recommendations(title, k) for title in titles]
+    return results, (time.perf_counter() - start) / len(titles) * 1e3
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('csv_path')
+    parser.add_argument('--mode', default='embedding', choices=['topk', 'ann', 'embedding'])
+    parser.add_argument('--n-components', type=int, default=256)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--n-queries', type=int, default=500)
+    args = parser.parse_args()
+
+    baseline = ContentRecommender(args.csv_path)
+    candidate = ContentRecommender(args.csv_path, mode=args.mode, n_components=args.n_components)
+
+    titles = baseline.movies_df['title'].drop_duplicates()
+    titles = titles.sample(min(args.n_queries, len(titles)), random_state=0).tolist()
+    expected, baseline_ms = time_queries(baseline, titles, args.k)
+    actual, candidate_ms = time_queries(candidate, titles, args.k)
+    overlap = np.mean([sum((Counter(a) & Counter(e)).values()) / args.k for a, e in zip(actual, expected)])
+
+    print(f"{'mode':>10} {'overlap@' + str(args.k):>11} {'ms/query':>9} {'model MB':>9}")
+    print(f"{'dense':>10} {1.0:>11.3f} {baseline_ms:>9.3f} {model_bytes(baseline) / 2**20:>9.1f}")
+    print(f"{args.mode:>10} {overlap:>11.3f} {candidate_ms:>9.3f} {model_bytes(candidate) / 2**20:>9.1f}")
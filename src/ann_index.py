@@ -0,0 +1,292 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+from scipy import sparse
+from sklearn.utils.extmath import randomized_svd
+
+from src.similarity import top_k_rows
+
+
+def nearest_centroids(vectors, centroids, block_size=8192):
+    """
+    Index of the most similar centroid for each row, scoring block_size rows
+    at a time so the score matrix never holds more than one block.
+    :param vectors: L2-normalized rows
+    :param centroids: L2-normalized centroids
+    :return: int64 array with one list id per row
+    """
+    return np.concatenate([
+        np.argmax(vectors[start:start + block_size] @ centroids.T, axis=1)
+        for start in range(0, len(vectors), block_size)
+    ] or [np.empty(0, dtype=np.int64)]).astype(np.int64)
+
+
+def cluster_sums(vectors, assignments, n_lists):
+    """
+    Sum of the rows assigned to each list, as one sparse indicator product.
+    :return: Array of shape (n_lists, n_components)
+    """
+    indicator = sparse.csr_matrix(
+        (np.ones(len(assignments), dtype=vectors.dtype), (assignments, np.arange(len(assignments)))),
+        shape=(n_lists, len(vectors)),
+    )
+    return np.asarray(indicator @ vectors)
+
+
+class IVFIndex:
+    """
+    Approximate nearest-neighbour index for TF-IDF rows.
+    Rows are reduced with a truncated SVD fitted on a sample, clustered with
+    spherical k-means, and stored in inverted lists. A query scans only the
+    n_probe lists whose centroids are closest to it and, when the TF-IDF
+    matrix is attached, re-ranks those candidates with exact cosine scores.
+    """
+
+    def __init__(self, n_components=128, n_lists=None, n_probe=8, rerank=True,
+                 n_iter=10, train_size=None, seed=0):
+        """
+        :param n_components: Dimension of the reduced space
+        :param n_lists: Number of inverted lists, defaults to 4 * sqrt(n_movies)
+        :param n_probe: Lists scanned per query; higher means better recall, slower queries
+        :param rerank: Re-score candidates with exact TF-IDF cosine when available
+        :param n_iter: k-means iterations
+        :param train_size: Rows sampled to train the projection and centroids,
+                           defaults to 64 per list
+        :param seed: Random seed for the projection and k-means
+        """
+        self.n_components = n_components
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.rerank = rerank
+        self.n_iter = n_iter
+        self.train_size = train_size
+        self.seed = seed
+        self.tfidf_matrix = None
+
+    def project(self, rows):
+        """
+        Map TF-IDF rows into the reduced, L2-normalized space.
+        :param rows: Sparse matrix with the same columns as the fitted TF-IDF matrix
+        :return: float32 array of shape (n_rows, n_components)
+        """
+        reduced = np.asarray(rows @ self.projection, dtype=np.float32)
+        norms = np.linalg.norm(reduced, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return reduced / norms
+
+    def fit(self, tfidf_matrix, block_size=8192):
+        """
+        Build the projection, centroids and inverted lists.
+        :param tfidf_matrix: Sparse TF-IDF matrix, one row per movie
+        :param block_size: Rows projected and assigned at once
+        :return: self
+        """
+        rng = np.random.default_rng(self.seed)
+        n_movies, n_features = tfidf_matrix.shape
+        n_lists = self.n_lists or max(1, int(4 * np.sqrt(n_movies)))
+        n_lists = min(n_lists, n_movies)
+
+        train_size = min(n_movies, self.train_size or 64 * n_lists)
+        train_rows = np.sort(rng.choice(n_movies, train_size, replace=False))
+        n_components = min(self.n_components, train_size - 1, n_features - 1)
+        _, _, components = randomized_svd(
+            tfidf_matrix[train_rows], n_components, random_state=self.seed
+        )
+        self.projection = np.ascontiguousarray(components.T, dtype=np.float32)
+        self.vectors = np.vstack([
+            self.project(tfidf_matrix[start:start + block_size])
+            for start in range(0, n_movies, block_size)
+        ])
+
+        sample = self.vectors[train_rows]
+        centroids = sample[rng.choice(train_size, n_lists, replace=False)].copy()
+        for _ in range(self.n_iter):
+            assignments = nearest_centroids(sample, centroids, block_size)
+            sums = cluster_sums(sample, assignments, n_lists)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # Lists that lost all their members keep their previous centroid
+            centroids = np.where(norms > 0, sums / np.where(norms > 0, norms, 1), centroids)
+        self.centroids = centroids.astype(np.float32)
+
+        assignments = nearest_centroids(self.vectors, self.centroids, block_size)
+        self.list_members = np.argsort(assignments, kind='stable').astype(np.int64)
+        self.list_offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(assignments, minlength=len(self.centroids)))]
+        ).astype(np.int64)
+        self.tfidf_matrix = tfidf_matrix
+        return self
+
+    def candidates(self, query_vector, n_probe=None, min_candidates=0):
+        """
+        Rows of the n_probe lists closest to the query, widened to further
+        lists in order of closeness until they hold at least min_candidates rows.
+        """
+        n_probe = min(n_probe or self.n_probe, len(self.centroids))
+        similarity = self.centroids @ query_vector
+        lists = np.argpartition(-similarity, n_probe - 1)[:n_probe]
+        sizes = np.diff(self.list_offsets)
+        if sizes[lists].sum() < min_candidates:
+            order = np.argsort(-similarity, kind='stable')
+            lists = order[:max(n_probe, int(np.searchsorted(np.cumsum(sizes[order]), min_candidates)) + 1)]
+        return np.concatenate([
+            self.list_members[self.list_offsets[i]:self.list_offsets[i + 1]] for i in lists
+        ])
+
+    def search(self, query_row, k, exclude=None, n_probe=None):
+        """
+        Find approximate nearest neighbours of one TF-IDF row.
+        :param query_row: Sparse 1 x n_features TF-IDF row
+        :param k: Number of neighbours
+        :param exclude: Optional row id or ids to leave out, usually the query itself
+        :param n_probe: Override the number of lists scanned; more are scanned when
+                        the probed lists hold fewer than k rows besides the excluded ones
+        :return: Tuple of (indices, scores), best first; fewer than k only when the index is smaller
+        """
+        query_vector = self.project(query_row)[0]
+        candidates = self.candidates(query_vector, n_probe, min_candidates=k + np.size(exclude))
+        if exclude is not None:
+            candidates = candidates[~np.isin(candidates, exclude)]
+        if self.rerank and self.tfidf_matrix is not None:
+            scores = np.asarray((self.tfidf_matrix[candidates] @ query_row.T).todense()).ravel()
+        else:
+            scores = self.vectors[candidates] @ query_vector
+        order, selected = top_k_rows(scores[np.newaxis], k)
+        return candidates[order[0]], selected[0]
+
+    def add(self, tfidf_rows, tfidf_matrix):
+        """
+        Append new rows to the nearest existing lists without retraining centroids.
+        :param tfidf_rows: Sparse TF-IDF rows of the new movies
+        :param tfidf_matrix: Full TF-IDF matrix including the new rows
+        """
+        vectors = self.project(tfidf_rows)
+        n_old = len(self.vectors)
+        old_assignments = np.empty(n_old, dtype=np.int64)
+        old_assignments[self.list_members] = np.repeat(
+            np.arange(len(self.centroids)), np.diff(self.list_offsets)
+        )
+        assignments = np.concatenate([old_assignments, nearest_centroids(vectors, self.centroids)])
+
+        self.vectors = np.vstack([self.vectors, vectors])
+        self.list_members = np.argsort(assignments, kind='stable').astype(np.int64)
+        self.list_offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(assignments, minlength=len(self.centroids)))]
+        ).astype(np.int64)
+        self.tfidf_matrix = tfidf_matrix
+
+    def to_arrays(self):
+        return {
+            'ann_projection': self.projection,
+            'ann_vectors': self.vectors,
+            'ann_centroids': self.centroids,
+            'ann_list_members': self.list_members,
+            'ann_list_offsets': self.list_offsets,
+        }
+
+    def params(self):
+        return {
+            'n_components': self.n_components,
+            'n_lists': self.n_lists,
+            'n_probe': self.n_probe,
+            'rerank': self.rerank,
+            'n_iter': self.n_iter,
+            'train_size': self.train_size,
+            'seed': self.seed,
+        }
+
+    @classmethod
+    def from_arrays(cls, params, arrays, tfidf_matrix=None):
+        index = cls(**params)
+        index.projection = arrays['ann_projection']
+        index.vectors = arrays['ann_vectors']
+        index.centroids = arrays['ann_centroids']
+        index.list_members = arrays['ann_list_members']
+        index.list_offsets = arrays['ann_list_offsets']
+        index.tfidf_matrix = tfidf_matrix
+        return index
+
+    def save(self, path):
+        """
+        Save the index to a directory of .npy files.
+        :param path: Destination directory
+        """
+        os.makedirs(path, exist_ok=True)
+        for name, array in self.to_arrays().items():
+            np.save(os.path.join(path, f'{name}.npy'), array)
+        with open(os.path.join(path, 'ann_params.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.params(), f, indent=2)
+
+    @classmethod
+    def load(cls, path, tfidf_matrix=None, mmap_mode='r'):
+        """
+        Load an index written by save.
+        :param path: Directory written by save
+        :param tfidf_matrix: TF-IDF matrix to re-rank against, optional
+        :return: IVFIndex
+        """
+        with open(os.path.join(path, 'ann_params.json'), encoding='utf-8') as f:
+            params = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode)
+            for name in ('ann_projection', 'ann_vectors', 'ann_centroids', 'ann_list_members', 'ann_list_offsets')
+        }
+        return cls.from_arrays(params, arrays, tfidf_matrix)
+
+
+def recall_report(index, tfidf_matrix, k=10, n_queries=200, n_probes=(1, 4, 16, 64, 256), seed=0):
+    """
+    Measure recall@k and query latency of the index against exact cosine search.
+    :param index: Fitted IVFIndex
+    :param tfidf_matrix: TF-IDF matrix the index was built from
+    :param k: Neighbours compared per query
+    :param n_queries: Number of catalog rows used as queries
+    :param n_probes: n_probe values to report
+    :return: List of dicts with n_probe, recall and mean latency in milliseconds
+    """
+    rng = np.random.default_rng(seed)
+    queries = rng.choice(tfidf_matrix.shape[0], min(n_queries, tfidf_matrix.shape[0]), replace=False)
+
+    exact = {}
+    for query in queries:
+        scores = np.asarray((tfidf_matrix @ tfidf_matrix[query].T).todense()).ravel()
+        scores[query] = -np.inf
+        exact[query] = set(top_k_rows(scores[np.newaxis], k)[0][0].tolist())
+
+    report = []
+    for n_probe in n_probes:
+        hits = 0
+        start = time.perf_counter()
+        for query in queries:
+            found, _ = index.search(tfidf_matrix[query], k, exclude=query, n_probe=n_probe)
+            hits += len(exact[query].intersection(found.tolist()))
+        elapsed = time.perf_counter() - start
+        report.append({
+            'n_probe': n_probe,
+            'recall': hits / (k * len(queries)),
+            'latency_ms': elapsed / len(queries) * 1e3,
+        })
+    return report
+
+
+if __name__ == "__main__":
+    from src.content_recommender import ContentRecommender
+
+    parser = argparse.ArgumentParser(description="Report IVF recall@k against exact search")
+    parser.add_argument('csv_path', help="Filtered movies CSV")
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--n-lists', type=int, default=None)
+    parser.add_argument('--n-components', type=int, default=128)
+    parser.add_argument('--no-rerank', action='store_true')
+    args = parser.parse_args()
+
+    recommender = ContentRecommender(args.csv_path, mode='ann', ann_params={
+        'n_lists': args.n_lists,
+        'n_components': args.n_components,
+        'rerank': not args.no_rerank,
+    })
+    print(f"{'n_probe':>8} {'recall@' + str(args.k):>10} {'ms/query':>9}")
+    for row in recall_report(recommender.ann_index, recommender.tfidf_matrix, k=args.k):
+        print(f"{row['n_probe']:>8} {row['recall']:>10.3f} {row['latency_ms']:>9.3f}")
@@ -0,0 +1,126 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# TMDB genre names; the filtered catalog stores them space-joined, so
+# multi-word names have to be matched before single words.
+KNOWN_GENRES = [
+    'Action', 'Adventure', 'Animation', 'Comedy', 'Crime', 'Documentary', 'Drama', 'Family',
+    'Fantasy', 'Foreign', 'History', 'Horror', 'Music', 'Mystery', 'Romance', 'Science Fiction',
+    'TV Movie', 'Thriller', 'War', 'Western',
+]
+_GENRE_PATTERN = re.compile(
+    '|'.join(re.escape(genre) for genre in sorted(KNOWN_GENRES, key=len, reverse=True)) + r'|\S+'
+)
+
+RANGE_COLUMNS = {
+    'year': 'release_year',
+    'rating': 'vote_average',
+    'votes': 'vote_count',
+    'popularity': 'popularity',
+}
+
+
+def parse_genres(genres):
+    """
+    Split a space-joined genre string into genre names.
+    :param genres: e.g. 'Action Science Fiction'
+    :return: List of genre names, e.g. ['Action', 'Science Fiction']
+    """
+    if not isinstance(genres, str):
+        return []
+    return _GENRE_PATTERN.findall(genres)
+
+
+class AttributeIndex:
+    """
+    Precomputed indexes over catalog attributes: one packed bitset per genre
+    and a sorted copy of each numeric column for range queries. mask()
+    combines them into a boolean row mask for filtered recommendations.
+    """
+
+    def __init__(self, movies_df):
+        """
+        :param movies_df: Catalog DataFrame with genres, release_date, vote_average,
+                          vote_count and popularity columns
+        """
+        self.n_movies = len(movies_df)
+
+        genre_rows = {}
+        for row, genres in enumerate(movies_df['genres']):
+            for genre in parse_genres(genres):
+                genre_rows.setdefault(genre.lower(), []).append(row)
+        self.genre_bits = {}
+        for genre, rows in genre_rows.items():
+            bits = np.zeros(self.n_movies, dtype=bool)
+            bits[rows] = True
+            self.genre_bits[genre] = np.packbits(bits)
+
+        columns = {
+            'release_year': pd.to_datetime(movies_df['release_date'], errors='coerce').dt.year,
+            'vote_average': movies_df['vote_average'],
+            'vote_count': movies_df['vote_count'],
+            'popularity': movies_df['popularity'],
+        }
+        self.sorted_rows = {}
+        self.sorted_values = {}
+        for name, values in columns.items():
+            values = pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64)
+            # Missing values sort last and never satisfy a range
+            order = np.argsort(values, kind='stable')
+            self.sorted_rows[name] = order
+            self.sorted_values[name] = values[order]
+
+    @property
+    def genres(self):
+        return sorted(self.genre_bits)
+
+    def range_mask(self, column, low=None, high=None):
+        """
+        Rows whose value lies in [low, high], found by binary search on the sorted column.
+        :param column: release_year, vote_average, vote_count or popularity
+        :return: Boolean array
+        """
+        values = self.sorted_values[column]
+        start = 0 if low is None else np.searchsorted(values, low, side='left')
+        stop = np.searchsorted(values, np.inf, side='right') if high is None else np.searchsorted(values, high, side='right')
+        mask = np.zeros(self.n_movies, dtype=bool)
+        mask[self.sorted_rows[column][start:stop]] = True
+        return mask
+
+    def mask(self, genres=None, any_genres=None, exclude_genres=None, min_year=None, max_year=None,
+             min_rating=None, max_rating=None, min_votes=None, max_votes=None,
+             min_popularity=None, max_popularity=None):
+        """
+        Build the row mask for a set of filter predicates. Bounds are inclusive.
+        :param genres: Genres a movie must all have
+        :param any_genres: Genres of which a movie must have at least one
+        :param exclude_genres: Genres a movie must not have
+        :return: Boolean array, True for rows that pass every predicate
+        """
+        n_bytes = (self.n_movies + 7) // 8
+        bits = np.full(n_bytes, 0xFF, dtype=np.uint8)
+        empty = np.zeros(n_bytes, dtype=np.uint8)
+
+        for genre in genres or []:
+            bits &= self.genre_bits.get(genre.lower(), empty)
+        if any_genres:
+            union = empty.copy()
+            for genre in any_genres:
+                union |= self.genre_bits.get(genre.lower(), empty)
+            bits &= union
+        for genre in exclude_genres or []:
+            bits &= ~self.genre_bits.get(genre.lower(), empty)
+        mask = np.unpackbits(bits, count=self.n_movies).astype(bool)
+
+        bounds = {
+            'year': (min_year, max_year),
+            'rating': (min_rating, max_rating),
+            'votes': (min_votes, max_votes),
+            'popularity': (min_popularity, max_popularity),
+        }
+        for name, (low, high) in bounds.items():
+            if low is not None or high is not None:
+                mask &= self.range_mask(RANGE_COLUMNS[name], low, high)
+        return mask
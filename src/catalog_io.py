@@ -0,0 +1,208 @@
+import argparse
+import ast
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+CATALOG_COLUMNS = ['movie_id', 'title', 'overview', 'genres', 'keywords',
+                   'vote_average', 'vote_count', 'popularity',
+                   'release_date', 'cast', 'crew']
+# Columns only needed to fit TF-IDF; a recommender opened from an artifact can skip them
+FEATURE_COLUMNS = ['overview', 'keywords', 'cast', 'crew']
+SERVING_COLUMNS = [column for column in CATALOG_COLUMNS if column not in FEATURE_COLUMNS]
+LIST_COLUMNS = ['cast', 'crew']
+
+
+def catalog_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ('movie_id', pa.int64()),
+        ('title', pa.string()),
+        ('overview', pa.string()),
+        ('genres', pa.string()),
+        ('keywords', pa.string()),
+        ('vote_average', pa.float64()),
+        ('vote_count', pa.int64()),
+        ('popularity', pa.float64()),
+        ('release_date', pa.string()),
+        ('cast', pa.list_(pa.string())),
+        ('crew', pa.list_(pa.string())),
+    ])
+
+
+def catalog_format(path):
+    """
+    Infer the storage format from a file extension.
+    :param path: Catalog path
+    :return: 'parquet', 'feather' or 'csv'
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.parquet', '.pq'):
+        return 'parquet'
+    if extension in ('.feather', '.arrow'):
+        return 'feather'
+    return 'csv'
+
+
+def as_list(value):
+    """Turn a list column value (list, array or its Python repr) into a list."""
+    if isinstance(value, str):
+        return list(ast.literal_eval(value))
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return list(value)
+    return []
+
+
+def read_catalog(path, columns=None):
+    """
+    Read a filtered movies catalog, loading only the requested columns.
+    Feather files are memory-mapped, so numeric columns are not copied on read.
+    In CSV catalogs cast and crew stay in their written string form.
+    :param path: .parquet, .feather/.arrow or .csv file
+    :param columns: Columns to load, defaults to all
+    :return: DataFrame
+    """
+    fmt = catalog_format(path)
+    if fmt == 'parquet':
+        return pd.read_parquet(path, columns=columns)
+    if fmt == 'feather':
+        from pyarrow import feather
+
+        return feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+    return pd.read_csv(path, usecols=columns)
+
+
+def iter_catalog(path, chunksize=10000, columns=None):
+    """
+    Read a catalog in chunks without loading it whole.
+    :param path: .parquet, .feather/.arrow or .csv file
+    :param chunksize: Rows per chunk
+    :param columns: Columns to load, defaults to all
+    :return: Generator of DataFrames
+    """
+    fmt = catalog_format(path)
+    if fmt == 'parquet':
+        from pyarrow import parquet
+
+        for batch in parquet.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    elif fmt == 'feather':
+        from pyarrow import feather
+
+        table = feather.read_table(path, columns=columns, memory_map=True)
+        for batch in table.to_batches(max_chunksize=chunksize):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunksize)
+
+
+class CatalogWriter:
+    """
+    Append DataFrame chunks to a catalog file. Columnar formats keep cast and
+    crew as list columns; CSV writes them as Python list reprs like before.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.format = catalog_format(path)
+        self.rows = 0
+        self._file = None
+        self._writer = None
+        self._schema = None
+
+    def write(self, chunk):
+        if len(chunk) == 0:
+            return
+        chunk = chunk[CATALOG_COLUMNS]
+        if self.format == 'csv':
+            if self._file is None:
+                self._file = open(self.path, 'w', newline='', encoding='utf-8')
+                chunk.iloc[:0].to_csv(self._file, index=False)
+            chunk.to_csv(self._file, index=False, header=False)
+        else:
+            import pyarrow as pa
+
+            chunk = chunk.copy()
+            for column in LIST_COLUMNS:
+                chunk[column] = [as_list(value) for value in chunk[column]]
+            self._open_writer()
+            table = pa.Table.from_pandas(chunk, schema=self._schema, preserve_index=False)
+            self._writer.write_table(table)
+        self.rows += len(chunk)
+
+    def _open_writer(self):
+        if self._writer is not None:
+            return
+        import pyarrow as pa
+
+        self._schema = catalog_schema()
+        if self.format == 'parquet':
+            from pyarrow import parquet
+
+            self._writer = parquet.ParquetWriter(self.path, self._schema)
+        else:
+            self._writer = pa.ipc.new_file(self.path, self._schema)
+
+    def close(self):
+        # Still produce a valid, empty catalog when nothing was written
+        if self.format == 'csv' and self._file is None:
+            self._file = open(self.path, 'w', newline='', encoding='utf-8')
+            pd.DataFrame(columns=CATALOG_COLUMNS).to_csv(self._file, index=False)
+        elif self.format != 'csv':
+            self._open_writer()
+        if self._writer is not None:
+            self._writer.close()
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_catalog(movies_df, path):
+    """
+    Write a filtered movies catalog in the format given by the path's extension.
+    :param movies_df: DataFrame with CATALOG_COLUMNS
+    :param path: Destination file
+    """
+    with CatalogWriter(path) as writer:
+        writer.write(movies_df)
+
+
+def change_set_paths(output_path):
+    """
+    Files a refresh of output_path writes its change set to: a catalog of
+    the new and updated movies in the output's format, and a JSON summary.
+    :param output_path: Catalog being refreshed
+    :return: Tuple of (upserts path, summary path)
+    """
+    root, extension = os.path.splitext(output_path)
+    return f'{root}.changes{extension}', f'{root}.changes.json'
+
+
+def read_change_set(summary_path):
+    """
+    Load a change set written by process_data.refresh_filtered_data.
+    :param summary_path: The change set's JSON summary
+    :return: Tuple of (summary dict, DataFrame of new and updated movies)
+    """
+    with open(summary_path, encoding='utf-8') as f:
+        summary = json.load(f)
+    upserts_path = os.path.join(os.path.dirname(summary_path), summary['upserts'])
+    return summary, read_catalog(upserts_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a filtered movies catalog between formats")
+    parser.add_argument('source', help="Existing catalog (.csv, .parquet or .feather)")
+    parser.add_argument('destination', help="Output catalog; the extension selects the format")
+    args = parser.parse_args()
+
+    write_catalog(read_catalog(args.source), args.destination)
+    print(f"Catalog written to {args.destination}")
@@ -1,42 +1,503 @@
+import numpy as np
 import pandas as pd
+from scipy import sparse
+from sklearn.decomposition import TruncatedSVD
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 import ast
+import copy
+
+from src.similarity import (
+    NeighborTable, compute_neighbor_rows, compute_topk_neighbors, top_k_indices, top_k_rows
+)
+from src.model_artifact import ArtifactMismatchError, load_artifact
+from src.title_index import TitleIndex
+from src.ann_index import IVFIndex
+from src.attribute_index import AttributeIndex
+from src.catalog_io import CATALOG_COLUMNS, FEATURE_COLUMNS, SERVING_COLUMNS, read_catalog
+
+
+def _as_text(value):
+    # Columnar catalogs keep cast and crew as lists, CSV ones as list reprs
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return ' '.join(value)
+    return ''
+
+
+def _text(column):
+    return column.map(_as_text)
+
+
+def combine_features(movies_df):
+    """
+    Concatenate the text columns the TF-IDF model is fitted on.
+    :param movies_df: DataFrame in the filtered movies format
+    :return: Series of strings
+    """
+    return (
+        movies_df['title'].fillna('') + ' ' +
+        movies_df['overview'].fillna('') + ' ' +
+        movies_df['genres'].fillna('') + ' ' +
+        movies_df['keywords'].fillna('') + ' ' +
+        _text(movies_df['cast']) + ' ' +
+        _text(movies_df['crew'])
+    )
+
 
 class ContentRecommender:
-    def __init__(self, csv_path):
-        self.movies_df = pd.read_csv(csv_path)
-        self.cosine_sim = self.preprocess_and_compute_similarity()
+    def __init__(self, csv_path=None, mode='dense', top_k=50, block_size=1024, ann_params=None,
+                 n_components=256, movies_df=None, n_jobs=1):
+        """
+        :param csv_path: Path to the filtered movies catalog (.csv, .parquet or .feather)
+        :param mode: 'dense' keeps the full N x N cosine matrix, 'topk' keeps
+                     only the top_k neighbours of every movie, 'ann' answers
+                     queries from an approximate IVF index, 'embedding' scores
+                     low-dimensional float32 LSA vectors
+        :param top_k: Number of recommendations the 'topk' mode can serve per movie
+        :param block_size: Rows scored at once while building the 'topk' table
+        :param ann_params: Keyword arguments for IVFIndex in 'ann' mode
+        :param n_components: Embedding dimension in 'embedding' mode, typically 64-512
+        :param movies_df: Catalog DataFrame to fit on instead of reading csv_path
+        :param n_jobs: Worker processes used to build the 'topk' table
+        """
+        if mode not in ('dense', 'topk', 'ann', 'embedding'):
+            raise ValueError(f"Unknown similarity mode: {mode}")
+        self.mode = mode
+        self.top_k = top_k
+        self.block_size = block_size
+        self.ann_params = ann_params or {}
+        self.n_components = n_components
+        self.n_jobs = n_jobs
+        if movies_df is not None:
+            self.movies_df = movies_df.reset_index(drop=True)
+        else:
+            self.movies_df = read_catalog(csv_path, columns=CATALOG_COLUMNS)
+        self.catalog_path = None
+        self.vectorizer = None
+        self.tfidf_matrix = None
+        self.cosine_sim = None
+        self.neighbors = None
+        self.ann_index = None
+        self.svd_components = None
+        self.embeddings = None
+        self.reset_catalog_state()
+        self.build_title_index()
+        self.attribute_index = AttributeIndex(self.movies_df)
+        self.preprocess_and_compute_similarity()
 
-    def preprocess_and_compute_similarity(self):
-        self.movies_df['combined_features'] = (
-            self.movies_df['title'].fillna('') + ' ' + 
-            self.movies_df['overview'].fillna('') + ' ' +
-            self.movies_df['genres'].fillna('') + ' ' + 
-            self.movies_df['keywords'].fillna('') + ' ' +
-            self.movies_df['cast'].fillna('') + ' ' +
-            self.movies_df['crew'].fillna('')
+    @classmethod
+    def from_artifact(cls, artifact_dir, csv_path):
+        """
+        Open a recommender saved with model_artifact.save_artifact without refitting.
+        Arrays are memory-mapped, so workers on one host share their pages.
+        Only the columns needed for serving are read from the catalog; the
+        text columns are loaded on first use by catalog().
+        :param artifact_dir: Artifact directory
+        :param csv_path: Catalog the artifact must have been built from
+        :return: ContentRecommender
+        """
+        manifest, arrays, vocabulary, titles = load_artifact(artifact_dir, csv_path)
+
+        recommender = cls.__new__(cls)
+        recommender.mode = manifest['mode']
+        recommender.top_k = manifest['top_k']
+        recommender.block_size = None
+        recommender.n_jobs = 1
+        recommender.ann_params = manifest.get('ann_params') or {}
+        recommender.n_components = manifest.get('n_components')
+        recommender.movies_df = read_catalog(csv_path, columns=SERVING_COLUMNS)
+        recommender.catalog_path = csv_path
+        if recommender.movies_df['title'].tolist() != titles:
+            raise ArtifactMismatchError(f"Artifact in {artifact_dir} does not match the catalog titles")
+        recommender.reset_catalog_state()
+        if 'title_keys' in arrays:
+            recommender.title_index = TitleIndex.from_arrays(titles, recommender.release_years(), arrays)
+        else:
+            recommender.build_title_index()
+        recommender.attribute_index = AttributeIndex(recommender.movies_df)
+
+        recommender.vectorizer = TfidfVectorizer(stop_words='english')
+        recommender.vectorizer.vocabulary_ = {term: i for i, term in enumerate(vocabulary)}
+        recommender.vectorizer.idf_ = arrays['idf']
+        recommender.tfidf_matrix = sparse.csr_matrix(
+            (arrays['tfidf_data'], arrays['tfidf_indices'], arrays['tfidf_indptr']),
+            shape=(manifest['n_movies'], manifest['n_features']),
         )
-        
+        recommender.cosine_sim = arrays.get('cosine_sim')
+        recommender.neighbors = None
+        if 'neighbor_indices' in arrays:
+            recommender.neighbors = NeighborTable(arrays['neighbor_indices'], arrays['neighbor_scores'])
+        recommender.ann_index = None
+        if 'ann_centroids' in arrays:
+            recommender.ann_index = IVFIndex.from_arrays(recommender.ann_params, arrays, recommender.tfidf_matrix)
+        recommender.svd_components = arrays.get('svd_components')
+        recommender.embeddings = arrays.get('embeddings')
+        return recommender
+
+    def reset_catalog_state(self):
+        self.active = np.ones(len(self.movies_df), dtype=bool)
+        self.removed_rows = np.empty(0, dtype=np.int64)
+        self.added_tokens = 0
+        self.unseen_tokens = 0
+
+    def preprocess_and_compute_similarity(self):
+        self.movies_df['combined_features'] = combine_features(self.movies_df)
+
         # Create TF-IDF vectors
-        tfidf = TfidfVectorizer(stop_words='english')
-        tfidf_matrix = tfidf.fit_transform(self.movies_df['combined_features'])
-        
-        return cosine_similarity(tfidf_matrix, tfidf_matrix)
+        self.vectorizer = TfidfVectorizer(stop_words='english')
+        self.tfidf_matrix = self.vectorizer.fit_transform(self.movies_df['combined_features'])
+
+        if self.mode == 'topk':
+            # One extra slot because every movie is its own nearest neighbour
+            self.neighbors = compute_topk_neighbors(
+                self.tfidf_matrix, self.top_k + 1, self.block_size, n_jobs=self.n_jobs
+            )
+        elif self.mode == 'ann':
+            self.ann_index = IVFIndex(**self.ann_params).fit(self.tfidf_matrix)
+        elif self.mode == 'embedding':
+            n_components = min(self.n_components, self.tfidf_matrix.shape[1] - 1)
+            svd = TruncatedSVD(n_components=n_components, random_state=0)
+            svd.fit(self.tfidf_matrix)
+            self.svd_components = svd.components_.astype(np.float32)
+            self.embeddings = self.embed(self.tfidf_matrix)
+        else:
+            self.cosine_sim = cosine_similarity(self.tfidf_matrix, self.tfidf_matrix)
+        return self.cosine_sim
+
+    def embed(self, tfidf_rows):
+        """
+        Project TF-IDF rows into the L2-normalized float32 embedding space.
+        :param tfidf_rows: Sparse matrix of TF-IDF rows
+        :return: Array of shape (n_rows, n_components)
+        """
+        embeddings = np.asarray(tfidf_rows @ self.svd_components.T, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return embeddings / norms
+
+    def build_title_index(self):
+        self.title_index = TitleIndex(
+            [title if active else None for title, active in zip(self.movies_df['title'], self.active)],
+            self.release_years(),
+        )
+
+    def release_years(self):
+        years = pd.to_datetime(self.movies_df['release_date'], errors='coerce').dt.year
+        return [None if pd.isna(year) else int(year) for year in years]
+
+    def find_movie(self, title):
+        """
+        Look up the row id of a title, ignoring case, accents, punctuation and a trailing year.
+        :param title: Movie title
+        :return: Row id, or None if the title is not in the catalog
+        """
+        return self.title_index.lookup(title)
+
+    def suggest_titles(self, title, limit=5, min_score=0.3):
+        """
+        Find the catalog titles closest to a misspelled or partial title.
+        :param title: Movie title
+        :return: List of catalog titles, best match first
+        """
+        return [self.title_index.titles[row] for row, _ in self.title_index.search(title, limit, min_score)]
+
+    def resolve_row(self, title, min_score=0.5):
+        """
+        Map user input to a catalog row, falling back to the closest fuzzy match.
+        Pass the row to get_recommendations: titles shared by several movies
+        only identify the one the year picked as a row id.
+        :param title: Movie title, optionally with a year
+        :return: Row id, or None if nothing is close enough
+        """
+        idx = self.find_movie(title)
+        if idx is None:
+            matches = self.title_index.search(title, limit=1, min_score=min_score)
+            if not matches:
+                return None
+            idx = matches[0][0]
+        return idx
 
-    def get_recommendations(self, title, num_recommendations=10):
-        idx = self.movies_df[self.movies_df['title'] == title].index[0]
+    def resolve_title(self, title, min_score=0.5):
+        """
+        Map user input to a catalog title, falling back to the closest fuzzy match.
+        :param title: Movie title
+        :return: Catalog title, or None if nothing is close enough
+        """
+        idx = self.resolve_row(title, min_score)
+        return None if idx is None else self.title_index.titles[idx]
 
-        sim_scores = list(enumerate(self.cosine_sim[idx]))
-        sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
-        sim_scores = sim_scores[1:num_recommendations+1]
+    def similarity_row(self, idx):
+        """
+        Exact TF-IDF cosine scores of one movie against the whole catalog.
+        :param idx: Row id
+        :return: 1-D array of scores
+        """
+        return np.asarray((self.tfidf_matrix @ self.tfidf_matrix[idx].T).todense()).ravel()
 
-        movie_indices = [i[0] for i in sim_scores]
+    def get_recommendations(self, title, num_recommendations=10, exclude_seed=True, filters=None):
+        """
+        Recommend the movies most similar to a title.
+        Ties are broken by catalog order, so results are deterministic.
+        :param title: Seed movie title, or its row id from resolve_row
+        :param num_recommendations: Number of titles to return
+        :param exclude_seed: Leave the seed movie itself out of the results
+        :param filters: Optional AttributeIndex.mask predicates applied before ranking,
+                        e.g. {'genres': ['Science Fiction'], 'min_year': 2010, 'min_rating': 7}
+        :return: List of titles, most similar first
+        """
+        if isinstance(title, (int, np.integer)):
+            idx = int(title)
+            if not 0 <= idx < len(self.active) or not self.active[idx]:
+                raise ValueError(f"Row {idx} is not in the catalog")
+        else:
+            idx = self.find_movie(title)
+            if idx is None:
+                raise ValueError(f"'{title}' is not in the catalog")
 
-        return self.movies_df['title'].iloc[movie_indices].tolist()
+        excluded = np.append(self.removed_rows, idx) if exclude_seed else self.removed_rows
+        allowed = self.attribute_index.mask(**filters) if filters else None
+
+        if self.neighbors is not None or self.ann_index is not None:
+            if self.neighbors is not None:
+                available = self.neighbors.depth - 1 if exclude_seed else self.neighbors.depth
+                movie_indices = self.neighbors.row(idx)[0]
+                movie_indices = movie_indices[self.active[movie_indices]]
+                if exclude_seed:
+                    movie_indices = movie_indices[movie_indices != idx]
+            else:
+                available = num_recommendations
+                movie_indices, _ = self.ann_index.search(self.tfidf_matrix[idx], num_recommendations, exclude=excluded)
+            if allowed is not None:
+                movie_indices = movie_indices[allowed[movie_indices]]
+            if len(movie_indices) < num_recommendations:
+                if allowed is None and self.neighbors is not None:
+                    raise ValueError(f"Only {available} recommendations are stored per movie")
+                if allowed is not None:
+                    # The filter removed too many stored candidates; score this row exactly
+                    movie_indices = top_k_indices(
+                        self.similarity_row(idx), num_recommendations, exclude=excluded, mask=allowed
+                    )
+        elif self.embeddings is not None:
+            movie_indices = top_k_indices(
+                self.embeddings @ self.embeddings[idx], num_recommendations, exclude=excluded, mask=allowed
+            )
+        else:
+            movie_indices = top_k_indices(self.cosine_sim[idx], num_recommendations, exclude=excluded, mask=allowed)
+
+        return self.movies_df['title'].iloc[movie_indices[:num_recommendations]].tolist()
+
+    def recommend_batch(self, seeds, num_recommendations=10, batch_size=256, filters=None):
+        """
+        Recommend for many requests at once with sparse matrix products.
+        Each request is scored as the weighted sum of the cosine similarities
+        of its seeds (of their embeddings in 'embedding' mode), and the seeds
+        themselves are never recommended back.
+        :param seeds: List of requests; each is a title, a list of titles or
+                      a dict mapping title to weight. Unknown titles are ignored.
+        :param num_recommendations: Number of titles to return per request
+        :param batch_size: Requests scored per matrix product, bounds memory
+        :param filters: Optional AttributeIndex.mask predicates applied to every request
+        :return: List of title lists, in request order
+        """
+        rows, cols, weights = [], [], []
+        for request_id, request in enumerate(seeds):
+            if isinstance(request, str):
+                request = {request: 1.0}
+            elif not isinstance(request, dict):
+                request = {title: 1.0 for title in request}
+            for title, weight in request.items():
+                idx = self.find_movie(title)
+                if idx is not None:
+                    rows.append(request_id)
+                    cols.append(idx)
+                    weights.append(weight)
+
+        n_movies = self.tfidf_matrix.shape[0]
+        seed_matrix = sparse.csr_matrix((weights, (rows, cols)), shape=(len(seeds), n_movies))
+        titles = self.movies_df['title'].to_numpy()
+        rejected = ~self.attribute_index.mask(**filters) if filters else None
+        results = []
+
+        for start in range(0, len(seeds), batch_size):
+            block_seeds = seed_matrix[start:start + batch_size]
+            if self.embeddings is not None:
+                scores = np.asarray(block_seeds @ self.embeddings) @ self.embeddings.T
+            else:
+                profiles = block_seeds @ self.tfidf_matrix
+                scores = np.asarray((profiles @ self.tfidf_matrix.T).todense())
+
+            seen_rows, seen_cols = block_seeds.nonzero()
+            scores[seen_rows, seen_cols] = -np.inf
+            scores[:, self.removed_rows] = -np.inf
+            if rejected is not None:
+                scores[:, rejected] = -np.inf
+            empty = np.diff(block_seeds.indptr) == 0
+            scores[empty] = -np.inf
+
+            indices, selected = top_k_rows(scores, num_recommendations)
+            for row_indices, row_scores in zip(indices, selected):
+                results.append(titles[row_indices[row_scores > -np.inf]].tolist())
+
+        return results
 
     def get_movie_titles(self):
-        return self.movies_df['title'].tolist()
+        return self.movies_df['title'][self.active].tolist()
+
+    def catalog(self):
+        """
+        Return the movies currently served, in the filtered movies format.
+        :return: DataFrame
+        """
+        if self.catalog_path is not None:
+            self.load_feature_columns()
+        return self.movies_df[self.active].drop(columns='combined_features', errors='ignore').reset_index(drop=True)
+
+    def load_feature_columns(self):
+        """Read the text columns skipped by from_artifact, keeping values of movies added since."""
+        features = read_catalog(self.catalog_path, columns=FEATURE_COLUMNS)
+        movies_df = self.movies_df.copy()
+        n_catalog = len(features)
+        for column in FEATURE_COLUMNS:
+            added = movies_df[column].iloc[n_catalog:].tolist() if column in movies_df else [None] * (len(movies_df) - n_catalog)
+            movies_df[column] = features[column].tolist() + added
+        self.movies_df = movies_df
+        self.catalog_path = None
+
+    def refit(self, movies_df=None):
+        """
+        Fit a new recommender with the same settings, by default on the current catalog.
+        :param movies_df: Catalog to fit on
+        :return: ContentRecommender
+        """
+        return ContentRecommender(
+            mode=self.mode, top_k=self.top_k, block_size=self.block_size or 1024,
+            ann_params=self.ann_params, n_components=self.n_components, n_jobs=self.n_jobs,
+            movies_df=self.catalog() if movies_df is None else movies_df,
+        )
+
+    def copy(self):
+        """
+        Shallow copy sharing the fitted arrays. add_movies and remove_movies
+        replace arrays rather than writing into them, so updating the copy
+        leaves this model untouched for readers still using it.
+        :return: ContentRecommender
+        """
+        clone = copy.copy(self)
+        if self.ann_index is not None:
+            clone.ann_index = copy.copy(self.ann_index)
+        return clone
+
+    def add_movies(self, new_movies_df):
+        """
+        Add movies against the existing vocabulary without refitting TF-IDF.
+        Only the neighbour lists that the new movies enter are rewritten.
+        :param new_movies_df: DataFrame in the filtered movies format
+        :return: Row ids assigned to the new movies
+        """
+        new_movies_df = new_movies_df.reset_index(drop=True).copy()
+        new_movies_df['combined_features'] = combine_features(new_movies_df)
+        n_old = len(self.movies_df)
+        new_ids = np.arange(n_old, n_old + len(new_movies_df))
+
+        analyzer = self.vectorizer.build_analyzer()
+        for text in new_movies_df['combined_features']:
+            tokens = analyzer(text)
+            self.added_tokens += len(tokens)
+            self.unseen_tokens += sum(token not in self.vectorizer.vocabulary_ for token in tokens)
+
+        new_rows = self.vectorizer.transform(new_movies_df['combined_features'])
+        tfidf_matrix = sparse.vstack([self.tfidf_matrix, new_rows]).tocsr()
+        active = np.concatenate([self.active, np.ones(len(new_ids), dtype=bool)])
+
+        if self.neighbors is not None:
+            new_scores = cosine_similarity(new_rows, self.tfidf_matrix)
+            new_scores[:, self.removed_rows] = -np.inf
+            # Existing lists only change where a new movie beats their last entry
+            worst = self.neighbors.scores[:, -1]
+            affected = np.flatnonzero((new_scores.T >= worst[:, np.newaxis]).any(axis=1))
+            neighbors = self.neighbors.merge(affected, new_ids, new_scores.T[affected])
+            indices, scores = compute_neighbor_rows(
+                tfidf_matrix, new_ids, self.neighbors.depth, self.block_size or 1024, excluded=self.removed_rows
+            )
+            self.neighbors = NeighborTable(
+                np.vstack([neighbors.indices, indices]), np.vstack([neighbors.scores, scores])
+            )
+        elif self.ann_index is not None:
+            self.ann_index.add(new_rows, tfidf_matrix)
+        elif self.embeddings is not None:
+            self.embeddings = np.vstack([self.embeddings, self.embed(new_rows)])
+        else:
+            new_scores = cosine_similarity(new_rows, tfidf_matrix)
+            self.cosine_sim = np.block([[self.cosine_sim, new_scores[:, :n_old].T], [new_scores]])
+
+        self.tfidf_matrix = tfidf_matrix
+        self.movies_df = pd.concat([self.movies_df, new_movies_df], ignore_index=True)
+        self.active = active
+        self.attribute_index = AttributeIndex(self.movies_df)
+        # The title index goes last so new movies are only found once they can be served
+        self.build_title_index()
+        return new_ids
+
+    def remove_movies(self, movie_ids):
+        """
+        Stop serving movies. Rows are tombstoned, and neighbour lists that
+        pointed at them are recomputed.
+        :param movie_ids: TMDB movie ids to remove
+        :return: Row ids that were removed
+        """
+        rows = np.flatnonzero(self.movies_df['movie_id'].isin(list(movie_ids)).to_numpy() & self.active)
+        active = self.active.copy()
+        active[rows] = False
+        self.active = active
+        self.removed_rows = np.flatnonzero(~active)
+        self.build_title_index()
+
+        if self.neighbors is not None and len(rows):
+            affected = np.flatnonzero(np.isin(self.neighbors.indices, rows).any(axis=1) & active)
+            indices, scores = compute_neighbor_rows(
+                self.tfidf_matrix, affected, self.neighbors.depth, self.block_size or 1024,
+                excluded=self.removed_rows,
+            )
+            table_indices, table_scores = np.array(self.neighbors.indices), np.array(self.neighbors.scores)
+            table_indices[affected], table_scores[affected] = indices, scores
+            self.neighbors = NeighborTable(table_indices, table_scores)
+        return rows
+
+    def apply_changes(self, upserts_df, removed_ids=()):
+        """
+        Apply a catalog change set: updated and removed movies are
+        tombstoned, then new and updated versions are added.
+        :param upserts_df: New and updated movies in the filtered movies format
+        :param removed_ids: TMDB ids of movies that left the catalog
+        :return: Tuple of (removed row ids, added row ids)
+        """
+        removed = self.remove_movies(list(removed_ids) + upserts_df['movie_id'].tolist())
+        added = self.add_movies(upserts_df) if len(upserts_df) else np.empty(0, dtype=np.int64)
+        return removed, added
+
+    def drift_report(self):
+        """
+        Measure how far the fitted IDF weights are from the catalog now served.
+        idf_shift is the mean absolute IDF change relative to the mean IDF;
+        unseen_token_ratio is the share of tokens in added movies that the
+        vocabulary does not know and therefore ignores.
+        :return: Dict with idf_shift, unseen_token_ratio and drift (the larger of the two)
+        """
+        active_rows = self.tfidf_matrix[self.active]
+        document_frequency = np.bincount(active_rows.indices, minlength=active_rows.shape[1])
+        n_documents = active_rows.shape[0]
+        current_idf = np.log((1 + n_documents) / (1 + document_frequency)) + 1
+        fitted_idf = np.asarray(self.vectorizer.idf_)
+
+        idf_shift = float(np.abs(current_idf - fitted_idf).mean() / fitted_idf.mean())
+        unseen_token_ratio = self.unseen_tokens / self.added_tokens if self.added_tokens else 0.0
+        return {
+            'idf_shift': idf_shift,
+            'unseen_token_ratio': unseen_token_ratio,
+            'drift': max(idf_shift, unseen_token_ratio),
+        }
 
 if __name__ == "__main__":
     csv_path = 'D:/MRS/llm-openai/data/filtered_movies_data.csv'
@@ -44,4 +505,3 @@ if __name__ == "__main__":
     print("Number of movies:", len(recommender.get_movie_titles()))
     print("\nRecommendations for 'Avatar':")
     print(recommender.get_recommendations('Avatar'))
- 
\ No newline at end of file
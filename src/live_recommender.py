@@ -0,0 +1,117 @@
+import logging
+import threading
+
+
+class LiveRecommender:
+    """
+    Serves a ContentRecommender that accepts catalog updates while it runs.
+    Updates are applied incrementally to a copy of the served model, which
+    is then swapped in, so readers never see a half-applied update. Once
+    the IDF drift they cause crosses drift_threshold, a full refit is
+    started on a background thread while the current model keeps serving,
+    and the fitted model is swapped in with a single reference assignment.
+    Updates that arrive during the refit are replayed onto the new model
+    before the swap. Every other attribute is read from the model currently
+    being served, so calls that pass row ids between them must go through
+    one model, as resolve_and_recommend does.
+    """
+
+    def __init__(self, recommender, drift_threshold=0.2):
+        """
+        :param recommender: Fitted ContentRecommender to serve
+        :param drift_threshold: drift_report()['drift'] value that triggers a rebuild
+        """
+        self.recommender = recommender
+        self.drift_threshold = drift_threshold
+        self._lock = threading.Lock()
+        self._rebuild_thread = None
+        self._pending = None
+
+    def __getattr__(self, name):
+        if name == 'recommender':
+            raise AttributeError(name)
+        return getattr(self.recommender, name)
+
+    def resolve_and_recommend(self, title, num_recommendations=10, filters=None):
+        """
+        Resolve a title and recommend for the resolved row on one model. A
+        refit drops removed rows and renumbers the rest, so a row id must not
+        outlive the model it came from.
+        :param title: Movie title as typed, tolerating typos and a trailing year
+        :param num_recommendations: Number of titles to return
+        :param filters: Optional AttributeIndex.mask predicates
+        :return: List of titles, or None if the title does not resolve
+        """
+        model = self.recommender
+        row = model.resolve_row(title)
+        if row is None:
+            return None
+        return model.get_recommendations(row, num_recommendations, filters=filters)
+
+    def _update(self, method, argument):
+        with self._lock:
+            updated = self.recommender.copy()
+            result = self._replay(updated, method, argument)
+            self.recommender = updated
+            if self._pending is not None:
+                self._pending.append((method, argument))
+            self._check_drift()
+        return result
+
+    def add_movies(self, movies_df):
+        return self._update('add_movies', movies_df)
+
+    def remove_movies(self, movie_ids):
+        return self._update('remove_movies', list(movie_ids))
+
+    def apply_changes(self, upserts_df, removed_ids=()):
+        return self._update('apply_changes', (upserts_df, list(removed_ids)))
+
+    def _replay(self, recommender, method, argument):
+        if method == 'apply_changes':
+            return recommender.apply_changes(*argument)
+        return getattr(recommender, method)(argument)
+
+    def _check_drift(self):
+        if self._rebuild_thread is None and self.recommender.drift_report()['drift'] > self.drift_threshold:
+            self._start_rebuild()
+
+    def rebuild(self, wait=False):
+        """
+        Refit on the current catalog in the background and swap the result in.
+        :param wait: Block until the new model is serving
+        :return: The rebuild thread
+        """
+        with self._lock:
+            thread = self._rebuild_thread or self._start_rebuild()
+        if wait:
+            thread.join()
+        return thread
+
+    @property
+    def rebuilding(self):
+        return self._rebuild_thread is not None
+
+    def _start_rebuild(self):
+        catalog = self.recommender.catalog()
+        self._pending = []
+        self._rebuild_thread = threading.Thread(
+            target=self._rebuild, args=(self.recommender, catalog), name='recommender-rebuild', daemon=True
+        )
+        self._rebuild_thread.start()
+        return self._rebuild_thread
+
+    def _rebuild(self, recommender, catalog):
+        try:
+            fresh = recommender.refit(catalog)
+            with self._lock:
+                for method, argument in self._pending:
+                    self._replay(fresh, method, argument)
+                self.recommender = fresh
+            logging.info(f"Recommender rebuilt with {len(catalog)} movies")
+        except Exception:
+            logging.exception("Recommender rebuild failed, keeping the current model")
+        finally:
+            with self._lock:
+                self._pending = None
+                self._rebuild_thread = None
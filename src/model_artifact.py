@@ -0,0 +1,145 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+ARTIFACT_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+
+
+class ArtifactMismatchError(ValueError):
+    """Raised when an artifact was built from a different catalog or format version."""
+
+
+def file_checksum(path, chunk_size=1 << 20):
+    """
+    Compute the SHA-256 checksum of a file.
+    :param path: Path to the file
+    :return: Hex digest
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def save_artifact(recommender, csv_path, artifact_dir):
+    """
+    Write a fitted ContentRecommender to a versioned artifact directory.
+    The directory is written next to the target and renamed into place, so
+    workers never observe a half-written artifact.
+    :param recommender: Fitted ContentRecommender
+    :param csv_path: Catalog the recommender was fitted on
+    :param artifact_dir: Destination directory
+    """
+    artifact_dir = os.path.abspath(artifact_dir)
+    parent = os.path.dirname(artifact_dir)
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix='.artifact-', dir=parent)
+
+    vectorizer = recommender.vectorizer
+    vocabulary = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+    tfidf_matrix = recommender.tfidf_matrix.tocsr()
+
+    arrays = {
+        'idf': vectorizer.idf_,
+        'tfidf_data': tfidf_matrix.data,
+        'tfidf_indices': tfidf_matrix.indices,
+        'tfidf_indptr': tfidf_matrix.indptr,
+    }
+    if recommender.neighbors is not None:
+        arrays['neighbor_indices'] = recommender.neighbors.indices
+        arrays['neighbor_scores'] = recommender.neighbors.scores
+    if recommender.cosine_sim is not None:
+        arrays['cosine_sim'] = recommender.cosine_sim
+    if recommender.ann_index is not None:
+        arrays.update(recommender.ann_index.to_arrays())
+    if recommender.embeddings is not None:
+        arrays['svd_components'] = recommender.svd_components
+        arrays['embeddings'] = recommender.embeddings
+    if recommender.active.all():
+        # A served catalog starts with every row active, so only such an index can be reused as is
+        arrays.update(recommender.title_index.to_arrays())
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_dir, f'{name}.npy'), np.ascontiguousarray(array))
+
+    with open(os.path.join(tmp_dir, 'vocabulary.json'), 'w', encoding='utf-8') as f:
+        json.dump(vocabulary, f)
+    with open(os.path.join(tmp_dir, 'titles.json'), 'w', encoding='utf-8') as f:
+        json.dump(recommender.movies_df['title'].tolist(), f)
+
+    manifest = {
+        'version': ARTIFACT_VERSION,
+        'source_checksum': file_checksum(csv_path),
+        'mode': recommender.mode,
+        'top_k': recommender.top_k,
+        'ann_params': recommender.ann_index.params() if recommender.ann_index is not None else None,
+        'n_components': recommender.n_components,
+        'n_movies': int(tfidf_matrix.shape[0]),
+        'n_features': int(tfidf_matrix.shape[1]),
+        'arrays': sorted(arrays),
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    if os.path.exists(artifact_dir):
+        old_dir = tempfile.mkdtemp(prefix='.artifact-old-', dir=parent)
+        os.rename(artifact_dir, os.path.join(old_dir, 'artifact'))
+        os.rename(tmp_dir, artifact_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+    else:
+        os.rename(tmp_dir, artifact_dir)
+
+
+def load_artifact(artifact_dir, csv_path, mmap_mode='r'):
+    """
+    Open an artifact directory with memory-mapped arrays.
+    :param artifact_dir: Directory written by save_artifact
+    :param csv_path: Catalog the caller is about to serve; its checksum must match
+    :param mmap_mode: Passed to numpy.load, None reads the arrays into memory
+    :return: Tuple of (manifest, arrays, vocabulary, titles)
+    """
+    with open(os.path.join(artifact_dir, MANIFEST_FILE), encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    if manifest.get('version') != ARTIFACT_VERSION:
+        raise ArtifactMismatchError(
+            f"Artifact version {manifest.get('version')} is not supported (expected {ARTIFACT_VERSION})"
+        )
+    if manifest['source_checksum'] != file_checksum(csv_path):
+        raise ArtifactMismatchError(f"Artifact in {artifact_dir} was built from a different catalog")
+
+    arrays = {
+        name: np.load(os.path.join(artifact_dir, f'{name}.npy'), mmap_mode=mmap_mode)
+        for name in manifest['arrays']
+    }
+    with open(os.path.join(artifact_dir, 'vocabulary.json'), encoding='utf-8') as f:
+        vocabulary = json.load(f)
+    with open(os.path.join(artifact_dir, 'titles.json'), encoding='utf-8') as f:
+        titles = json.load(f)
+
+    return manifest, arrays, vocabulary, titles
+
+
+if __name__ == "__main__":
+    from src.content_recommender import ContentRecommender
+
+    parser = argparse.ArgumentParser(description="Build a ContentRecommender artifact")
+    parser.add_argument('csv_path', help="Filtered movies CSV")
+    parser.add_argument('artifact_dir', help="Output directory")
+    parser.add_argument('--mode', default='topk', choices=['dense', 'topk', 'ann', 'embedding'])
+    parser.add_argument('--top-k', type=int, default=50)
+    parser.add_argument('--n-components', type=int, default=256)
+    parser.add_argument('--n-jobs', type=int, default=1, help="Processes used for the top-k build")
+    args = parser.parse_args()
+
+    recommender = ContentRecommender(
+        args.csv_path, mode=args.mode, top_k=args.top_k, n_components=args.n_components, n_jobs=args.n_jobs
+    )
+    save_artifact(recommender, args.csv_path, args.artifact_dir)
+    print(f"Artifact saved to {args.artifact_dir}")
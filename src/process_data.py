@@ -1,5 +1,14 @@
+import os
 import pandas as pd
 import ast
+import hashlib
+import json
+import re
+import sqlite3
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from src.catalog_io import CATALOG_COLUMNS, CatalogWriter, change_set_paths, iter_catalog, write_catalog
 
 def load_datasets(movies_path, credits_path):
     """
@@ -18,67 +27,369 @@ def load_datasets(movies_path, credits_path):
     return merged_df
 
 
+_NAME = re.compile(r'"name":\s*"((?:[^"\\]|\\.)*)"')
+_DIRECTOR = re.compile(r'\{[^{}]*"job":\s*"Director"[^{}]*\}')
+_DIRECTOR_JOB = re.compile(r'"job":\s*"Director"')
+
+
+def parse_blob(text):
+    """
+    Parse a TMDB JSON column value, falling back to Python literal syntax.
+    :param text: Raw column value
+    :return: List of dicts
+    """
+    try:
+        return json.loads(text)
+    except ValueError:
+        return ast.literal_eval(text)
+
+
+def _decode(raw_name):
+    return json.loads(f'"{raw_name}"')
+
+
+def _is_json(text):
+    text = text.lstrip()
+    return text.startswith('[{"') or text == '[]'
+
+
 def convert(text):
-    L = []
-    for i in ast.literal_eval(text):
-        L.append(i['name']) 
-    L = ' '.join(L)
-    return L 
+    return ' '.join(item['name'] for item in parse_blob(text))
 
 
 def convert3(text):
-    L = []
-    counter = 0
-    for i in ast.literal_eval(text):
-        if counter < 3:
-            L.append(i['name'])
-        counter+=1
-    return L 
+    # Only the first three names are needed, so they are scanned for instead
+    # of parsing every cast member.
+    if _is_json(text):
+        return [_decode(match.group(1)) for match, _ in zip(_NAME.finditer(text), range(3))]
+    return [item['name'] for item in parse_blob(text)[:3]]
 
 
 def fetch_director(text):
-    L = []
-    for i in ast.literal_eval(text):
-        if i['job'] == 'Director':
-            L.append(i['name'])
-    return L 
+    # Crew blobs are large; only the objects whose job is "Director" are decoded.
+    # A brace inside a crew string hides its object from the pattern, in which
+    # case the match count falls short and the whole blob is parsed instead.
+    if _is_json(text):
+        matches = _DIRECTOR.findall(text)
+        names = [_NAME.search(match) for match in matches]
+        if len(matches) == len(_DIRECTOR_JOB.findall(text)) and all(names):
+            return [_decode(name.group(1)) for name in names]
+    return [item['name'] for item in parse_blob(text) if item['job'] == 'Director']
+
+
+COLUMN_PARSERS = {
+    'genres': convert,
+    'keywords': convert,
+    'cast': convert3,
+    'crew': fetch_director,
+}
+
+
+def _parse_chunk(chunk):
+    return {column: [COLUMN_PARSERS[column](text) for text in values] for column, values in chunk.items()}
+
 
+def parse_json_columns(df, n_jobs=1, chunk_size=500, columns=None, pool=None):
+    """
+    Parse the genres, keywords, cast and crew columns, optionally in a process pool.
+    :param df: DataFrame with the raw TMDB JSON columns
+    :param n_jobs: Worker processes; 1 parses in the calling process
+    :param chunk_size: Rows sent to a worker at once
+    :param columns: Columns to parse, defaults to all of COLUMN_PARSERS
+    :param pool: Existing executor to use instead of starting one
+    :return: Dict mapping column name to the list of parsed values
+    """
+    columns = list(columns or COLUMN_PARSERS)
+    chunks = [
+        {column: df[column].iloc[start:start + chunk_size].tolist() for column in columns}
+        for start in range(0, len(df), chunk_size)
+    ]
+    if pool is not None:
+        parsed = list(pool.map(_parse_chunk, chunks))
+    elif n_jobs > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            parsed = list(pool.map(_parse_chunk, chunks))
+    else:
+        parsed = [_parse_chunk(chunk) for chunk in chunks]
+    return {column: [value for chunk in parsed for value in chunk[column]] for column in columns}
+
+
+OUTPUT_COLUMNS = CATALOG_COLUMNS
+MOVIE_COLUMNS = ['id', 'title', 'overview', 'genres', 'keywords',
+                 'vote_average', 'vote_count', 'popularity', 'release_date']
 
-def filter_columns(merged_df):
+
+def filter_columns(merged_df, n_jobs=1):
     """
     Filter the merged DataFrame to keep only the necessary columns.
     :param merged_df: Merged DataFrame from movies and credits datasets
+    :param n_jobs: Worker processes used to parse the JSON columns
     :return: Filtered DataFrame
     """
     print("Columns in merged DataFrame:", merged_df.columns.tolist())
     
-    filtered_df = merged_df[['movie_id', 'title', 'overview','genres', 'keywords', 
-                             'vote_average', 'vote_count', 'popularity', 
-                             'release_date', 'cast', 'crew']]
-    filtered_df.dropna(inplace=True)
-    filtered_df['genres'] = filtered_df['genres'].apply(convert)
-    filtered_df['keywords'] = filtered_df['keywords'].apply(convert)
-    filtered_df['cast'] = filtered_df['cast'].apply(convert3)
-    filtered_df['crew'] = filtered_df['crew'].apply(fetch_director)
+    filtered_df = merged_df[OUTPUT_COLUMNS].dropna()
+    for column, values in parse_json_columns(filtered_df, n_jobs).items():
+        filtered_df[column] = values
 
     return filtered_df
 
 def save_filtered_data(filtered_df, output_path):
     """
-    Save the filtered DataFrame to a CSV file.
+    Save the filtered DataFrame; the extension picks Parquet, Feather or CSV.
     :param filtered_df: DataFrame with filtered columns
     :param output_path: Path where the filtered data will be saved
     """
-    filtered_df.to_csv(output_path, index=False)
+    write_catalog(filtered_df, output_path)
     print(f"Filtered data saved to {output_path}")
 
+def build_credits_table(credits_path, db_path, chunksize=1000, n_jobs=1, pool=None):
+    """
+    Stream the credits CSV into an SQLite side table keyed by movie_id.
+    Cast and crew are parsed on the way in, so the table only holds the
+    top-billed names and directors rather than the full JSON blobs.
+    :param credits_path: Path to the credits dataset
+    :param db_path: SQLite file to create
+    :param chunksize: Rows read from the CSV at once
+    :return: Number of credit rows stored
+    """
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE IF NOT EXISTS credits (movie_id INTEGER PRIMARY KEY, cast_names TEXT, directors TEXT)")
+    count = 0
+    for chunk in pd.read_csv(credits_path, usecols=['movie_id', 'cast', 'crew'], chunksize=chunksize):
+        chunk = chunk.dropna()
+        parsed = parse_json_columns(chunk, n_jobs, columns=['cast', 'crew'], pool=pool)
+        rows = zip(
+            chunk['movie_id'].astype(int).tolist(),
+            map(json.dumps, parsed['cast']),
+            map(json.dumps, parsed['crew']),
+        )
+        conn.executemany("INSERT OR REPLACE INTO credits VALUES (?, ?, ?)", rows)
+        conn.commit()
+        count += len(chunk)
+    conn.close()
+    return count
+
+
+def _lookup_credits(conn, movie_ids, batch_size=500):
+    credits = {}
+    for start in range(0, len(movie_ids), batch_size):
+        batch = movie_ids[start:start + batch_size]
+        placeholders = ','.join('?' * len(batch))
+        query = f"SELECT movie_id, cast_names, directors FROM credits WHERE movie_id IN ({placeholders})"
+        for movie_id, cast, crew in conn.execute(query, batch):
+            credits[movie_id] = (json.loads(cast), json.loads(crew))
+    return credits
+
+
+def iter_filtered_chunks(movies_path, credits_db, chunksize=1000, n_jobs=1, pool=None):
+    """
+    Yield filtered, parsed DataFrames one movies chunk at a time, joined to
+    the credits side table on movie_id.
+    :param movies_path: Path to the movies dataset
+    :param credits_db: SQLite file written by build_credits_table
+    :param chunksize: Rows read from the movies CSV at once
+    :return: Generator of DataFrames with OUTPUT_COLUMNS
+    """
+    conn = sqlite3.connect(credits_db)
+    try:
+        for chunk in pd.read_csv(movies_path, usecols=MOVIE_COLUMNS, chunksize=chunksize):
+            chunk = chunk.dropna().rename(columns={'id': 'movie_id'})
+            chunk['movie_id'] = chunk['movie_id'].astype(int)
+            credits = _lookup_credits(conn, chunk['movie_id'].tolist())
+            chunk = chunk[chunk['movie_id'].isin(credits)].copy()
+            if chunk.empty:
+                continue
+
+            for column, values in parse_json_columns(chunk, n_jobs, columns=['genres', 'keywords'], pool=pool).items():
+                chunk[column] = values
+            chunk['cast'] = [credits[movie_id][0] for movie_id in chunk['movie_id']]
+            chunk['crew'] = [credits[movie_id][1] for movie_id in chunk['movie_id']]
+            yield chunk[OUTPUT_COLUMNS]
+    finally:
+        conn.close()
+
+
+def stream_filtered_data(movies_path, credits_path, output_path, chunksize=1000, n_jobs=1):
+    """
+    Run the preprocessing pipeline in bounded memory: credits go to an
+    on-disk side table, then movies are read, joined, parsed and appended
+    to the output one chunk at a time.
+    :param movies_path: Path to the movies dataset
+    :param credits_path: Path to the credits dataset
+    :param output_path: Path where the filtered data will be saved
+    :param chunksize: Rows held in memory per chunk
+    :param n_jobs: Worker processes used to parse the JSON columns
+    :return: Number of rows written
+    """
+    pool = ProcessPoolExecutor(max_workers=n_jobs) if n_jobs > 1 else None
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            credits_db = os.path.join(tmp_dir, 'credits.sqlite')
+            build_credits_table(credits_path, credits_db, chunksize, pool=pool)
+
+            root, extension = os.path.splitext(output_path)
+            tmp_output = f'{root}.tmp{extension}'
+            with CatalogWriter(tmp_output) as writer:
+                for chunk in iter_filtered_chunks(movies_path, credits_db, chunksize, pool=pool):
+                    writer.write(chunk)
+            written = writer.rows
+            os.replace(tmp_output, output_path)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    print(f"Filtered data saved to {output_path} ({written} movies)")
+    return written
+
+def _row_hash(*values):
+    digest = hashlib.sha1()
+    for value in values:
+        digest.update(str(value).encode('utf-8'))
+        digest.update(b'\x1f')
+    return digest.hexdigest()
+
+
+def build_raw_credits_table(credits_path, db_path, chunksize=1000):
+    """
+    Stream the credits CSV into an SQLite side table of unparsed blobs and
+    their content hashes, so only changed movies pay for parsing.
+    :param credits_path: Path to the credits dataset
+    :param db_path: SQLite file to create
+    :param chunksize: Rows read from the CSV at once
+    """
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE IF NOT EXISTS raw_credits (movie_id INTEGER PRIMARY KEY, hash TEXT, cast_blob TEXT, crew_blob TEXT)")
+    for chunk in pd.read_csv(credits_path, usecols=['movie_id', 'cast', 'crew'], chunksize=chunksize):
+        chunk = chunk.dropna()
+        rows = [
+            (int(movie_id), _row_hash(cast, crew), cast, crew)
+            for movie_id, cast, crew in zip(chunk['movie_id'], chunk['cast'], chunk['crew'])
+        ]
+        conn.executemany("INSERT OR REPLACE INTO raw_credits VALUES (?, ?, ?, ?)", rows)
+        conn.commit()
+    conn.close()
+
+
+def _select_by_ids(conn, query, movie_ids, batch_size=500):
+    rows = []
+    for start in range(0, len(movie_ids), batch_size):
+        batch = movie_ids[start:start + batch_size]
+        rows.extend(conn.execute(query.format(placeholders=','.join('?' * len(batch))), batch))
+    return rows
+
+
+def refresh_filtered_data(movies_path, credits_path, output_path, manifest_path=None, chunksize=1000, n_jobs=1):
+    """
+    Incrementally rebuild the filtered catalog. A manifest keeps a content
+    hash per movie_id over the raw movie columns and credit blobs; only
+    movies whose hash changed, or that are new, are parsed. Unchanged rows
+    are copied from the previous output, updated and new rows are appended,
+    and the change set is written next to the output (see
+    catalog_io.change_set_paths) for consumers to apply with
+    ContentRecommender.apply_changes.
+    Without a previous output every movie counts as new.
+    :param movies_path: Path to the movies dataset
+    :param credits_path: Path to the credits dataset
+    :param output_path: Catalog to create or refresh
+    :param manifest_path: SQLite hash manifest, defaults to '<output_path>.manifest.sqlite'
+    :param chunksize: Rows held in memory per chunk
+    :param n_jobs: Worker processes used to parse the JSON columns
+    :return: Change set summary dict with added, updated and removed movie ids
+    """
+    manifest_path = manifest_path or f'{output_path}.manifest.sqlite'
+    upserts_path, summary_path = change_set_paths(output_path)
+    manifest = sqlite3.connect(manifest_path)
+    manifest.execute("CREATE TABLE IF NOT EXISTS movie_hashes (movie_id INTEGER PRIMARY KEY, hash TEXT)")
+    # Rows of an output without a manifest cannot be trusted, so rebuild from scratch
+    full_rebuild = not os.path.exists(output_path) or manifest.execute("SELECT COUNT(*) FROM movie_hashes").fetchone()[0] == 0
+    if full_rebuild:
+        manifest.execute("DELETE FROM movie_hashes")
+        manifest.commit()
+
+    pool = ProcessPoolExecutor(max_workers=n_jobs) if n_jobs > 1 else None
+    added, updated = [], []
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            credits_db = os.path.join(tmp_dir, 'credits.sqlite')
+            build_raw_credits_table(credits_path, credits_db, chunksize)
+            side = sqlite3.connect(credits_db)
+            side.execute("CREATE TABLE current (movie_id INTEGER PRIMARY KEY, hash TEXT)")
+
+            with CatalogWriter(upserts_path) as upserts:
+                for chunk in pd.read_csv(movies_path, usecols=MOVIE_COLUMNS, chunksize=chunksize):
+                    chunk = chunk.dropna().rename(columns={'id': 'movie_id'})
+                    chunk['movie_id'] = chunk['movie_id'].astype(int)
+                    ids = chunk['movie_id'].tolist()
+                    credits = {
+                        row[0]: row[1:] for row in _select_by_ids(
+                            side, "SELECT movie_id, hash, cast_blob, crew_blob FROM raw_credits WHERE movie_id IN ({placeholders})", ids
+                        )
+                    }
+                    chunk = chunk[chunk['movie_id'].isin(credits)].copy()
+                    chunk['hash'] = [
+                        _row_hash(*row, credits[row[0]][0])
+                        for row in chunk[['movie_id'] + MOVIE_COLUMNS[1:]].itertuples(index=False)
+                    ]
+                    previous = dict(_select_by_ids(
+                        manifest, "SELECT movie_id, hash FROM movie_hashes WHERE movie_id IN ({placeholders})",
+                        chunk['movie_id'].tolist(),
+                    ))
+                    side.executemany("INSERT OR REPLACE INTO current VALUES (?, ?)", zip(chunk['movie_id'].tolist(), chunk['hash']))
+
+                    changed = chunk[[previous.get(movie_id) != digest for movie_id, digest in zip(chunk['movie_id'], chunk['hash'])]].copy()
+                    if changed.empty:
+                        continue
+                    changed['cast'] = [credits[movie_id][1] for movie_id in changed['movie_id']]
+                    changed['crew'] = [credits[movie_id][2] for movie_id in changed['movie_id']]
+                    for column, values in parse_json_columns(changed, n_jobs, pool=pool).items():
+                        changed[column] = values
+                    upserts.write(changed)
+                    for movie_id in changed['movie_id'].tolist():
+                        (updated if movie_id in previous else added).append(movie_id)
+
+            side.commit()
+            side.close()
+            manifest.execute("ATTACH DATABASE ? AS side", (credits_db,))
+            removed = [row[0] for row in manifest.execute(
+                "SELECT movie_id FROM movie_hashes WHERE movie_id NOT IN (SELECT movie_id FROM side.current)"
+            )]
+
+            if added or updated or removed:
+                replaced = set(updated) | set(removed)
+                root, extension = os.path.splitext(output_path)
+                tmp_output = f'{root}.tmp{extension}'
+                with CatalogWriter(tmp_output) as writer:
+                    if not full_rebuild:
+                        for chunk in iter_catalog(output_path, chunksize):
+                            writer.write(chunk[~chunk['movie_id'].isin(replaced)])
+                    for chunk in iter_catalog(upserts_path, chunksize):
+                        writer.write(chunk)
+                os.replace(tmp_output, output_path)
+
+            # The manifest only moves forward once the new output is in place
+            manifest.execute("DELETE FROM movie_hashes WHERE movie_id NOT IN (SELECT movie_id FROM side.current)")
+            manifest.execute("INSERT OR REPLACE INTO movie_hashes SELECT movie_id, hash FROM side.current")
+            manifest.commit()
+            manifest.execute("DETACH DATABASE side")
+    finally:
+        manifest.close()
+        if pool is not None:
+            pool.shutdown()
+
+    summary = {
+        'upserts': os.path.basename(upserts_path),
+        'added': added,
+        'updated': updated,
+        'removed': removed,
+    }
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f)
+    print(f"Refreshed {output_path}: {len(added)} added, {len(updated)} updated, {len(removed)} removed")
+    return summary
+
 if __name__ == "__main__":
     movies_path = 'D:/MRS/llm-openai/data/tmdb_5000_movies.csv'
     credits_path = 'D:/MRS/llm-openai/data/tmdb_5000_credits.csv'
-    output_path = 'D:/MRS/llm-openai/data/filtered_movies_data.csv'
+    output_path = 'D:/MRS/llm-openai/data/filtered_movies_data.parquet'
 
-    merged_df = load_datasets(movies_path, credits_path)
-    
-    filtered_df = filter_columns(merged_df)
-    
-    save_filtered_data(filtered_df, output_path)
+    refresh_filtered_data(movies_path, credits_path, output_path, n_jobs=os.cpu_count())
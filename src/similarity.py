@@ -0,0 +1,247 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import sparse
+from sklearn.metrics.pairwise import cosine_similarity
+
+
+class NeighborTable:
+    """
+    Top-k neighbours of every movie, stored as two (n_movies, depth) arrays.
+    Row i holds the indices of the movies most similar to movie i (itself
+    included) ordered by descending score, ties broken by ascending index.
+    Unused slots are padded with index -1 and score -inf.
+    """
+
+    def __init__(self, indices, scores):
+        self.indices = indices
+        self.scores = scores
+
+    @property
+    def depth(self):
+        return self.indices.shape[1]
+
+    def __len__(self):
+        return self.indices.shape[0]
+
+    def row(self, idx):
+        """
+        Return the neighbour indices and scores of one movie, without padding.
+        :param idx: Row id of the movie
+        :return: Tuple of (indices, scores) arrays
+        """
+        indices = self.indices[idx]
+        valid = indices >= 0
+        return indices[valid], self.scores[idx][valid]
+
+    def merge(self, rows, candidate_indices, candidate_scores):
+        """
+        Return a copy of the table where some rows also consider new candidates.
+        Candidates must have higher movie indices than every existing entry,
+        which holds for movies appended to the catalog.
+        :param rows: Row ids to update
+        :param candidate_indices: 1-D array of candidate movie indices
+        :param candidate_scores: Array of shape (len(rows), len(candidate_indices))
+        :return: NeighborTable
+        """
+        indices = np.array(self.indices)
+        scores = np.array(self.scores)
+        combined_scores = np.hstack([scores[rows], candidate_scores])
+        combined_indices = np.hstack([
+            indices[rows], np.broadcast_to(candidate_indices, candidate_scores.shape)
+        ])
+        positions, selected = top_k_rows(combined_scores, self.depth)
+        indices[rows] = np.where(
+            selected > -np.inf, np.take_along_axis(combined_indices, positions, axis=1), -1
+        )
+        scores[rows] = selected
+        return NeighborTable(indices, scores)
+
+    def to_csr(self):
+        """
+        Convert the table to an (n_movies, n_movies) sparse similarity matrix.
+        :return: scipy.sparse.csr_matrix
+        """
+        n = len(self)
+        valid = self.indices >= 0
+        counts = valid.sum(axis=1)
+        indptr = np.concatenate([[0], np.cumsum(counts)])
+        return sparse.csr_matrix(
+            (self.scores[valid], self.indices[valid], indptr), shape=(n, n)
+        )
+
+
+def top_k_rows(block, k):
+    """
+    Select the k best entries of every row of a dense score block.
+    Scores are ordered descending with ties broken by ascending column index,
+    matching a stable sort of the full row.
+    :param block: 2-D array of scores
+    :param k: Number of entries to keep per row
+    :return: Tuple of (indices, scores) arrays of shape (n_rows, min(k, n_cols))
+    """
+    block = np.asarray(block)
+    n_rows, n_cols = block.shape
+    k = min(k, n_cols)
+    if k <= 0:
+        return np.empty((n_rows, 0), dtype=np.int64), np.empty((n_rows, 0), dtype=block.dtype)
+
+    if k < n_cols:
+        selected = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        # argpartition picks arbitrarily between equal scores at the cut-off,
+        # so rows with such ties are resolved one at a time.
+        threshold = np.take_along_axis(block, selected, axis=1).min(axis=1, keepdims=True)
+        above = (block > threshold).sum(axis=1)
+        tied = (block == threshold).sum(axis=1)
+        for row in np.flatnonzero(above + tied > k):
+            winners = np.flatnonzero(block[row] > threshold[row])
+            ties = np.flatnonzero(block[row] == threshold[row])[:k - winners.size]
+            selected[row] = np.concatenate([winners, ties])
+    else:
+        selected = np.broadcast_to(np.arange(n_cols), (n_rows, n_cols)).copy()
+
+    selected_scores = np.take_along_axis(block, selected, axis=1)
+    order = np.lexsort((selected, -selected_scores), axis=1)
+    return (
+        np.take_along_axis(selected, order, axis=1).astype(np.int64),
+        np.take_along_axis(selected_scores, order, axis=1),
+    )
+
+
+def compute_topk_neighbors(tfidf_matrix, k, block_size=1024, n_jobs=1, shard_size=None):
+    """
+    Compute the top-k cosine neighbours of every row without materialising
+    the full N x N similarity matrix. Peak memory is block_size x N scores
+    per process.
+    :param tfidf_matrix: Sparse TF-IDF matrix, one row per movie
+    :param k: Number of neighbours to keep per movie (the movie itself included)
+    :param block_size: Number of rows scored at once
+    :param n_jobs: Worker processes; above 1 the rows are split into shards
+                   built in parallel by compute_topk_neighbors_sharded
+    :param shard_size: Rows per shard, defaults to splitting into 4 shards per worker
+    :return: NeighborTable
+    """
+    if n_jobs > 1:
+        return compute_topk_neighbors_sharded(tfidf_matrix, k, block_size, n_jobs, shard_size)
+    return NeighborTable(*compute_neighbor_rows(tfidf_matrix, np.arange(tfidf_matrix.shape[0]), k, block_size))
+
+
+_shared_matrix = None
+
+
+def _open_shared_matrix(shared_dir, shape):
+    global _shared_matrix
+    _shared_matrix = sparse.csr_matrix(
+        tuple(np.load(os.path.join(shared_dir, f'{name}.npy'), mmap_mode='r')
+              for name in ('data', 'indices', 'indptr')),
+        shape=shape,
+    )
+
+
+def _build_shard(shared_dir, start, stop, k, block_size):
+    indices, scores = compute_neighbor_rows(_shared_matrix, np.arange(start, stop), k, block_size)
+    out_indices = np.load(os.path.join(shared_dir, 'out_indices.npy'), mmap_mode='r+')
+    out_scores = np.load(os.path.join(shared_dir, 'out_scores.npy'), mmap_mode='r+')
+    out_indices[start:stop] = indices
+    out_scores[start:stop] = scores
+    out_indices.flush()
+    out_scores.flush()
+    return stop - start
+
+
+def compute_topk_neighbors_sharded(tfidf_matrix, k, block_size=1024, n_jobs=None, shard_size=None):
+    """
+    Build the neighbour table in a process pool. The TF-IDF matrix and the
+    output table are shared through memory-mapped files, so nothing large
+    is pickled; each worker writes its shard straight into the output.
+    :param tfidf_matrix: Sparse TF-IDF matrix, one row per movie
+    :param k: Number of neighbours to keep per movie
+    :param block_size: Rows scored at once inside a shard
+    :param n_jobs: Worker processes, defaults to the CPU count
+    :param shard_size: Rows per shard, defaults to splitting into 4 shards per worker
+    :return: NeighborTable
+    """
+    n_jobs = n_jobs or os.cpu_count()
+    tfidf_matrix = tfidf_matrix.tocsr()
+    n = tfidf_matrix.shape[0]
+    depth = min(k, n)
+    shard_size = shard_size or max(1, -(-n // (4 * n_jobs)))
+
+    shared_dir = tempfile.mkdtemp(prefix='neighbors-')
+    try:
+        for name in ('data', 'indices', 'indptr'):
+            np.save(os.path.join(shared_dir, f'{name}.npy'), getattr(tfidf_matrix, name))
+        np.lib.format.open_memmap(
+            os.path.join(shared_dir, 'out_indices.npy'), mode='w+', dtype=np.int64, shape=(n, depth)
+        ).flush()
+        np.lib.format.open_memmap(
+            os.path.join(shared_dir, 'out_scores.npy'), mode='w+', dtype=np.float64, shape=(n, depth)
+        ).flush()
+
+        # spawn rather than fork: the serving process may be running other threads
+        with ProcessPoolExecutor(
+            max_workers=n_jobs,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_open_shared_matrix,
+            initargs=(shared_dir, tfidf_matrix.shape),
+        ) as pool:
+            futures = [
+                pool.submit(_build_shard, shared_dir, start, min(start + shard_size, n), depth, block_size)
+                for start in range(0, n, shard_size)
+            ]
+            for future in futures:
+                future.result()
+
+        return NeighborTable(
+            np.load(os.path.join(shared_dir, 'out_indices.npy')),
+            np.load(os.path.join(shared_dir, 'out_scores.npy')),
+        )
+    finally:
+        shutil.rmtree(shared_dir, ignore_errors=True)
+
+
+def compute_neighbor_rows(tfidf_matrix, rows, k, block_size=1024, excluded=None):
+    """
+    Compute the top-k neighbour lists of selected rows.
+    :param tfidf_matrix: Sparse TF-IDF matrix, one row per movie
+    :param rows: Row ids to compute
+    :param k: Number of neighbours to keep per row
+    :param block_size: Rows scored at once
+    :param excluded: Optional movie indices that must not appear in any list
+    :return: Tuple of (indices, scores) arrays, padded with -1 / -inf
+    """
+    depth = min(k, tfidf_matrix.shape[0])
+    indices = np.empty((len(rows), depth), dtype=np.int64)
+    scores = np.empty((len(rows), depth), dtype=np.float64)
+
+    for start in range(0, len(rows), block_size):
+        stop = min(start + block_size, len(rows))
+        block = cosine_similarity(tfidf_matrix[rows[start:stop]], tfidf_matrix)
+        if excluded is not None:
+            block[:, excluded] = -np.inf
+        indices[start:stop], scores[start:stop] = top_k_rows(block, depth)
+
+    indices[scores == -np.inf] = -1
+    return indices, scores
+
+
+def top_k_indices(scores, k, exclude=None, mask=None):
+    """
+    Rank one score row with a partial selection instead of a full sort.
+    :param scores: 1-D array of scores, one per movie
+    :param k: Number of indices to return
+    :param exclude: Optional index or array of indices that must not be returned
+    :param mask: Optional boolean array; indices where it is False are not returned
+    :return: Array of at most k indices, best first, ties by ascending index
+    """
+    scores = np.array(scores, dtype=np.float64)
+    if mask is not None:
+        scores[~mask] = -np.inf
+    if exclude is not None:
+        scores[exclude] = -np.inf
+    indices, selected = top_k_rows(scores[np.newaxis], k)
+    return indices[0][selected[0] > -np.inf]
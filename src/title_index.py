@@ -0,0 +1,197 @@
+import itertools
+import re
+import unicodedata
+
+import numpy as np
+
+_YEAR_SUFFIX = re.compile(r'^(?P<base>.*?\S)\s*(?:[\(\[]\s*(?P<year>\d{4})\s*[\)\]]|[,\-]\s*(?P<bare>\d{4}))\s*$')
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+
+def normalize_title(title):
+    """
+    Fold a title to a lookup key: accents stripped, lowercased, '&' read as
+    'and', punctuation collapsed to single spaces.
+    :param title: Raw title
+    :return: Normalized key
+    """
+    title = unicodedata.normalize('NFKD', str(title))
+    title = ''.join(ch for ch in title if not unicodedata.combining(ch))
+    title = title.lower().replace('&', ' and ')
+    return _NON_ALNUM.sub(' ', title).strip()
+
+
+def split_year(title):
+    """
+    Split a trailing release year such as 'Heat (1995)' or 'Heat - 1995' off a title.
+    Bare trailing numbers are left alone so titles like '2012' survive.
+    :param title: Raw title
+    :return: Tuple of (title without year, year or None)
+    """
+    match = _YEAR_SUFFIX.match(str(title).strip())
+    if not match:
+        return str(title).strip(), None
+    return match.group('base'), int(match.group('year') or match.group('bare'))
+
+
+def trigrams(key):
+    """Character trigrams of a normalized key, padded so short words still produce some."""
+    padded = f'  {key} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def pack_postings(groups):
+    """
+    Lay out a dict of ASCII key to row ids as sorted key, offset and row
+    arrays, which can be saved, memory-mapped and searched with np.searchsorted.
+    :param groups: Dict of key to list of row ids
+    :return: Tuple of (keys as a bytes array, int64 offsets, int32 rows)
+    """
+    keys = sorted(groups)
+    counts = [len(groups[key]) for key in keys]
+    rows = np.fromiter(itertools.chain.from_iterable(groups[key] for key in keys), dtype=np.int32, count=sum(counts))
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    return np.array([key.encode('ascii') for key in keys], dtype=bytes), offsets, rows
+
+
+class TitleIndex:
+    """
+    Sorted index from normalized title to row ids, plus a character-trigram
+    inverted index for resolving misspelled or partial titles. Both are
+    flat arrays, so an index saved with to_arrays can be memory-mapped
+    back with from_arrays instead of being rebuilt.
+    """
+
+    def __init__(self, titles, years=None):
+        """
+        :param titles: Catalog titles in row order, None for rows that must not match
+        :param years: Optional release years in row order, used to disambiguate remakes
+        """
+        normalized = {}
+        postings = {}
+        trigram_counts = np.zeros(len(titles), dtype=np.int32)
+
+        for row, title in enumerate(titles):
+            if title is None:
+                continue
+            key = normalize_title(title)
+            normalized.setdefault(key, []).append(row)
+            grams = trigrams(key)
+            trigram_counts[row] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(row)
+
+        self.set_arrays(titles, years, pack_postings(normalized), pack_postings(postings), trigram_counts)
+
+    def set_arrays(self, titles, years, normalized, postings, trigram_counts):
+        self.titles = list(titles)
+        self.years = list(years) if years is not None else [None] * len(self.titles)
+        self.exact = {}
+        for row, title in enumerate(self.titles):
+            if title is not None:
+                self.exact.setdefault(title, row)
+        self.keys, self.key_offsets, self.key_rows = normalized
+        self.grams, self.gram_offsets, self.gram_rows = postings
+        self.trigram_counts = trigram_counts
+
+    def to_arrays(self):
+        return {
+            'title_keys': self.keys,
+            'title_key_offsets': self.key_offsets,
+            'title_key_rows': self.key_rows,
+            'title_grams': self.grams,
+            'title_gram_offsets': self.gram_offsets,
+            'title_gram_rows': self.gram_rows,
+            'title_trigram_counts': self.trigram_counts,
+        }
+
+    @classmethod
+    def from_arrays(cls, titles, years, arrays):
+        """
+        :param titles: Titles the index was built from, in row order
+        :param years: Release years in row order
+        :param arrays: Arrays from to_arrays, possibly memory-mapped
+        :return: TitleIndex
+        """
+        index = cls.__new__(cls)
+        index.set_arrays(
+            titles, years,
+            (arrays['title_keys'], arrays['title_key_offsets'], arrays['title_key_rows']),
+            (arrays['title_grams'], arrays['title_gram_offsets'], arrays['title_gram_rows']),
+            arrays['title_trigram_counts'],
+        )
+        return index
+
+    def normalized_rows(self, key):
+        """Row ids whose normalized title is key, in row order, or None."""
+        key = key.encode('ascii')
+        i = np.searchsorted(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            return None
+        return self.key_rows[self.key_offsets[i]:self.key_offsets[i + 1]].tolist()
+
+    def lookup(self, title):
+        """
+        Resolve a title to a row id using exact, then normalized, then year-stripped matching.
+        :param title: Title as typed by a user or returned by an upstream
+        :return: Row id, or None if no catalog entry matches
+        """
+        if title in self.exact:
+            return self.exact[title]
+
+        rows = self.normalized_rows(normalize_title(title))
+        year = None
+        if rows is None:
+            base, year = split_year(title)
+            rows = self.normalized_rows(normalize_title(base))
+        if not rows:
+            return None
+        if year is not None:
+            for row in rows:
+                if self.years[row] == year:
+                    return row
+        return rows[0]
+
+    def match(self, title, year=None, year_tolerance=1):
+        """
+        Strict lookup for titles from an upstream: the normalized title must
+        match, and when a year is given, the release year must be within
+        year_tolerance of it, so a suggested remake does not resolve to the original.
+        :param title: Title without a year suffix
+        :param year: Optional release year
+        :param year_tolerance: Largest accepted difference in years
+        :return: Row id, or None if no catalog entry matches
+        """
+        rows = self.normalized_rows(normalize_title(title))
+        if not rows:
+            return None
+        if year is None:
+            return rows[0]
+        close = [row for row in rows if self.years[row] is not None and abs(self.years[row] - year) <= year_tolerance]
+        return min(close, key=lambda row: abs(self.years[row] - year)) if close else None
+
+    def search(self, query, limit=5, min_score=0.3):
+        """
+        Rank catalog titles by trigram similarity (Dice coefficient) to the query.
+        :param query: Possibly misspelled or partial title
+        :param limit: Maximum number of matches
+        :param min_score: Minimum similarity in [0, 1]
+        :return: List of (row id, score) tuples, best first
+        """
+        base, _ = split_year(query)
+        grams = trigrams(normalize_title(base))
+        queried = np.array([gram.encode('ascii') for gram in grams], dtype=bytes)
+        found = np.minimum(np.searchsorted(self.grams, queried), max(len(self.grams) - 1, 0))
+        found = found[self.grams[found] == queried] if len(self.grams) else found[:0]
+        if not len(found):
+            return []
+
+        hits = [self.gram_rows[self.gram_offsets[i]:self.gram_offsets[i + 1]] for i in found]
+        overlap = np.bincount(np.concatenate(hits), minlength=len(self.titles))
+        candidates = np.flatnonzero(overlap)
+        scores = 2.0 * overlap[candidates] / (len(grams) + self.trigram_counts[candidates])
+        keep = scores >= min_score
+        candidates, scores = candidates[keep], scores[keep]
+
+        order = np.lexsort((candidates, -scores))[:limit]
+        return [(int(candidates[i]), float(scores[i])) for i in order]
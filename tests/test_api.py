@@ -0,0 +1,766 @@
+import pytest
+import json
+import pandas as pd
+import threading
+import time
+import sys
+import os
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from api.fanout import fan_out
+from api.tmdb_client import TMDBClient, TMDBError, director, is_upstream_failure, trailer_link
+from api.metadata_cache import MetadataCache
+from api.llm_cache import LLMResponseCache
+from api.local_metadata import LocalMetadataStore
+from api.list_snapshots import ListSnapshots
+from api.single_flight import SingleFlight
+from api.title_resolver import TitleResolver, clean_title_line
+from api.upstream_guard import CircuitBreaker, TokenBucket, UpstreamGuard, UpstreamUnavailable
+
+DETAILS = {
+    'id': 949, 'title': 'Heat', 'runtime': 170,
+    'credits': {'crew': [{'job': 'Producer', 'name': 'Art Linson'}, {'job': 'Director', 'name': 'Michael Mann'}]},
+    'videos': {'results': [{'type': 'Teaser', 'site': 'YouTube', 'key': 'a'}, {'type': 'Trailer', 'site': 'YouTube', 'key': 'b'}]},
+}
+
+
+class StubTMDB(BaseHTTPRequestHandler):
+    """Local stand-in for the TMDB API; a path's queued statuses are answered before a 200."""
+    responses = {}
+    requests = []
+    retry_after = '0'
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        StubTMDB.requests.append((url.path, query))
+        queued = StubTMDB.responses.get(url.path, [])
+        status = queued.pop(0) if queued else 200
+        if status == 'slow':
+            time.sleep(0.5)
+            status = 200
+        body = {'status_message': 'error'}
+        if status == 200:
+            if url.path == '/3/search/movie':
+                body = {'results': [{'id': 949, 'title': query['query'][0], 'overview': '', 'vote_average': 7.7}]}
+            elif url.path == '/3/movie/949':
+                body = DETAILS
+            elif url.path == '/3/movie/19995':
+                body = {'id': 19995, 'title': 'Avatar', 'runtime': 162, 'poster_path': '/avatar.jpg',
+                        'credits': {'crew': []}, 'videos': {'results': []}}
+            else:
+                page = int(query.get('page', ['1'])[0])
+                body = {'results': [{'id': page, 'title': f'{url.path} page {page}', 'overview': '', 'vote_average': 7.0,
+                                     'genre_ids': [18], 'poster_path': None}]}
+        payload = json.dumps(body).encode()
+        try:
+            self.send_response(status)
+            if status == 429:
+                self.send_header('Retry-After', StubTMDB.retry_after)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up waiting on a slow response
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class StubOpenAI(BaseHTTPRequestHandler):
+    """
+    Local stand-in for the chat completions API, streaming one chunk per
+    line_delay. With finish_reason 'length' the last line is cut off before its newline.
+    """
+    lines = []
+    line_delay = 0
+    finish_reason = 'stop'
+    requests = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        StubOpenAI.requests.append(body)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        for i, line in enumerate(StubOpenAI.lines):
+            cut_off = StubOpenAI.finish_reason == 'length' and i == len(StubOpenAI.lines) - 1
+            # Split each line across two chunks, the newline ending the second
+            for piece in (line[:2], line[2:] + ('' if cut_off else '\n')):
+                self.send_chunk(body, {'content': piece}, None)
+            time.sleep(StubOpenAI.line_delay)
+        self.send_chunk(body, {}, StubOpenAI.finish_reason)
+        self.wfile.write(b'data: [DONE]\n\n')
+
+    def send_chunk(self, body, delta, finish_reason):
+        chunk = {'id': 'chunk', 'object': 'chat.completion.chunk', 'created': 0, 'model': body['model'],
+                 'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]}
+        self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode())
+        self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def openai_server():
+    StubOpenAI.lines = []
+    StubOpenAI.line_delay = 0
+    StubOpenAI.finish_reason = 'stop'
+    StubOpenAI.requests = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubOpenAI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/v1'
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def tmdb_server():
+    StubTMDB.responses = {}
+    StubTMDB.requests = []
+    StubTMDB.retry_after = '0'
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubTMDB)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/3'
+    server.shutdown()
+    server.server_close()
+
+
+def test_fan_out_keeps_order_and_resolves_each_key_once():
+    calls = []
+    lock = threading.Lock()
+
+    def lookup(title):
+        with lock:
+            calls.append(title)
+        time.sleep(0.05 if title == 'Heat' else 0)
+        if title == 'Missing':
+            return None
+        if title == 'Broken':
+            raise RuntimeError('upstream error')
+        return title.upper()
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = fan_out(pool, lookup, ['Heat', 'Alien', 'Missing', 'Heat', 'Broken'])
+
+    assert results == ['HEAT', 'ALIEN', None, 'HEAT', None]
+    assert sorted(calls) == ['Alien', 'Broken', 'Heat', 'Missing']
+
+
+def test_fan_out_drops_keys_past_the_deadline():
+    release = threading.Event()
+
+    def lookup(title):
+        if title == 'Slow':
+            release.wait(5)
+        return title
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        start = time.monotonic()
+        results = fan_out(pool, lookup, ['Fast', 'Slow', 'Also fast'], timeout=0.2)
+        elapsed = time.monotonic() - start
+        release.set()
+
+    assert results == ['Fast', None, 'Also fast']
+    assert elapsed < 1
+
+
+def test_tmdb_client_retries_throttled_and_failed_requests(tmdb_server):
+    client = TMDBClient('key', base_url=tmdb_server, backoff_factor=0)
+    StubTMDB.responses = {'/3/search/movie': [429, 503]}
+
+    assert client.search_movie('Heat')[0]['title'] == 'Heat'
+    assert [path for path, _ in StubTMDB.requests] == ['/3/search/movie'] * 3
+    assert StubTMDB.requests[0][1]['api_key'] == ['key']
+
+    details = client.movie_details(949, append=('credits', 'videos'))
+    assert StubTMDB.requests[-1][1]['append_to_response'] == ['credits,videos']
+    assert director(details) == 'Michael Mann'
+    assert trailer_link(details) == 'https://www.youtube.com/watch?v=b'
+    assert client.movie_list('upcoming')[0]['title'] == '/3/movie/upcoming page 1'
+    assert StubTMDB.requests[-1][0] == '/3/movie/upcoming'
+
+
+def test_tmdb_client_caps_retry_after_at_backoff_max(tmdb_server):
+    client = TMDBClient('key', base_url=tmdb_server, backoff_factor=0, backoff_max=0.1)
+    StubTMDB.responses = {'/3/search/movie': [429, 429]}
+    StubTMDB.retry_after = '120'
+
+    start = time.monotonic()
+    assert client.search_movie('Heat')[0]['title'] == 'Heat'
+    assert time.monotonic() - start < 2
+    assert len(StubTMDB.requests) == 3
+
+
+def test_tmdb_client_admits_each_retry_through_the_guard(tmdb_server):
+    guard = UpstreamGuard('tmdb', rate=0.01, burst=2, acquire_timeout=0, failure_threshold=10,
+                          is_failure=is_upstream_failure)
+    client = TMDBClient('key', base_url=tmdb_server, backoff_factor=0, guard=guard)
+    StubTMDB.responses = {'/3/movie/949': [503, 503]}
+
+    with pytest.raises(TMDBError) as error:
+        client.movie_details(949)
+    assert 'rate limit' in str(error.value)
+    assert len(StubTMDB.requests) == 2
+    assert guard.state()['calls'] == 2 and guard.state()['rejected_rate'] == 1 and guard.state()['in_flight'] == 0
+
+
+def test_tmdb_client_raises_on_errors_and_timeouts(tmdb_server):
+    client = TMDBClient('key', base_url=tmdb_server, retries=1, backoff_factor=0, read_timeout=0.2)
+    StubTMDB.responses = {'/3/movie/1': [404], '/3/movie/2': [500, 500], '/3/movie/3': ['slow', 'slow']}
+
+    with pytest.raises(TMDBError) as error:
+        client.movie_details(1)
+    assert error.value.status == 404
+    with pytest.raises(TMDBError):
+        client.movie_details(2)
+    with pytest.raises(TMDBError):
+        client.movie_details(3)
+
+
+def test_metadata_cache_ttl_negative_entries_and_sharing(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = MetadataCache(path, ttl=60, negative_ttl=60)
+    calls = []
+
+    def fetch(value):
+        def fetch():
+            calls.append(value)
+            return value
+        return fetch
+
+    assert cache.get_or_fetch('search:heat', fetch({'id': 949})) == {'id': 949}
+    assert cache.get_or_fetch('search:heat', fetch({'id': 0})) == {'id': 949}
+    assert cache.get_or_fetch('search:nothing', fetch(None)) is None
+    assert cache.get_or_fetch('search:nothing', fetch({'id': 1})) is None
+    assert calls == [{'id': 949}, None]
+
+    # A second worker process opening the same file sees the entries
+    other_worker = MetadataCache(path)
+    assert other_worker.lookup('search:heat') == ('fresh', {'id': 949})
+    assert other_worker.lookup('search:nothing') == ('fresh', None)
+
+    def unavailable():
+        raise TMDBError('down')
+
+    with pytest.raises(TMDBError):
+        cache.get_or_fetch('search:down', unavailable)
+    assert cache.lookup('search:down') == ('miss', None)
+
+
+def test_metadata_cache_serves_stale_while_revalidating(tmp_path):
+    cache = MetadataCache(str(tmp_path / 'cache.sqlite'), ttl=60, stale_ttl=60)
+    cache.set('details:1', {'runtime': 100}, ttl=-1)
+    refreshed = threading.Event()
+
+    def fetch():
+        refreshed.set()
+        return {'runtime': 120}
+
+    assert cache.get_or_fetch('details:1', fetch) == {'runtime': 100}
+    assert refreshed.wait(5)
+    for _ in range(50):
+        if cache.lookup('details:1') == ('fresh', {'runtime': 120}):
+            break
+        time.sleep(0.02)
+    assert cache.lookup('details:1') == ('fresh', {'runtime': 120})
+
+    cache.set('details:2', {'runtime': 90}, ttl=-120)
+    assert cache.lookup('details:2') == ('miss', None)
+
+
+def test_metadata_cache_evicts_least_recently_used(tmp_path):
+    cache = MetadataCache(str(tmp_path / 'cache.sqlite'), max_entries=2)
+    cache.set('a', 1)
+    time.sleep(0.01)
+    cache.set('b', 2)
+    time.sleep(0.01)
+    cache.lookup('a')
+    time.sleep(0.01)
+    cache.set('c', 3)
+
+    assert cache.lookup('b') == ('miss', None)
+    assert cache.lookup('a')[1] == 1 and cache.lookup('c')[1] == 3
+    assert cache.stats()['entries'] == 2
+
+
+def test_metadata_cache_batches_access_times_and_eviction_checks(tmp_path):
+    import sqlite3
+    path = str(tmp_path / 'cache.sqlite')
+    cache = MetadataCache(path, access_batch=3, access_interval=60)
+    for key in 'abc':
+        cache.set(key, key)
+    written = lambda: sqlite3.connect(path).execute("SELECT last_access FROM entries WHERE key = 'a'").fetchone()[0]
+    stored_at = written()
+
+    time.sleep(0.01)
+    cache.lookup('a')
+    cache.lookup('b')
+    assert written() == stored_at
+    cache.lookup('c')
+    assert written() > stored_at
+
+    small = MetadataCache(str(tmp_path / 'small.sqlite'), max_entries=1, evict_every=3)
+    small.set('a', 1)
+    small.set('b', 2)
+    assert small.stats()['entries'] == 2
+    small.set('c', 3)
+    assert small.stats()['entries'] == 1 and small.lookup('c')[1] == 3
+
+
+@pytest.fixture
+def app(tmdb_server, tmp_path, monkeypatch):
+    monkeypatch.setenv('OPENAI_API_KEY', 'test')
+    monkeypatch.setenv('TMDB_API_KEY', 'key')
+    monkeypatch.setenv('TMDB_API_URL', tmdb_server)
+    monkeypatch.setenv('METADATA_CACHE', str(tmp_path / 'cache.sqlite'))
+    monkeypatch.setenv('LLM_CACHE', str(tmp_path / 'llm_cache.sqlite'))
+    monkeypatch.setenv('RECOMMENDER_ARTIFACT', str(tmp_path / 'no_artifact'))
+    monkeypatch.setenv('LIST_SNAPSHOT_INTERVAL', '0')
+    from api.index import MovieRecommenderApp
+    return MovieRecommenderApp()
+
+
+def test_local_metadata_store():
+    movies = pd.DataFrame({
+        'movie_id': [949, 1, 2],
+        'title': ['Heat', 'Solaris', 'Solaris'],
+        'overview': ['Thieves', 'Space', None],
+        'genres': ['Action Crime Drama Thriller', 'Science Fiction', 'Drama Science Fiction'],
+        'vote_average': [7.7, 7.0, 6.0],
+        'release_date': ['1995-12-15', '1972-03-20', '2002-11-27'],
+        'crew': ["['Michael Mann']", "['Andrei Tarkovsky']", []],
+    })
+    store = LocalMetadataStore(movies, runtimes={949: 170})
+
+    heat = store.lookup('Heat')
+    assert heat['director'] == 'Michael Mann' and heat['runtime'] == 170
+    assert heat['genre'] == ['Action', 'Crime', 'Drama', 'Thriller']
+    assert store.lookup('Solaris (2002)')['id'] == 2 and store.lookup('Solaris')['id'] == 1
+    assert store.lookup('Unknown Movie') is None
+    assert store.get(2)['overview'] is None and store.get(2)['director'] is None
+
+    assert store.missing_fields(heat) == ['poster_path', 'trailer_link']
+    updated = store.update(949, {'poster_path': '/heat.jpg', 'trailer_link': None})
+    assert updated['poster_path'] == '/heat.jpg' and heat['poster_path'] is None
+    assert store.missing_fields(updated) == []
+
+
+def test_catalog_movies_are_served_from_local_metadata(app):
+    first = app.fetch_movie_details('Avatar (2009)')
+    second = app.fetch_movie_details('avatar')
+
+    assert first == second
+    assert first['director'] == 'James Cameron' and 'Science Fiction' in first['genre']
+    assert first['poster_path'] == 'https://image.tmdb.org/t/p/w500/avatar.jpg' and first['runtime'] == 162
+    assert [path for path, _ in StubTMDB.requests] == ['/3/movie/19995']
+
+    remote = app.fetch_movie_details('Some Festival Film')
+    assert remote['title'] == 'Some Festival Film'
+    assert StubTMDB.requests[1][0] == '/3/search/movie'
+
+
+def test_list_snapshots_swap_in_new_pages():
+    version = [1]
+    calls = []
+
+    def fetch(page):
+        calls.append(page)
+        if version[0] == 3:
+            raise TMDBError('down')
+        return [{'id': page, 'version': version[0]}] if page <= 2 else []
+
+    snapshots = ListSnapshots({'trending': fetch}, lambda movies: [dict(movie) for movie in movies], n_pages=5)
+    assert snapshots.get('trending') is None
+
+    snapshots.refresh_all()
+    cards, refreshed_at = snapshots.get('trending', 2)
+    assert cards == ({'id': 2, 'version': 1},) and calls == [1, 2, 3]
+    assert snapshots.get('trending', 4) is None
+
+    version[0] = 2
+    snapshots.refresh_all()
+    assert snapshots.get('trending', 1)[0] == ({'id': 1, 'version': 2},)
+    assert snapshots.get('trending', 1)[1] >= refreshed_at
+
+    version[0] = 3
+    snapshots.refresh_all()
+    assert snapshots.get('trending', 1)[0] == ({'id': 1, 'version': 2},)
+
+
+def test_list_routes_serve_snapshots(app):
+    client = app.app.test_client()
+    app.list_snapshots.refresh('upcoming')
+    requests_after_refresh = len(StubTMDB.requests)
+
+    response = client.get('/upcoming', headers={'Accept': 'application/json'})
+    assert response.json['movies'][0]['title'] == '/3/movie/upcoming page 1'
+    assert response.json['movies'][0]['genre'] == ['Drama']
+    assert response.json['refreshed_at'] == app.list_snapshots.snapshots['upcoming'].refreshed_at
+    assert len(StubTMDB.requests) == requests_after_refresh
+
+    response = client.get('/top_rated?page=2', headers={'Accept': 'application/json'})
+    assert response.json['movies'][0]['title'] == '/3/movie/top_rated page 2'
+
+
+def run_concurrently(n_threads, fn):
+    barrier = threading.Barrier(n_threads)
+    results = [None] * n_threads
+
+    def worker(i):
+        barrier.wait()
+        try:
+            results[i] = fn(i)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_single_flight_shares_results_and_errors():
+    flight = SingleFlight()
+    calls = []
+
+    def upstream():
+        calls.append(1)
+        time.sleep(0.2)
+        return ['Heat', 'Alien']
+
+    assert run_concurrently(8, lambda i: flight.do('openai:horror', upstream)) == [['Heat', 'Alien']] * 8
+    assert len(calls) == 1
+    assert flight.stats() == {'calls': 8, 'executed': 1, 'coalesced': 7, 'in_flight': 0}
+
+    def failing():
+        time.sleep(0.2)
+        raise TMDBError('down')
+
+    errors = run_concurrently(4, lambda i: flight.do('list:trending:1', failing))
+    assert all(isinstance(error, TMDBError) for error in errors)
+    assert flight.do('openai:horror', lambda: ['Alien']) == ['Alien']
+
+
+def test_single_flight_coalesces_cache_misses_across_workers(tmp_path):
+    path, locks = str(tmp_path / 'cache.sqlite'), str(tmp_path / 'locks')
+    workers = [MetadataCache(path, single_flight=SingleFlight(lock_dir=locks)) for _ in range(2)]
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.2)
+        return {'id': 949}
+
+    results = run_concurrently(6, lambda i: workers[i % 2].get_or_fetch('search:heat', fetch))
+    assert results == [{'id': 949}] * 6
+    assert len(calls) == 1
+    assert workers[0].hits['filled_by_peer'] + workers[1].hits['filled_by_peer'] == 1
+
+
+def test_token_bucket_limits_the_sustained_rate():
+    bucket = TokenBucket(rate=20, burst=2)
+    assert bucket.acquire() and bucket.acquire()
+    assert not bucket.acquire()
+
+    start = time.monotonic()
+    assert bucket.acquire(timeout=1)
+    assert 0.02 < time.monotonic() - start < 0.5
+
+
+def test_circuit_breaker_opens_and_lets_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.1)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open' and not breaker.allow()
+
+    time.sleep(0.15)
+    assert breaker.allow() and breaker.state == 'half_open'
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+
+    time.sleep(0.15)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed' and breaker.allow()
+
+
+def test_upstream_guard_caps_concurrency():
+    guard = UpstreamGuard('tmdb', rate=100, max_concurrency=2, acquire_timeout=0.05)
+
+    def slow_call(i):
+        return guard.call(lambda: time.sleep(0.3) or i)
+
+    results = run_concurrently(3, slow_call)
+    assert sum(isinstance(r, UpstreamUnavailable) for r in results) == 1
+    assert guard.state()['rejected_busy'] == 1 and guard.state()['in_flight'] == 0
+
+
+def test_guarded_tmdb_client_fails_fast_while_tmdb_is_down(tmdb_server):
+    guard = UpstreamGuard('tmdb', rate=100, failure_threshold=2, reset_timeout=60, is_failure=is_upstream_failure)
+    client = TMDBClient('key', base_url=tmdb_server, retries=0, guard=guard)
+    StubTMDB.responses = {'/3/movie/1': [404, 404, 404], '/3/movie/2': [500, 500]}
+
+    for _ in range(3):
+        with pytest.raises(TMDBError):
+            client.movie_details(1)
+    assert guard.state()['breaker'] == 'closed'
+
+    for _ in range(2):
+        with pytest.raises(TMDBError):
+            client.movie_details(2)
+    requests_sent = len(StubTMDB.requests)
+    with pytest.raises(TMDBError) as error:
+        client.movie_details(949)
+    assert 'circuit is open' in str(error.value)
+    assert len(StubTMDB.requests) == requests_sent
+    assert guard.state()['rejected_open'] == 1 and guard.state()['failures'] == 2
+
+
+def test_chat_outage_degrades_to_catalog_titles(app):
+    for _ in range(app.openai_guard.breaker.failure_threshold):
+        app.openai_guard.breaker.record_failure()
+
+    titles = app.get_recommended_titles('genre', 'Science Fiction', 3)
+    assert titles == ['Interstellar', 'Guardians of the Galaxy', 'Mad Max: Fury Road']
+    assert app.get_recommended_titles('mood', 'calm', 2)
+    assert app.llm_cache.stats()['completions'] == 0
+
+    stats = app.app.test_client().get('/stats').json
+    assert stats['upstreams']['openai']['breaker'] == 'open'
+    assert stats['upstreams']['openai']['rejected_open'] == 2
+
+
+def test_async_app_serves_pages_with_async_upstreams(app, monkeypatch):
+    import asyncio
+    from aiohttp.test_utils import TestClient, TestServer
+    from api.async_app import AsyncMovieRecommenderApp
+
+    async_app = AsyncMovieRecommenderApp()
+    for _ in range(async_app.openai_guard.breaker.failure_threshold):
+        async_app.openai_guard.breaker.record_failure()
+    sqlite_threads = []
+    for cache, method in ((async_app.metadata_cache, 'lookup'), (async_app.metadata_cache, 'set'),
+                          (async_app.llm_cache, 'pick')):
+        def recorded(*args, call=getattr(cache, method), **kwargs):
+            sqlite_threads.append(threading.current_thread())
+            return call(*args, **kwargs)
+        monkeypatch.setattr(cache, method, recorded)
+    with app.app.test_request_context():
+        cookie = app.app.session_interface.get_signing_serializer(app.app).dumps({'user_id': 1, 'username': 'ada'})
+
+    async def scenario():
+        async with TestClient(TestServer(async_app.web)) as client:
+            client.session.cookie_jar.update_cookies({'session': cookie})
+            response = await client.post('/genre_based', data={'category': 'Science Fiction', 'number': '3'})
+            html = await response.text()
+            assert response.status == 200
+            assert 'Interstellar' in html and 'ada' in html and '/static/main.css' in html
+
+            response = await client.get('/trending?page=4', headers={'Accept': 'application/json'})
+            movies = (await response.json())['movies']
+            assert movies[0]['title'] == '/3/trending/movie/day page 4' and movies[0]['genre'] == ['Drama']
+
+            response = await client.post('/content_based', data={'movie': 'Avatr', 'number': '2'})
+            assert response.status == 200
+            assert (await (await client.get('/check_login')).json()) == {'logged_in': True, 'user_id': 1}
+
+            stats = await (await client.get('/stats')).json()
+            assert stats['upstreams']['openai']['rejected_open'] == 1
+            assert stats['async_single_flight']['executed'] >= 1
+
+    asyncio.run(scenario())
+    # SQLite calls may wait on another worker's write lock, so none run on the event loop
+    assert sqlite_threads and threading.main_thread() not in sqlite_threads
+
+
+def test_llm_cache_rotates_samples_and_serves_smaller_numbers(tmp_path):
+    path = str(tmp_path / 'llm.sqlite')
+    cache = LLMResponseCache(path, samples_per_key=2, fill_number=10)
+    request = {'model': 'gpt-4o-mini', 'temperature': 0.7}
+    key = cache.key('genre', '  Horror ', request)
+    assert key == cache.key('genre', 'horror', request)
+    assert key != cache.key('genre', 'horror', {**request, 'temperature': 0.2})
+    assert key != cache.key('mood', 'horror', request)
+
+    calls = []
+
+    def generate(n_titles):
+        calls.append(n_titles)
+        return [f'Film {len(calls)}-{i}' for i in range(n_titles)] + ['']
+
+    assert cache.get_or_generate(key, 3, generate) == ['Film 1-0', 'Film 1-1', 'Film 1-2']
+    assert calls == [10]
+    # Fewer than samples_per_key completions: the next request samples another one
+    assert cache.get_or_generate(key, 5, generate)[0] == 'Film 2-0'
+    served = [cache.get_or_generate(key, 4, generate)[0] for _ in range(4)]
+    assert sorted(served) == ['Film 1-0', 'Film 1-0', 'Film 2-0', 'Film 2-0'] and calls == [10, 10]
+
+    reopened = LLMResponseCache(path, samples_per_key=2, fill_number=10)
+    assert len(reopened.get_or_generate(key, 10, generate)) == 10
+    assert reopened.get_or_generate(key, 12, generate)[-1] == 'Film 3-11' and calls == [10, 10, 12]
+    assert reopened.stats()['completions'] == 3
+
+
+def test_llm_cache_files_completions_under_the_titles_they_list(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / 'llm.sqlite'), fill_number=10)
+    key = cache.key('genre', 'horror', {})
+    calls = []
+
+    def generate(n_titles):
+        calls.append(n_titles)
+        return ['Alien', '', 'The Thing']
+
+    assert cache.get_or_generate(key, 2, generate) == ['Alien', 'The Thing']
+    assert cache.pick(key, 3) == (None, True)
+    assert cache.pick(key, 2)[0] == ['Alien', 'The Thing']
+    assert cache.add(key, ['', ' ']) == [] and cache.stats()['completions'] == 1
+
+
+def test_llm_cache_refreshes_expired_samples_in_the_background(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / 'llm.sqlite'), samples_per_key=1, ttl=0.1, background_refresh=True)
+    version = [1]
+    key = cache.key('mood', 'calm', {})
+    assert cache.get_or_generate(key, 2, lambda n: [f'v{version[0]}'] * n) == ['v1', 'v1']
+
+    time.sleep(0.15)
+    version[0] = 2
+    assert cache.get_or_generate(key, 2, lambda n: [f'v{version[0]}'] * n) == ['v1', 'v1']
+    cache._refresh_pool.shutdown(wait=True)
+    assert cache.get_or_generate(key, 2, lambda n: ['v3'] * n) == ['v2', 'v2']
+    assert cache.counters['background'] == 1
+
+
+def test_genre_pages_are_served_from_cached_completions(app):
+    key = app.title_cache_key('genre', 'science fiction')
+    for _ in range(app.llm_cache.samples_per_key):
+        app.llm_cache.add(key, ['Avatar', 'Interstellar', 'Heat'])
+
+    response = app.app.test_client().post('/genre_based', data={'category': 'Science Fiction ', 'number': '2'})
+    html = response.get_data(as_text=True)
+    assert 'Avatar' in html and 'Interstellar' in html and 'Heat' not in html
+    assert app.openai_guard.state()['calls'] == 0
+    assert app.llm_cache.stats()['hits'] == 1
+
+
+def read_events(body):
+    events = []
+    for block in body.strip().split('\n\n'):
+        event, data = block.split('\n')
+        events.append((event[len('event: '):], json.loads(data[len('data: '):])))
+    return events
+
+
+def test_streamed_recommendations_push_cards_per_title(app, openai_server):
+    StubOpenAI.lines = ['Avatar', 'Some Festival Film', 'Heat', 'Alien']
+    StubOpenAI.line_delay = 0.3
+    app.client = app.client.with_options(base_url=openai_server)
+    client = app.app.test_client()
+
+    start = time.monotonic()
+    response = client.get('/stream_recommendations?kind=genre&category=Science Fiction&number=2', buffered=False)
+    first_chunk = next(response.response)
+    first_event_at = time.monotonic() - start
+    rest = b''.join(response.response)
+    response.close()
+
+    assert first_chunk.startswith(b'event: movie') and first_event_at < 0.5
+    events = read_events((first_chunk + rest).decode())
+    assert [event for event, _ in events] == ['movie', 'movie', 'done']
+    assert {data['title'] for _, data in events[:2]} == {'Avatar', 'Some Festival Film'}
+    assert events[-1][1] == {'count': 2}
+    assert StubOpenAI.requests[0]['stream'] is True
+
+    # The whole completion was cached, so the next page is served without the model
+    deadline = time.monotonic() + 5
+    while app.llm_cache.stats()['completions'] == 0 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    response = client.get('/stream_recommendations?kind=genre&category=science fiction&number=3')
+    titles = {data['title'] for event, data in read_events(response.get_data(as_text=True)) if event == 'movie'}
+    assert titles == {'Avatar', 'Some Festival Film', 'Heat'}
+    assert len(StubOpenAI.requests) == 1
+    assert app.llm_cache.stats()['misses'] == 1 and app.llm_cache.stats()['hits'] == 1
+
+    page = client.get('/').get_data(as_text=True)
+    assert "new EventSource(`/stream_recommendations?${params}`)" in page
+
+    assert client.get('/stream_recommendations?kind=weather&category=x').status_code == 400
+
+
+def test_completions_cut_off_by_max_tokens_drop_their_last_line(app, openai_server):
+    from types import SimpleNamespace
+    choice = SimpleNamespace(message=SimpleNamespace(content='Avatar\n Heat \n\nAli'), finish_reason='length')
+    assert app.completion_titles(choice) == ['Avatar', 'Heat']
+    assert app.completion_titles(SimpleNamespace(message=choice.message, finish_reason='stop'))[-1] == 'Ali'
+
+    StubOpenAI.lines = ['Avatar', 'Heat', 'Ali']
+    StubOpenAI.finish_reason = 'length'
+    app.client = app.client.with_options(base_url=openai_server)
+    assert list(app.stream_movie_titles('genre', 'drama', 5)) == ['Avatar', 'Heat']
+    key = app.title_cache_key('genre', 'drama')
+    assert app.llm_cache.pick(key, 3)[0] is None
+    assert app.llm_cache.pick(key, 2)[0] == ['Avatar', 'Heat']
+
+
+def test_clean_title_line():
+    assert clean_title_line('1. Heat (1995)') == [('Heat', 1995)]
+    assert clean_title_line('2) **The Thing** (1982) - John Carpenter') == [('The Thing', 1982)]
+    assert clean_title_line('- "Alien"') == [('Alien', None)]
+    assert clean_title_line('Heat - 1995') == [('Heat', 1995)]
+    assert clean_title_line('3. 2012') == [('2012', None)]
+    assert clean_title_line('Solaris - a slow, haunting voyage') == [
+        ('Solaris - a slow, haunting voyage', None), ('Solaris', None)]
+    assert clean_title_line('Mission: Impossible') == [('Mission: Impossible', None)]
+
+
+def test_title_resolver_matches_locally_before_searching():
+    movies = pd.DataFrame({
+        'movie_id': [949, 1, 2],
+        'title': ['Heat', 'Solaris', 'Solaris'],
+        'overview': ['Thieves', 'Space', 'Space'],
+        'genres': ['Crime', 'Science Fiction', 'Drama'],
+        'vote_average': [7.7, 7.0, 6.0],
+        'release_date': ['1995-12-15', '1972-03-20', '2002-11-27'],
+        'crew': [[], [], []],
+    })
+    resolver = TitleResolver(LocalMetadataStore(movies))
+    searches = []
+
+    def search(title, year):
+        searches.append((title, year))
+        return {'id': 7, 'title': title} if title == 'Heat' else None
+
+    assert resolver.resolve('1. Heat (1995)', search)[3:5] == ('local', 949)
+    assert resolver.resolve('Solaris (2003)', search).movie_id == 2
+    assert resolver.resolve('**Solaris**', search).movie_id == 1
+    assert resolver.resolve('Solaris - a slow, haunting voyage', search).movie_id == 1
+    assert searches == []
+
+    # A year no local release is close to means a different film
+    remote = resolver.resolve('Heat (1986)', search)
+    assert (remote.source, remote.movie_id, remote.title, remote.year) == ('remote', 7, 'Heat', 1986)
+    assert resolver.resolve('4. Zardoz - a strange one', search).source == 'unresolved'
+    assert searches[-1] == ('Zardoz', None)
+    assert resolver.stats() == {'local': 4, 'remote': 1, 'unresolved': 1}
+
+
+def test_suggested_titles_are_grounded_before_tmdb_search(app):
+    local = app.fetch_movie_details('1. Avatar (2009)')
+    assert local['title'] == 'Avatar' and local['source'] == 'local'
+    assert [path for path, _ in StubTMDB.requests] == ['/3/movie/19995']
+
+    remote = app.fetch_movie_details('2. "Some Festival Film" (2019) - a quiet drama')
+    assert remote['title'] == 'Some Festival Film' and remote['source'] == 'remote'
+    assert StubTMDB.requests[1][0] == '/3/search/movie' and StubTMDB.requests[1][1]['year'] == ['2019']
+    assert app.upstream_stats()['title_resolution'] == {'local': 1, 'remote': 1, 'unresolved': 0}
@@ -0,0 +1,367 @@
+import pytest
+import pandas as pd
+import numpy as np
+import sys
+import os
+import threading
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.content_recommender import ContentRecommender
+from src.similarity import top_k_rows
+from src.model_artifact import ArtifactMismatchError, save_artifact
+from src.title_index import TitleIndex, normalize_title, split_year
+from src.ann_index import IVFIndex, cluster_sums, nearest_centroids, recall_report
+from src.live_recommender import LiveRecommender
+from src.attribute_index import AttributeIndex, parse_genres
+from src.catalog_io import SERVING_COLUMNS, read_catalog, write_catalog
+
+MOVIES = [
+    (1, 'Alien', 'A crew in space meets a deadly alien', 'Horror Science Fiction', 'space alien monster',
+     7.9, 4470, 23.3, '1979-05-25', "['Sigourney Weaver', 'Tom Skerritt', 'Veronica Cartwright']", "['Ridley Scott']"),
+    (2, 'Aliens', 'Ripley returns to the alien planet with marines', 'Horror Action Science Fiction', 'space alien marine',
+     7.7, 3220, 67.6, '1986-07-18', "['Sigourney Weaver', 'Michael Biehn', 'Carrie Henn']", "['James Cameron']"),
+    (3, 'Avatar', 'A marine on an alien moon', 'Action Adventure Fantasy Science Fiction', 'space alien marine moon',
+     7.2, 11800, 150.4, '2009-12-10', "['Sam Worthington', 'Zoe Saldana', 'Sigourney Weaver']", "['James Cameron']"),
+    (4, 'Titanic', 'A love story on a sinking ship', 'Drama Romance', 'ship love iceberg',
+     7.5, 7562, 100.0, '1997-11-18', "['Leonardo DiCaprio', 'Kate Winslet', 'Billy Zane']", "['James Cameron']"),
+    (5, 'The Notebook', 'A love story told from a notebook', 'Drama Romance', 'love memory',
+     7.7, 3067, 42.3, '2004-06-25', "['Ryan Gosling', 'Rachel McAdams', 'James Garner']", "['Nick Cassavetes']"),
+    (6, 'Heat', 'A detective hunts a crew of thieves in Los Angeles', 'Action Crime Drama Thriller', 'robbery detective',
+     7.7, 1886, 70.2, '1995-12-15', "['Al Pacino', 'Robert De Niro', 'Val Kilmer']", "['Michael Mann']"),
+    (7, 'Collateral', 'A cab driver is held hostage by a hitman in Los Angeles', 'Drama Crime Thriller', 'hitman taxi',
+     7.0, 2063, 40.6, '2004-08-05', "['Tom Cruise', 'Jamie Foxx', 'Jada Pinkett Smith']", "['Michael Mann']"),
+    (8, 'Interstellar', 'Explorers travel through a wormhole in space', 'Adventure Drama Science Fiction', 'space wormhole',
+     8.1, 10867, 724.2, '2014-11-05', "['Matthew McConaughey', 'Jessica Chastain', 'Anne Hathaway']", "['Christopher Nolan']"),
+]
+COLUMNS = ['movie_id', 'title', 'overview', 'genres', 'keywords', 'vote_average', 'vote_count',
+           'popularity', 'release_date', 'cast', 'crew']
+
+
+@pytest.fixture(scope='module')
+def csv_path(tmp_path_factory):
+    path = tmp_path_factory.mktemp('data') / 'movies.csv'
+    pd.DataFrame(MOVIES, columns=COLUMNS).to_csv(path, index=False)
+    return str(path)
+
+
+def test_dense_recommendations_exclude_seed(csv_path):
+    recommender = ContentRecommender(csv_path)
+    recommendations = recommender.get_recommendations('Alien', 3)
+
+    assert 'Alien' not in recommendations
+    assert recommendations[0] == 'Aliens'
+    assert len(recommendations) == 3
+
+
+def test_topk_mode_matches_dense(csv_path):
+    dense = ContentRecommender(csv_path)
+    topk = ContentRecommender(csv_path, mode='topk', top_k=5, block_size=3)
+
+    assert topk.cosine_sim is None
+    for title in dense.get_movie_titles():
+        for k in range(1, 6):
+            assert topk.get_recommendations(title, k) == dense.get_recommendations(title, k)
+
+
+def test_topk_mode_rejects_k_beyond_depth(csv_path):
+    recommender = ContentRecommender(csv_path, mode='topk', top_k=2)
+
+    with pytest.raises(ValueError):
+        recommender.get_recommendations('Alien', 3)
+
+
+def test_top_k_rows_breaks_ties_by_index():
+    block = np.array([[0.5, 0.9, 0.5, 0.5, 0.1]])
+    indices, scores = top_k_rows(block, 3)
+
+    assert indices.tolist() == [[1, 0, 2]]
+    assert scores.tolist() == [[0.9, 0.5, 0.5]]
+
+
+@pytest.mark.parametrize('mode', ['dense', 'topk'])
+def test_artifact_round_trip(csv_path, tmp_path, mode):
+    fitted = ContentRecommender(csv_path, mode=mode, top_k=5)
+    save_artifact(fitted, csv_path, tmp_path / 'artifact')
+    loaded = ContentRecommender.from_artifact(tmp_path / 'artifact', csv_path)
+
+    assert loaded.mode == mode
+    assert (loaded.tfidf_matrix != fitted.tfidf_matrix).nnz == 0
+    assert (loaded.vectorizer.transform(['alien marine']) != fitted.vectorizer.transform(['alien marine'])).nnz == 0
+    for title in fitted.get_movie_titles():
+        assert loaded.get_recommendations(title, 5) == fitted.get_recommendations(title, 5)
+
+    # The title index is memory-mapped from the artifact rather than rebuilt
+    assert isinstance(loaded.title_index.gram_rows, np.memmap) and isinstance(loaded.title_index.keys, np.memmap)
+    assert loaded.title_index.search('alien', 3) == fitted.title_index.search('alien', 3)
+    assert loaded.resolve_row('heat (1995)') == fitted.resolve_row('Heat') == 5
+    assert loaded.resolve_title('Interstelar') == 'Interstellar'
+
+
+def test_artifact_rejects_changed_catalog(csv_path, tmp_path):
+    save_artifact(ContentRecommender(csv_path), csv_path, tmp_path / 'artifact')
+    changed_path = tmp_path / 'changed.csv'
+    pd.DataFrame(MOVIES[:-1], columns=COLUMNS).to_csv(changed_path, index=False)
+
+    with pytest.raises(ArtifactMismatchError):
+        ContentRecommender.from_artifact(tmp_path / 'artifact', str(changed_path))
+
+
+def test_title_normalization():
+    assert normalize_title('Amélie') == 'amelie'
+    assert normalize_title("Pirates of the Caribbean: At World's End") == 'pirates of the caribbean at world s end'
+    assert split_year('Heat (1995)') == ('Heat', 1995)
+    assert split_year('2012') == ('2012', None)
+
+
+def test_title_index_prefers_matching_year():
+    index = TitleIndex(['Heat', 'The Heat', 'Heat'], [1986, 2013, 1995])
+
+    assert index.lookup('Heat') == 0
+    assert index.lookup('heat (1995)') == 2
+    assert index.lookup('Heat!') == 0
+    assert index.lookup('Cold') is None
+
+
+def test_resolve_title_handles_typos(csv_path):
+    recommender = ContentRecommender(csv_path)
+
+    assert recommender.resolve_title('the notebook') == 'The Notebook'
+    assert recommender.resolve_title('Interstelar') == 'Interstellar'
+    assert recommender.resolve_title('Completely Unknown') is None
+    assert recommender.suggest_titles('alien', 2) == ['Alien', 'Aliens']
+
+
+@pytest.mark.parametrize('mode', ['dense', 'topk'])
+def test_recommendations_follow_the_resolved_row(tmp_path, mode):
+    remake = (9, 'Alien', 'A love story on a sinking ship told from a notebook', 'Drama Romance', 'ship love memory',
+              6.1, 120, 5.0, '2020-02-14', "['Kate Winslet', 'Ryan Gosling', 'Billy Zane']", "['James Cameron']")
+    path = tmp_path / 'movies.csv'
+    pd.DataFrame(MOVIES + [remake], columns=COLUMNS).to_csv(path, index=False)
+    recommender = ContentRecommender(str(path), mode=mode, top_k=5)
+
+    row = recommender.resolve_row('Alien (2020)')
+    assert row == 8
+    assert recommender.get_recommendations(row, 2) == ['Titanic', 'The Notebook']
+    assert recommender.get_recommendations(recommender.resolve_row('Alien (1979)'), 1) == ['Aliens']
+    with pytest.raises(ValueError):
+        recommender.get_recommendations(len(MOVIES) + 1)
+
+
+@pytest.mark.parametrize('mode', ['dense', 'topk'])
+def test_recommendations_can_include_seed(csv_path, mode):
+    recommender = ContentRecommender(csv_path, mode=mode, top_k=5)
+
+    assert recommender.get_recommendations('Heat', 3, exclude_seed=False)[0] == 'Heat'
+    assert recommender.get_recommendations('Heat', 3, exclude_seed=False)[1:] == recommender.get_recommendations('Heat', 2)
+
+
+def test_recommend_batch(csv_path):
+    recommender = ContentRecommender(csv_path, mode='topk', top_k=5)
+    results = recommender.recommend_batch(
+        ['Heat', ['Alien', 'Aliens'], {'Titanic': 2.0, 'Avatar': 0.5}, 'Unknown Movie'], 3
+    )
+
+    assert results[0] == recommender.get_recommendations('Heat', 3)
+    assert 'Alien' not in results[1] and 'Aliens' not in results[1]
+    assert results[1][0] == 'Avatar'
+    assert results[2][0] == 'The Notebook'
+    assert results[3] == []
+
+
+def test_ann_mode_with_all_lists_probed_matches_dense(csv_path, tmp_path):
+    dense = ContentRecommender(csv_path)
+    ann = ContentRecommender(csv_path, mode='ann', ann_params={'n_components': 4, 'n_lists': 3, 'n_probe': 3})
+
+    for title in dense.get_movie_titles():
+        assert ann.get_recommendations(title, 3) == dense.get_recommendations(title, 3)
+
+    ann.ann_index.save(tmp_path / 'ann')
+    loaded = IVFIndex.load(tmp_path / 'ann', ann.tfidf_matrix)
+    query = ann.tfidf_matrix[0]
+    assert loaded.search(query, 3, exclude=0)[0].tolist() == ann.ann_index.search(query, 3, exclude=0)[0].tolist()
+    assert recall_report(loaded, ann.tfidf_matrix, k=3, n_queries=8, n_probes=(3,))[0]['recall'] == 1.0
+
+
+def test_ann_search_probes_more_lists_when_one_is_too_small(csv_path):
+    dense = ContentRecommender(csv_path)
+    ann = ContentRecommender(csv_path, mode='ann', ann_params={'n_components': 4, 'n_lists': 4, 'n_probe': 1})
+    assert np.diff(ann.ann_index.list_offsets).max() < 6
+
+    for title in dense.get_movie_titles():
+        assert ann.get_recommendations(title, 6) == dense.get_recommendations(title, 6)
+    ann.remove_movies([8])
+    assert len(ann.get_recommendations('Alien', 6)) == 6
+    assert len(ann.ann_index.search(ann.tfidf_matrix[0], 20, exclude=0)[0]) == len(MOVIES) - 1
+
+
+def test_blocked_kmeans_steps_match_dense():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((50, 6)).astype(np.float32)
+    centroids = vectors[:7]
+
+    assignments = nearest_centroids(vectors, centroids, block_size=8)
+    assert np.array_equal(assignments, np.argmax(vectors @ centroids.T, axis=1))
+    sums = np.zeros_like(centroids)
+    np.add.at(sums, assignments, vectors)
+    assert np.allclose(cluster_sums(vectors, assignments, len(centroids)), sums, atol=1e-5)
+
+
+def test_embedding_mode(csv_path, tmp_path):
+    recommender = ContentRecommender(csv_path, mode='embedding', n_components=4)
+
+    assert recommender.embeddings.dtype == np.float32
+    assert recommender.embeddings.shape == (len(MOVIES), 4)
+    assert np.allclose(np.linalg.norm(recommender.embeddings, axis=1), 1, atol=1e-5)
+    assert 'Alien' not in recommender.get_recommendations('Alien', 3)
+    assert recommender.recommend_batch(['Alien'], 3)[0] == recommender.get_recommendations('Alien', 3)
+
+    save_artifact(recommender, csv_path, tmp_path / 'artifact')
+    loaded = ContentRecommender.from_artifact(tmp_path / 'artifact', csv_path)
+    assert loaded.get_recommendations('Heat', 3) == recommender.get_recommendations('Heat', 3)
+
+
+@pytest.mark.parametrize('mode', ['dense', 'topk', 'embedding'])
+def test_add_and_remove_movies(csv_path, mode):
+    catalog = pd.DataFrame(MOVIES, columns=COLUMNS)
+    recommender = ContentRecommender(movies_df=catalog.iloc[:-1], mode=mode, top_k=5, n_components=4)
+    recommender.add_movies(catalog.iloc[-1:])
+
+    assert recommender.find_movie('Interstellar') == len(MOVIES) - 1
+    assert 'Interstellar' in recommender.get_recommendations('Alien', 5)
+
+    recommender.remove_movies([8])
+    assert recommender.find_movie('Interstellar') is None
+    assert 'Interstellar' not in recommender.get_recommendations('Alien', 5)
+    assert 'Interstellar' not in recommender.recommend_batch(['Alien'], 5)[0]
+    assert 'Interstellar' not in recommender.get_movie_titles()
+    if mode == 'topk':
+        dense = ContentRecommender(movies_df=catalog.iloc[:-1])
+        dense.add_movies(catalog.iloc[-1:])
+        dense.remove_movies([8])
+        for title in recommender.get_movie_titles():
+            assert recommender.get_recommendations(title, 5) == dense.get_recommendations(title, 5)
+
+
+def test_live_recommender_rebuilds_on_drift(csv_path):
+    catalog = pd.DataFrame(MOVIES, columns=COLUMNS)
+    live = LiveRecommender(ContentRecommender(movies_df=catalog.iloc[:4]), drift_threshold=0.1)
+    served = live.recommender
+
+    live.add_movies(catalog.iloc[4:])
+    assert live.rebuilding or live.recommender is not served
+    if live.rebuilding:
+        live.rebuild(wait=True)
+
+    assert live.recommender is not served
+    assert live.drift_report()['drift'] == 0
+    assert live.get_movie_titles() == catalog['title'].tolist()
+
+
+def test_sharded_topk_build_matches_single_process(csv_path):
+    single = ContentRecommender(csv_path, mode='topk', top_k=5)
+    sharded = ContentRecommender(csv_path, mode='topk', top_k=5, n_jobs=2)
+
+    assert np.array_equal(sharded.neighbors.indices, single.neighbors.indices)
+    assert np.array_equal(sharded.neighbors.scores, single.neighbors.scores)
+
+
+def test_attribute_index_mask():
+    index = AttributeIndex(pd.DataFrame(MOVIES, columns=COLUMNS))
+
+    assert parse_genres('Action Science Fiction TV Movie') == ['Action', 'Science Fiction', 'TV Movie']
+    assert np.flatnonzero(index.mask(genres=['science fiction'])).tolist() == [0, 1, 2, 7]
+    assert np.flatnonzero(index.mask(genres=['Science Fiction'], min_year=2000)).tolist() == [2, 7]
+    assert np.flatnonzero(index.mask(any_genres=['Romance', 'Crime'], min_rating=7.6)).tolist() == [4, 5]
+    assert np.flatnonzero(index.mask(exclude_genres=['Drama'], max_votes=4000)).tolist() == [1]
+    assert not index.mask(genres=['Western']).any()
+
+
+@pytest.mark.parametrize('mode', ['dense', 'topk', 'embedding'])
+def test_filtered_recommendations(csv_path, mode):
+    recommender = ContentRecommender(csv_path, mode=mode, top_k=2, n_components=4)
+    filters = {'genres': ['Drama'], 'min_year': 1995}
+
+    if mode != 'embedding':
+        assert recommender.get_recommendations('Alien', 3, filters=filters) == \
+            ContentRecommender(csv_path).get_recommendations('Alien', 3, filters=filters)
+    assert set(recommender.get_recommendations('Alien', 3, filters=filters)) <= {'Titanic', 'The Notebook', 'Heat', 'Collateral', 'Interstellar'}
+    assert 'Aliens' not in recommender.recommend_batch(['Alien'], 3, filters=filters)[0]
+
+
+@pytest.mark.parametrize('extension', ['.parquet', '.feather'])
+def test_columnar_catalog(csv_path, tmp_path, extension):
+    catalog_path = str(tmp_path / f'movies{extension}')
+    write_catalog(read_catalog(csv_path), catalog_path)
+
+    assert list(read_catalog(catalog_path)['crew'][0]) == ['Ridley Scott']
+    assert read_catalog(catalog_path, columns=['movie_id', 'title']).columns.tolist() == ['movie_id', 'title']
+
+    from_csv = ContentRecommender(csv_path, mode='topk', top_k=5)
+    columnar = ContentRecommender(catalog_path, mode='topk', top_k=5)
+    assert (columnar.tfidf_matrix != from_csv.tfidf_matrix).nnz == 0
+
+    save_artifact(columnar, catalog_path, tmp_path / 'artifact')
+    loaded = ContentRecommender.from_artifact(tmp_path / 'artifact', catalog_path)
+    assert loaded.movies_df.columns.tolist() == SERVING_COLUMNS
+    assert loaded.get_recommendations('Alien', 3) == from_csv.get_recommendations('Alien', 3)
+
+    loaded.add_movies(pd.DataFrame([(9, 'Prometheus', 'A crew finds an alien temple', 'Science Fiction', 'alien',
+                                     7.0, 5000, 80.0, '2012-05-30', ['Noomi Rapace'], ['Ridley Scott'])],
+                                   columns=COLUMNS))
+    catalog = loaded.catalog()
+    assert list(catalog['crew'].iloc[0]) == ['Ridley Scott'] and catalog['overview'].notna().all()
+    assert loaded.refit().get_movie_titles() == loaded.get_movie_titles()
+
+
+def test_live_updates_are_invisible_to_running_readers(csv_path):
+    catalog = pd.DataFrame(MOVIES, columns=COLUMNS)
+    live = LiveRecommender(ContentRecommender(movies_df=catalog, mode='topk', top_k=5), drift_threshold=10)
+    errors = []
+    stop = threading.Event()
+
+    def read():
+        while not stop.is_set():
+            try:
+                live.get_recommendations('Alien', 5)
+                live.get_recommendations('Heat', 3, filters={'genres': ['Drama']})
+            except Exception as e:
+                errors.append(e)
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    try:
+        for reader in readers:
+            reader.start()
+        for i in range(20):
+            added = catalog.assign(movie_id=catalog['movie_id'] + 100 * (i + 1), title=catalog['title'] + f' {i}')
+            live.add_movies(added)
+            live.remove_movies(added['movie_id'].iloc[:2])
+    finally:
+        stop.set()
+        for reader in readers:
+            reader.join()
+        sys.setswitchinterval(interval)
+
+    assert errors == []
+    assert len(live.get_movie_titles()) == len(MOVIES) * 21 - 40
+
+
+def test_resolve_and_recommend_keeps_rows_on_one_model(csv_path):
+    live = LiveRecommender(ContentRecommender(csv_path, mode='topk', top_k=5))
+    live.remove_movies([1])
+    served = live.recommender
+    refitted = served.refit(served.catalog())
+    resolve_row = served.resolve_row
+
+    def resolve_then_swap(title, *args):
+        row = resolve_row(title, *args)
+        # A background rebuild finishes between resolving and recommending
+        live.recommender = refitted
+        return row
+
+    served.resolve_row = resolve_then_swap
+    assert live.resolve_and_recommend('Heat', 2) == served.get_recommendations('Heat', 2)
+    assert refitted.resolve_row('Heat') != served.resolve_row('Heat')
+    assert live.resolve_and_recommend('Heat', 2) == refitted.get_recommendations('Heat', 2)
+    assert live.resolve_and_recommend('Completely Unknown') is None
@@ -0,0 +1,129 @@
+import pytest
+import pandas as pd
+import json
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.process_data import (convert, convert3, fetch_director, filter_columns, parse_json_columns,
+                              refresh_filtered_data, stream_filtered_data)
+from src.catalog_io import change_set_paths, read_catalog, read_change_set
+from src.content_recommender import ContentRecommender
+
+CAST = json.dumps([
+    {"cast_id": 1, "character": "Dr. \"Doc\" {Brown}", "credit_id": "a1", "gender": 2, "id": 1, "name": "Zoë Saldaña", "order": 0},
+    {"cast_id": 2, "character": "Ripley", "credit_id": "a2", "gender": 1, "id": 2, "name": "Sigourney Weaver", "order": 1},
+    {"cast_id": 3, "character": "Hudson", "credit_id": "a3", "gender": 2, "id": 3, "name": "Bill \"Game Over\" Paxton", "order": 2},
+    {"cast_id": 4, "character": "Bishop", "credit_id": "a4", "gender": 2, "id": 4, "name": "Lance Henriksen", "order": 3},
+])
+CREW = json.dumps([
+    {"credit_id": "b1", "department": "Directing", "gender": 2, "id": 5, "job": "Director", "name": "James Cameron"},
+    {"credit_id": "b2", "department": "Editing", "gender": 2, "id": 6, "job": "Editor", "name": "Ray {Lovejoy}"},
+    {"credit_id": "b3", "department": "Directing", "gender": 1, "id": 7, "job": "Assistant Director", "name": "Someone Else"},
+    {"credit_id": "b4", "department": "Directing", "gender": 1, "id": 8, "job": "Director", "name": "Agnès Varda"},
+])
+GENRES = json.dumps([{"id": 878, "name": "Science Fiction"}, {"id": 28, "name": "Action"}])
+
+
+def test_json_parsing_matches_literal_eval_semantics():
+    assert convert(GENRES) == 'Science Fiction Action'
+    assert convert3(CAST) == ['Zoë Saldaña', 'Sigourney Weaver', 'Bill "Game Over" Paxton']
+    assert fetch_director(CREW) == ['James Cameron', 'Agnès Varda']
+    assert convert3('[]') == [] and fetch_director('[]') == []
+
+
+def test_python_literal_blobs_still_parse():
+    crew = "[{'job': 'Director', 'name': \"Conan O'Brien\"}, {'job': 'Editor', 'name': 'Ed'}]"
+
+    assert fetch_director(crew) == ["Conan O'Brien"]
+    assert convert3(crew) == ["Conan O'Brien", 'Ed']
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_parse_json_columns(n_jobs):
+    df = pd.DataFrame({'genres': [GENRES] * 3, 'keywords': ['[]'] * 3, 'cast': [CAST] * 3, 'crew': [CREW] * 3})
+    parsed = parse_json_columns(df, n_jobs=n_jobs, chunk_size=2)
+
+    assert parsed['genres'] == ['Science Fiction Action'] * 3
+    assert parsed['keywords'] == [''] * 3
+    assert parsed['crew'] == [['James Cameron', 'Agnès Varda']] * 3
+
+
+def raw_dumps():
+    movies = pd.DataFrame({
+        'id': [1, 2, 3, 4, 5],
+        'title': ['Heat', 'Alien', 'Heat', 'No Overview', 'No Credits'],
+        'overview': ['a', 'b', 'c', None, 'e'],
+        'genres': [GENRES] * 5,
+        'keywords': ['[]'] * 5,
+        'vote_average': [7.0, 8.0, 6.0, 5.0, 4.0],
+        'vote_count': [10, 20, 30, 40, 50],
+        'popularity': [1.0, 2.0, 3.0, 4.0, 5.0],
+        'release_date': ['1995-12-15', '1979-05-25', '1986-01-01', '2000-01-01', '2001-01-01'],
+        'budget': [0] * 5,
+    })
+    credits = pd.DataFrame({
+        'movie_id': [3, 2, 1, 4],
+        'title': ['Heat', 'Alien', 'Heat', 'No Overview'],
+        'cast': [CAST, '[]', CAST, CAST],
+        'crew': [CREW, CREW, '[]', CREW],
+    })
+    return movies, credits
+
+
+def test_streaming_pipeline_joins_on_movie_id(tmp_path):
+    movies, credits = raw_dumps()
+    movies.to_csv(tmp_path / 'movies.csv', index=False)
+    credits.to_csv(tmp_path / 'credits.csv', index=False)
+    output = tmp_path / 'filtered.csv'
+
+    written = stream_filtered_data(str(tmp_path / 'movies.csv'), str(tmp_path / 'credits.csv'), str(output), chunksize=2)
+    streamed = pd.read_csv(output)
+
+    merged = movies.rename(columns={'id': 'movie_id'}).merge(credits.drop(columns='title'), on='movie_id')
+    expected = filter_columns(merged)
+    assert written == 3
+    assert streamed['movie_id'].tolist() == [1, 2, 3]
+    assert streamed['crew'].tolist() == [str(value) for value in expected['crew']]
+    assert streamed['cast'].tolist() == [str(value) for value in expected['cast']]
+    assert streamed['genres'].tolist() == expected['genres'].tolist()
+
+    parquet_path = str(tmp_path / 'filtered.parquet')
+    stream_filtered_data(str(tmp_path / 'movies.csv'), str(tmp_path / 'credits.csv'), parquet_path, chunksize=2)
+    columnar = read_catalog(parquet_path)
+    assert [list(crew) for crew in columnar['crew']] == list(expected['crew'])
+    assert columnar['vote_count'].dtype == 'int64'
+
+
+def test_incremental_refresh_emits_change_set(tmp_path):
+    movies, credits = raw_dumps()
+    movies_path, credits_path = str(tmp_path / 'movies.csv'), str(tmp_path / 'credits.csv')
+    output = str(tmp_path / 'filtered.parquet')
+    movies.to_csv(movies_path, index=False)
+    credits.to_csv(credits_path, index=False)
+
+    first = refresh_filtered_data(movies_path, credits_path, output, chunksize=2)
+    assert first['added'] == [1, 2, 3] and first['updated'] == [] and first['removed'] == []
+    assert refresh_filtered_data(movies_path, credits_path, output, chunksize=2)['added'] == []
+    recommender = ContentRecommender(output)
+
+    movies.loc[movies['id'] == 2, 'overview'] = 'changed'
+    movies.loc[movies['id'] == 4, 'overview'] = 'now complete'
+    credits.loc[credits['movie_id'] == 3, 'crew'] = '[]'
+    movies[movies['id'] != 1].to_csv(movies_path, index=False)
+    credits.to_csv(credits_path, index=False)
+
+    summary = refresh_filtered_data(movies_path, credits_path, output, chunksize=2)
+    assert summary['added'] == [4] and summary['updated'] == [2, 3] and summary['removed'] == [1]
+
+    refreshed = read_catalog(output)
+    full_path = str(tmp_path / 'full.parquet')
+    stream_filtered_data(movies_path, credits_path, full_path, chunksize=2)
+    full = read_catalog(full_path).sort_values('movie_id').reset_index(drop=True)
+    assert refreshed['movie_id'].tolist() == [2, 3, 4]
+    assert refreshed.sort_values('movie_id').reset_index(drop=True).astype(str).equals(full.astype(str))
+
+    summary, upserts = read_change_set(change_set_paths(output)[1])
+    assert upserts['movie_id'].tolist() == [2, 3, 4]
+    recommender.apply_changes(upserts, summary['removed'])
+    assert recommender.catalog()['movie_id'].tolist() == refreshed['movie_id'].tolist()